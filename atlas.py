@@ -0,0 +1,109 @@
+"""Procedural sprites packed into one cached atlas surface.
+
+Every sprite variant is generated once, packed into a single surface and
+handed out as a subsurface of it, so blitting a sprite reads straight from
+its atlas region and equal variants are the same surface:
+
+    atlas = SpriteAtlas({"eye_open": (create_eye_sprite, ("open",)), ...}, cache_dir)
+    img = atlas["eye_open"]          # subsurface of atlas.surface
+
+The packed pixels and region index are saved in cache_dir under a key
+hashed from each generator's code, its arguments and the constants
+it reads, so editing a generator rebuilds the atlas and a warm start skips
+generation entirely, while a pygame upgrade that draws differently
+rebuilds it. Nothing is built until the first sprite is asked for.
+"""
+import hashlib
+import os
+import sys
+import types
+
+import numpy as np
+import pygame
+
+ATLAS_WIDTH = 256   # Packing width in pixels; rows grow downwards as needed
+ATLAS_VERSION = 1   # Bump to invalidate cached atlases after a format change
+
+def hash_code(h, code):
+    # Bytecode, constants and names rather than source text: reading the
+    # source means tokenizing the whole file, which costs more than most
+    # generators take to run
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            hash_code(h, const)
+        else:
+            h.update(repr(const).encode())
+
+def generator_key(sprites):
+    """Hash of what the sprites' pixels depend on"""
+    h = hashlib.sha1(repr((ATLAS_VERSION, ATLAS_WIDTH, sys.version_info[:2], pygame.version.ver)).encode())
+    for name, (generator, args) in sorted(sprites.items()):
+        h.update(repr((name, generator.__qualname__, args)).encode())
+        hash_code(h, generator.__code__)
+        # Plain constants the generator reads, e.g. color tuples
+        for ref in generator.__code__.co_names:
+            value = generator.__globals__.get(ref)
+            if isinstance(value, (int, float, str, tuple)):
+                h.update(repr((ref, value)).encode())
+    return h.hexdigest()[:16]
+
+class SpriteAtlas:
+    """Named sprites as regions of one surface, built lazily and cached on disk"""
+    def __init__(self, sprites, cache_dir=None, width=ATLAS_WIDTH):
+        self.sprites = dict(sprites)  # Name -> (generator, args)
+        self.cache_dir = cache_dir
+        self.width = width
+        self.surface = None
+        self.rects = {}      # Name -> pygame.Rect in surface
+        self.regions = {}    # Name -> subsurface
+        self.generated = 0   # Sprites drawn by their generators (0 on a warm start)
+
+    def __getitem__(self, name):
+        if self.surface is None:
+            self.build()
+        return self.regions[name]
+
+    def build(self):
+        key = generator_key(self.sprites)
+        path = os.path.join(self.cache_dir, "atlas-%s.npz" % key) if self.cache_dir else None
+        if path and os.path.exists(path):
+            with np.load(path) as data:
+                pixels, names, rects = data['pixels'], data['names'].tolist(), data['rects'].tolist()
+            surface = pygame.image.frombuffer(pixels.tobytes(), (pixels.shape[1], pixels.shape[0]), "RGBA")
+        else:
+            surface, names, rects = self.pack()
+            if path:
+                pixels = np.frombuffer(pygame.image.tobytes(surface, "RGBA"), np.uint8)
+                os.makedirs(self.cache_dir, exist_ok=True)
+                # Written aside and moved into place, so a concurrent run
+                # never loads a half-written atlas
+                tmp = "%s.%d.tmp" % (path, os.getpid())
+                with open(tmp, 'wb') as f:
+                    np.savez(f, pixels=pixels.reshape(surface.get_height(), surface.get_width(), 4),
+                             names=np.array(names), rects=np.array(rects))
+                os.replace(tmp, path)
+        # Match the display's pixel format once, so blits need no conversion
+        self.surface = surface.convert_alpha() if pygame.display.get_surface() else surface.copy()
+        self.rects = {name: pygame.Rect(rect) for name, rect in zip(names, rects)}
+        self.regions = {name: self.surface.subsurface(rect) for name, rect in self.rects.items()}
+
+    def pack(self):
+        """Generate every sprite and shelf-pack them, tallest first"""
+        images = {name: generator(*args) for name, (generator, args) in self.sprites.items()}
+        self.generated += len(images)
+        names = sorted(images, key=lambda name: (-images[name].get_height(), name))
+        rects, x, y, shelf = [], 0, 0, 0
+        for name in names:
+            w, h = images[name].get_size()
+            if x + w > self.width and x > 0:
+                x, y, shelf = 0, y + shelf, 0
+            rects.append((x, y, w, h))
+            x, shelf = x + w, max(shelf, h)
+        surface = pygame.Surface((max(self.width, max(r[2] for r in rects)), y + shelf), pygame.SRCALPHA)
+        for name, rect in zip(names, rects):
+            # Adding onto the cleared atlas copies pixels exactly; a plain
+            # blit would alpha-blend them
+            surface.blit(images[name], rect[:2], special_flags=pygame.BLEND_RGBA_ADD)
+        return surface, names, rects
@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+"""Headless benchmark runner for the three games.
+
+Each scenario runs in its own process under SDL's dummy video driver. The
+pygame clock is replaced with one that never sleeps, and keyboard/mouse
+state comes from a per-frame script instead of the real devices, so every
+run does the same work as fast as the machine allows.
+
+    python bench.py                          # run everything, print a table
+    python bench.py -s castle_walk -n 600    # one scenario, 600 frames
+    python bench.py -o run.json              # write machine-readable results
+    python bench.py --save-baseline base.json
+    python bench.py --baseline base.json     # flag regressions, exit 1 if any
+    python bench.py --raster                 # painter vs z-buffer at 1k/10k/100k triangles
+    python bench.py --tiles -w 16            # tiled rendering scaling, 1 to 16 workers
+    python bench.py --collide                # platformer collision cost vs platform count
+    python bench.py --startup                # hackerpy time to first frame, by stage
+    python bench.py -r walk.npz              # replay a recorded session as a scenario
+
+A recording comes from playing any of the games with MARIO_RECORD=walk.npz
+set. Replaying it feeds back the recorded input and frame times through
+the game's own input code (see inputlog.py) instead of a script, so real
+play sessions can be compared build to build like the scripted scenarios.
+"""
+import argparse
+import importlib.util
+import json
+import math
+import os
+import platform
+import resource
+import runpy
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WARMUP_FRAMES = 10
+DEFAULT_FRAMES = 300
+DEFAULT_THRESHOLD = 0.10  # Relative slowdown that counts as a regression
+NOMINAL_FPS = 60          # Frame time reported by Clock.tick() for uncapped loops
+RASTER_COUNTS = (1000, 10000, 100000)
+RASTER_FRAMES = 5         # Frames per backend and triangle count in --raster mode
+TILE_TRIANGLES = 10000    # Synthetic scene size for --tiles
+COLLIDE_COUNTS = (100, 1000, 10000, 100000)
+COLLIDE_BODIES = 1000     # Moving bodies per frame in --collide mode
+COLLIDE_FRAMES = 20
+STARTUP_RUNS = 5          # Fresh processes per --startup measurement
+
+# --- SCRIPTED INPUT ---
+# A script maps a frame number to (held keys, mouse pos, mouse buttons, key presses).
+
+def menu_drag(frame, pg):
+    # Circle the cursor over the face with the left button held
+    x = 400 + int(math.cos(frame * 0.05) * 120)
+    y = 300 + int(math.sin(frame * 0.05) * 90)
+    return set(), (x, y), (True, False, False), []
+
+def demo_orbit(frame, pg):
+    return set(), (0, 0), (False, False, False), [pg.K_SPACE] if frame == 0 else []
+
+def castle_title(frame, pg):
+    x = 400 + int(math.cos(frame * 0.02) * 300)
+    y = 300 + int(math.sin(frame * 0.03) * 200)
+    return set(), (x, y), (False, False, False), []
+
+def castle_walk(frame, pg):
+    held = {pg.K_w}
+    if (frame // 60) % 3 == 1:
+        held.add(pg.K_a)
+    if (frame // 90) % 2 == 0:
+        held.add(pg.K_LEFT)
+    return held, (400, 300), (False, False, False), [pg.K_RETURN] if frame == 0 else []
+
+def title_idle(frame, pg):
+    # Nobody at the kiosk: the title screen animates on its own
+    return set(), (0, 0), (False, False, False), []
+
+def platformer(frame, pg):
+    held = {pg.K_RIGHT} if (frame // 120) % 2 == 0 else {pg.K_LEFT}
+    presses = [pg.K_SPACE] if frame % 40 == 0 else []  # Frame 0 leaves the title
+    return held, (0, 0), (False, False, False), presses
+
+SCENARIOS = {
+    'menu_drag': ('build251125.py', menu_drag),
+    'demo_orbit': ('build251125.py', demo_orbit),
+    'castle_title': ('v1.0.py', castle_title),
+    'castle_walk': ('v1.0.py', castle_walk),
+    'title_idle': ('hackerpy.py', title_idle),
+    'platformer': ('hackerpy.py', platformer),
+}
+
+# --- HARNESS (runs inside the child process) ---
+
+class KeyState:
+    def __init__(self, held):
+        self.held = held
+
+    def __getitem__(self, key):
+        return key in self.held
+
+class Harness:
+    """Drives a game's own main loop through patched pygame entry points"""
+    def __init__(self, pg, script, frames):
+        self.pg = pg
+        self.script = script
+        self.frames = frames
+        self.frame = 0
+        self.input = script(0, pg) if script else None  # None: the game reads a recording
+        self.flips = []
+
+    def install(self):
+        pg = self.pg
+        harness = self
+        self.time_presents()
+
+        class Clock:
+            def __init__(self):
+                self.fps = 0
+
+            # Report exactly one nominal frame per tick so fixed-timestep
+            # games run the same number of simulation ticks on every machine
+            def tick(self, framerate=0):
+                harness.advance()
+                self.fps = framerate or NOMINAL_FPS
+                return 1000 / self.fps
+
+            def get_time(self):
+                return 1000 / self.fps if self.fps else 0
+
+            def get_fps(self):
+                return float(self.fps)
+
+        pg.time.Clock = Clock
+        pg.key.get_pressed = lambda: KeyState(self.input[0])
+        pg.mouse.get_pos = lambda: self.input[1]
+        pg.mouse.get_pressed = lambda num_buttons=3: self.input[2]
+
+    def time_presents(self):
+        pg, flips = self.pg, self.flips
+        flip, update = pg.display.flip, pg.display.update
+
+        def timed_flip():
+            flip()
+            flips.append(time.perf_counter())
+
+        def timed_update(*args):
+            update(*args)
+            flips.append(time.perf_counter())
+
+        pg.display.flip = timed_flip
+        pg.display.update = timed_update
+
+    def advance(self):
+        # Called from Clock.tick: queue up the next frame's input
+        pg = self.pg
+        if self.frame >= self.frames:
+            pg.event.post(pg.event.Event(pg.QUIT))
+            return
+        self.input = self.script(self.frame, pg)
+        for key in self.input[3]:
+            pg.event.post(pg.event.Event(pg.KEYDOWN, key=key, mod=0, unicode='', scancode=0))
+        self.frame += 1
+
+def run_child(name, frames, replay=None):
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+    # Full quality unless asked otherwise: the adaptive controller would
+    # trade detail for speed and hide the regressions this is looking for
+    os.environ.setdefault('MARIO_QUALITY', '0')
+    import pygame
+    sys.path.insert(0, HERE)
+
+    if replay:
+        # The game reads the recording itself and never sleeps on it; only
+        # presents need timing
+        from inputlog import REPLAY_ENV
+        import numpy as np
+        with np.load(replay) as data:
+            path = str(data['game'])
+        os.environ[REPLAY_ENV] = replay
+        harness = Harness(pygame, None, 0)
+        harness.time_presents()
+    else:
+        path, script = SCENARIOS[name]
+        harness = Harness(pygame, script, frames + WARMUP_FRAMES)
+        harness.install()
+    try:
+        runpy.run_path(os.path.join(HERE, path), run_name='__main__')
+    except SystemExit:
+        pass
+
+    stamps = harness.flips[WARMUP_FRAMES:]
+    times = sorted((b - a) * 1000 for a, b in zip(stamps, stamps[1:]))
+    if not times:
+        raise SystemExit('%s: game exited before producing frames' % name)
+    total = sum(times)
+    return {
+        'scenario': name,
+        'game': path,
+        'frames': len(times),
+        'fps': len(times) / total * 1000,
+        'mean_ms': total / len(times),
+        'p95_ms': percentile(times, 95),
+        'p99_ms': percentile(times, 99),
+        'max_ms': times[-1],
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+def percentile(ordered, pct):
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+# --- RASTER COMPARISON ---
+
+def load_castle():
+    # v1.0.py is not an importable module name
+    spec = importlib.util.spec_from_file_location('castle', os.path.join(HERE, 'v1.0.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, HERE)
+    spec.loader.exec_module(module)
+    return module
+
+def raster_scene(game, queue, count, seed=0):
+    """Random triangles whose total screen coverage stays about the same at any count"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    size = 0.75 * math.sqrt(1000 / count)
+    centers = rng.uniform((-4, -3, -2), (4, 3, 4), (count, 1, 3))
+    verts = (centers + rng.uniform(-size, size, (count, 3, 3))).reshape(-1, 3)
+    palette = np.array([game.materials.id(c) for c in (game.RED, game.SKIN, game.BLUE, game.GREEN)])
+    queue.clear()
+    queue.add_polygons(verts, np.full(count, 3), centers[:, 0, 2], palette[rng.integers(0, 4, count)])
+
+def run_raster(frames):
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    import pygame
+    game = load_castle()
+    pygame.init()
+    screen = pygame.display.set_mode((game.WIDTH, game.HEIGHT))
+    queue = game.RenderQueue()
+    results = []
+    for count in RASTER_COUNTS:
+        raster_scene(game, queue, count)
+        row = {'triangles': count}
+        for backend in ('painter', 'zbuffer'):
+            row[backend + '_ms'] = time_frames(lambda: game.render_scene(screen, queue, backend=backend), frames)
+        results.append(row)
+    pygame.quit()
+    return results
+
+def time_frames(draw, frames):
+    times = []
+    for _ in range(frames + 1):  # The first frame warms caches and is dropped
+        start = time.perf_counter()
+        draw()
+        times.append((time.perf_counter() - start) * 1000)
+    return sorted(times[1:])[len(times[1:]) // 2]
+
+def run_tiles(frames, max_workers):
+    """Median frame time of the tiled renderers at 1..max_workers workers"""
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    import pygame
+    from tiles import TilePool
+    game = load_castle()
+    pygame.init()
+    screen = pygame.display.set_mode((game.WIDTH, game.HEIGHT))
+    queue = game.RenderQueue()
+    raster_scene(game, queue, TILE_TRIANGLES)
+    cases = {
+        'zbuffer %dk' % (TILE_TRIANGLES // 1000): lambda tiles: game.render_scene_zbuffer(screen, queue, tiles=tiles),
+    }
+    results = []
+    for name, draw in cases.items():
+        serial = time_frames(lambda: draw(None), frames)
+        for workers in range(1, max_workers + 1):
+            pool = TilePool(game.WIDTH, game.HEIGHT, workers)
+            results.append({'case': name, 'workers': workers, 'serial_ms': serial,
+                            'ms': time_frames(lambda: draw(pool), frames)})
+            pool.close()
+    pygame.quit()
+    for r in results:
+        one = next(o['ms'] for o in results if o['case'] == r['case'] and o['workers'] == 1)
+        r['speedup'] = one / r['ms']
+        r['efficiency'] = r['speedup'] / r['workers']
+        r['vs_serial'] = r['serial_ms'] / r['ms']  # Below 1: tiling loses to the serial renderer
+    return results
+
+# --- COLLISION SCALING ---
+
+def collide_level(count, seed=0):
+    """Platforms as dense as hackerpy's level, however many there are"""
+    import numpy as np
+    from platforms import PlatformLevel
+    rng = np.random.default_rng(seed)
+    x = rng.integers(0, count * 150, count)
+    y = rng.integers(100, 500, count)
+    return PlatformLevel(zip(x.tolist(), y.tolist(), [100] * count, [20] * count))
+
+def scan_landings(level, x, y, vy, half_width, height):
+    """Reference without the broadphase: every body against every platform"""
+    import numpy as np
+    hits = np.full(len(x), -1)
+    chunk = max(1, (1 << 22) // max(1, len(level)))
+    for start in range(0, len(x), chunk):
+        bx, by = x[start:start + chunk, None], y[start:start + chunk, None]
+        ok = ((level.x - half_width < bx) & (bx < level.x + level.w + half_width)
+              & (level.y - height < by) & (by < level.y) & (vy[start:start + chunk, None] > 0))
+        hits[start:start + chunk] = np.where(ok.any(axis=1), ok.argmax(axis=1), -1)
+    return hits
+
+def run_collide(frames):
+    """Per-frame collision cost of falling bodies at each platform count"""
+    import numpy as np
+    results = []
+    for count in COLLIDE_COUNTS:
+        level = collide_level(count)
+        rng = np.random.default_rng(1)
+        x = rng.uniform(0, count * 150, COLLIDE_BODIES)
+        y = rng.uniform(0, 600, COLLIDE_BODIES)
+        vy = rng.uniform(0, 10, COLLIDE_BODIES)
+
+        def step():
+            # Fall, land, and drop back in from the top after leaving the screen
+            vy[:] += 0.8
+            y[:] += vy
+            hits = level.land_many(x, y, vy, 20, 40)
+            landed = hits >= 0
+            y[landed] = level.y[hits[landed]] - 40
+            vy[landed] = 0
+            vy[y > 600] = 0
+            y[y > 600] = 0
+            return hits
+
+        before = level.candidates, level.queries
+        row = {'platforms': count, 'bodies': COLLIDE_BODIES, 'grid_ms': time_frames(step, frames)}
+        row['candidates'] = (level.candidates - before[0]) / max(1, level.queries - before[1])
+        # The broadphase must agree with a full scan, and beat it
+        assert (level.land_many(x, y, vy + 1, 20, 40) == scan_landings(level, x, y, vy + 1, 20, 40)).all()
+        row['scan_ms'] = time_frames(lambda: scan_landings(level, x, y, vy + 1, 20, 40), min(frames, 3))
+        # One body the way hackerpy asks, per platform count
+        row['single_us'] = 1000 * time_frames(lambda: [level.land(x[i], y[i], 1, 20, 40) for i in range(100)],
+                                              frames) / 100
+        results.append(row)
+    return results
+
+def print_collide_table(results):
+    print('%10s %7s %9s %9s %8s %11s %12s' % ('platforms', 'bodies', 'scan ms', 'grid ms', 'speedup',
+                                               'tests/body', 'one body us'))
+    for r in results:
+        print('%10d %7d %9.2f %9.2f %7.1fx %11.1f %12.1f' % (
+            r['platforms'], r['bodies'], r['scan_ms'], r['grid_ms'], r['scan_ms'] / r['grid_ms'],
+            r['candidates'], r['single_us']))
+
+def print_tiles_table(results):
+    print('%-12s %7s %10s %8s %8s %10s %10s' % ('case', 'workers', 'serial ms', 'ms', 'speedup', 'efficiency',
+                                                 'vs serial'))
+    for r in results:
+        print('%-12s %7d %10.2f %8.2f %7.2fx %9.0f%% %9.2fx' % (
+            r['case'], r['workers'], r['serial_ms'], r['ms'], r['speedup'], r['efficiency'] * 100, r['vs_serial']))
+
+def print_raster_table(results):
+    print('%10s %11s %11s %8s' % ('triangles', 'painter ms', 'zbuffer ms', 'ratio'))
+    for r in results:
+        print('%10d %11.2f %11.2f %7.2fx' % (
+            r['triangles'], r['painter_ms'], r['zbuffer_ms'], r['painter_ms'] / r['zbuffer_ms']))
+
+# --- STARTUP ---
+
+def run_startup(runs):
+    """Median hackerpy startup stages over fresh processes.
+
+    Every run re-imports pygame and re-opens the display; only the OS file
+    cache carries over. 'process' is the wall time of the whole child,
+    interpreter start and exit included.
+    """
+    env = dict(os.environ, SDL_VIDEODRIVER='dummy', SDL_AUDIODRIVER='dummy', PYGAME_HIDE_SUPPORT_PROMPT='1')
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, os.path.join(HERE, 'hackerpy.py'), '--startup'],
+                              capture_output=True, text=True, env=env)
+        wall = (time.perf_counter() - start) * 1000
+        if proc.returncode != 0:
+            raise RuntimeError('hackerpy --startup failed:\n%s' % proc.stderr.strip())
+        stages = {}
+        for line in proc.stdout.strip().splitlines():
+            stage, ms, _ = line.rsplit(None, 2)
+            stages[stage] = float(ms)
+        stages['process'] = wall
+        samples.append(stages)
+    return [{'stage': stage, 'ms': sorted(s[stage] for s in samples)[runs // 2]} for stage in samples[0]]
+
+def print_startup_table(results):
+    print('%-12s %9s' % ('stage', 'ms'))
+    for r in results:
+        print('%-12s %9.1f' % (r['stage'], r['ms']))
+
+# --- DRIVER ---
+
+def replay_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+def run_scenario(name, frames, replay=None):
+    command = [sys.executable, os.path.abspath(__file__), '--child', name, '-n', str(frames)]
+    if replay:
+        command += ['--child-replay', os.path.abspath(replay)]
+    proc = subprocess.run(command, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError('%s failed:\n%s' % (name, proc.stderr.strip()))
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def compare(results, baseline, threshold):
+    """Return human-readable regressions of results against a baseline run"""
+    old = {r['scenario']: r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        base = old.get(r['scenario'])
+        if base is None:
+            continue
+        for key in ('mean_ms', 'p95_ms', 'p99_ms', 'peak_rss_kb'):
+            if base[key] > 0 and r[key] > base[key] * (1 + threshold):
+                regressions.append('%s: %s %.2f -> %.2f (+%.0f%%)' % (
+                    r['scenario'], key, base[key], r[key], (r[key] / base[key] - 1) * 100))
+    return regressions
+
+def print_table(results):
+    print('%-14s %8s %9s %9s %9s %11s' % ('scenario', 'fps', 'mean ms', 'p95 ms', 'p99 ms', 'peak MB'))
+    for r in results:
+        print('%-14s %8.1f %9.2f %9.2f %9.2f %11.1f' % (
+            r['scenario'], r['fps'], r['mean_ms'], r['p95_ms'], r['p99_ms'], r['peak_rss_kb'] / 1024))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run (repeatable, default: all)')
+    parser.add_argument('-r', '--replay', action='append', default=[],
+                        help='replay a MARIO_RECORD input log as a scenario named after the file (repeatable)')
+    parser.add_argument('-n', '--frames', type=int, default=DEFAULT_FRAMES,
+                        help='measured frames per scenario; a replay runs its whole recording')
+    parser.add_argument('-o', '--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against a stored results file')
+    parser.add_argument('--save-baseline', help='store these results as a baseline file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='relative increase that counts as a regression (default 0.10)')
+    parser.add_argument('--raster', action='store_true',
+                        help='time painter vs z-buffer rendering of synthetic triangle scenes')
+    parser.add_argument('--tiles', action='store_true',
+                        help='report tiled rendering time and scaling efficiency for 1..N workers, '
+                             'and each case against its serial renderer')
+    parser.add_argument('--collide', action='store_true',
+                        help='time platform collisions against platform count instead of the games')
+    parser.add_argument('--startup', action='store_true',
+                        help='time hackerpy startup stages over fresh processes instead of the games')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='largest worker count for --tiles (default: CPU count)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--child-replay', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.raster or args.tiles or args.collide or args.startup:
+        if args.raster:
+            results = {'raster': run_raster(min(args.frames, RASTER_FRAMES))}
+            print_raster_table(results['raster'])
+        elif args.collide:
+            results = {'collide': run_collide(min(args.frames, COLLIDE_FRAMES))}
+            print_collide_table(results['collide'])
+        elif args.startup:
+            results = {'startup': run_startup(STARTUP_RUNS)}
+            print_startup_table(results['startup'])
+        else:
+            results = {'tiles': run_tiles(min(args.frames, RASTER_FRAMES), args.workers)}
+            print_tiles_table(results['tiles'])
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(dict(created=time.strftime('%Y-%m-%dT%H:%M:%S'), cpus=os.cpu_count(), **results), f, indent=2)
+        return 0
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.frames, args.child_replay)))
+        return 0
+
+    os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+    import pygame
+    names = args.scenario or ([] if args.replay else SCENARIOS)
+    results = [run_scenario(name, args.frames) for name in names]
+    results += [run_scenario(replay_name(path), args.frames, path) for path in args.replay]
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'machine': platform.platform(),
+        'frames': args.frames,
+        'results': results,
+    }
+    print_table(results)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print('REGRESSION ' + line)
+        if regressions:
+            return 1
+        print('no regressions against %s' % args.baseline)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
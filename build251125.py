@@ -2,13 +2,31 @@
 import pygame
 import math
 import sys
+import numpy as np
+from profiler import FrameProfiler
+from textcache import text_cache
+from inputlog import InputLog
+from scenegraph import SceneNode, transform_matrix
+from lod import LodLevels
+from depthsort import DepthSorter
+from timestep import FixedTimestep, lerp, run_simulation, sim_ticks_from_argv
 
 # --- CONFIGURATION ---
 WIDTH, HEIGHT = 800, 600
-FPS = 60
+FPS = 60           # Render frame cap; 0 renders as fast as the machine allows
+SIM_HZ = 60        # Simulation ticks per second
 FOV = 400
 VIEW_DIST = 4
 SENSITIVITY = 0.01
+FACE_LODS = (500, 100, 50, 20)     # Fibonacci-sphere points per face detail level, finest first
+FACE_LOD_PIXELS = (250, 100, 40)   # Projected face radius from which each finer level is used
+FACE_BASE_LEVEL = 1                # The original face. The title face (166 px) uses it;
+                                   # MARIO_LOD_BIAS=1.6 or more picks the dense level
+SPRING_K = 0.1     # Spring constant pulling face vertices back to shape
+SPRING_D = 0.85    # Velocity damping per tick
+GRAB_RADIUS = 50   # Pixels from the cursor a face vertex can be grabbed
+
+prof = FrameProfiler.from_env()
 
 # --- COLORS ---
 BLACK = (0, 0, 0)
@@ -42,269 +60,405 @@ def project(x, y, z, width, height, scale=FOV, distance=VIEW_DIST):
 
 # --- CLASSES ---
 
-class Vertex:
-    def __init__(self, x, y, z, color):
-        self.x = x
-        self.y = y
-        self.z = z
-        self.base_x = x
-        self.base_y = y
-        self.base_z = z
-        self.color = color
-        self.vx = 0
-        self.vy = 0
-        self.vz = 0
+class PickGrid:
+    """Uniform screen-space grid over projected points, one cell per grab radius"""
+    def __init__(self, px, py, width, height, cell=GRAB_RADIUS):
+        self.px, self.py, self.cell = px, py, cell
+        # One border ring of cells so points just off-screen can still be picked
+        self.cols = width // cell + 3
+        self.rows = height // cell + 3
+        cx = px // cell + 1
+        cy = py // cell + 1
+        inside = (cx >= 0) & (cx < self.cols) & (cy >= 0) & (cy < self.rows)
+        ids = np.flatnonzero(inside)
+        # Keys that fit 16 bits get NumPy's linear-time radix sort for the
+        # stable sort; bigger grids fall back to a merge sort
+        key_type = np.int16 if self.cols * self.rows <= np.iinfo(np.int16).max else np.intp
+        cells = (cx[ids] * self.rows + cy[ids]).astype(key_type)
+        self.order = ids[np.argsort(cells, kind='stable')]
+        counts = np.bincount(cells, minlength=self.cols * self.rows)
+        self.starts = np.concatenate(([0], np.cumsum(counts))).tolist()
 
-    def update_elastic(self):
-        # Spring physics to return to base shape
-        k = 0.1   # Spring constant
-        d = 0.85  # Damping
-        
-        ax = (self.base_x - self.x) * k
-        ay = (self.base_y - self.y) * k
-        az = (self.base_z - self.z) * k
-        
-        self.vx += ax
-        self.vy += ay
-        self.vz += az
+    def nearest(self, x, y, radius):
+        """Index of the point closest to (x, y) strictly within radius, or None"""
+        cx, cy = x // self.cell + 1, y // self.cell + 1
+        chunks = []
+        for i in range(max(cx - 1, 0), min(cx + 2, self.cols)):
+            base = i * self.rows
+            lo = self.starts[base + max(cy - 1, 0)]
+            hi = self.starts[base + min(cy + 2, self.rows)]
+            if hi > lo:
+                chunks.append(self.order[lo:hi])
+        if not chunks:
+            return None
+        cand = np.sort(np.concatenate(chunks))  # Ties go to the lowest index
+        dist = np.hypot(self.px[cand] - x, self.py[cand] - y)
+        best = int(np.argmin(dist))
+        if dist[best] < radius:
+            return int(cand[best])
+        return None
+
+def face_sphere(point_count):
+    """Fibonacci-sphere face points and their colors"""
+    points = []
+    colors = []
+    # Generate Geometry (Low Poly Sphere approximation)
+    # Face (Skin)
+    for i in range(point_count):
+        theta = math.acos(1 - 2 * (i + 0.5) / point_count)
+        phi = math.pi * (1 + 5**0.5) * (i + 0.5)
+        r = 1.0
+        x = r * math.sin(theta) * math.cos(phi)
+        y = r * math.sin(theta) * math.sin(phi)
+        z = r * math.cos(theta)
         
-        self.vx *= d
-        self.vy *= d
-        self.vz *= d
+        # Color logic based on position
+        col = SKIN
+        if y > 0.4 and z > 0: col = RED # Hat
+        elif z > 0.8 and y < 0.2: col = SKIN # Nose area
         
-        self.x += self.vx
-        self.y += self.vy
-        self.z += self.vz
+        # Nose bump
+        if z > 0.8 and y < 0:
+            z += 0.3
+            
+        points.append((x, y, z))
+        colors.append(col)
+    return np.array(points, dtype=float), colors
+
+def face_features():
+    """Brim and mustache points shared by every detail level, and their colors"""
+    points = []
+    colors = []
+    # Hat Brim
+    for i in range(20):
+        angle = (i / 20) * math.pi * 2
+        x = math.cos(angle) * 1.2
+        z = math.sin(angle) * 1.2 + 0.2
+        y = 0.4
+        if z > 0: # Only front brim
+             points.append((x, y, z))
+             colors.append(RED)
+
+    # Mustache
+    points.append((-0.5, -0.2, 0.9)); colors.append(BLACK)
+    points.append((0.5, -0.2, 0.9)); colors.append(BLACK)
+    points.append((0, -0.1, 1.1)); colors.append(SKIN) # Nose tip
+    return np.array(points, dtype=float), colors
+
+def nearest_points(points, targets):
+    """Index of the target nearest each point"""
+    # By |t|^2 - 2 p.t, a block of points at a time
+    return np.concatenate([((targets * targets).sum(axis=1) - 2 * block @ targets.T).argmin(axis=1)
+                           for block in np.array_split(points, max(1, len(points) // 64))])
 
 class MarioFace:
-    def __init__(self):
-        self.vertices = []
+    """Elastic face stored as struct-of-arrays: one (N,3) row per vertex.
+
+    The base level is the original face and comes first in the arrays.
+    Coarser levels are subsets of it, their sphere points snapped to the
+    nearest base ones; each finer level keeps every vertex of the next
+    coarser one and adds the rest of its own sphere. A dent in a vertex two
+    levels share survives switching between them. Only the level drawn
+    last is simulated, and vertices that leave it on a switch settle at
+    rest in their base shape.
+    """
+    def __init__(self, point_counts=FACE_LODS, lod_pixels=FACE_LOD_PIXELS, base_level=FACE_BASE_LEVEL):
         self.rotation_y = 0
+        self.prev_rotation_y = 0
         self.dragging_point = None
-        
-        # Generate Geometry (Low Poly Sphere approximation)
-        # Face (Skin)
-        for i in range(100):
-            theta = math.acos(1 - 2 * (i + 0.5) / 100)
-            phi = math.pi * (1 + 5**0.5) * (i + 0.5)
-            r = 1.0
-            x = r * math.sin(theta) * math.cos(phi)
-            y = r * math.sin(theta) * math.sin(phi)
-            z = r * math.cos(theta)
-            
-            # Color logic based on position
-            col = SKIN
-            if y > 0.4 and z > 0: col = RED # Hat
-            elif z > 0.8 and y < 0.2: col = SKIN # Nose area
-            
-            # Nose bump
-            if z > 0.8 and y < 0:
-                z += 0.3
-                
-            self.vertices.append(Vertex(x, y, z, col))
-
-        # Hat Brim
-        for i in range(20):
-            angle = (i / 20) * math.pi * 2
-            x = math.cos(angle) * 1.2
-            z = math.sin(angle) * 1.2 + 0.2
-            y = 0.4
-            if z > 0: # Only front brim
-                 self.vertices.append(Vertex(x, y, z, RED))
-
-        # Mustache
-        self.vertices.append(Vertex(-0.5, -0.2, 0.9, BLACK))
-        self.vertices.append(Vertex(0.5, -0.2, 0.9, BLACK))
-        self.vertices.append(Vertex(0, -0.1, 1.1, SKIN)) # Nose tip
+        self.screen_points = None  # (px, py) from the last draw
+        self.screen_index = None   # Vertex index of each screen point
+        self.pick_grid = None      # Built from screen_points on the first pick
+        self.sorter = DepthSorter()
+
+        sphere, colors = face_sphere(point_counts[base_level])
+        features, feature_colors = face_features()
+        features_index = np.arange(len(sphere), len(sphere) + len(features))
+        points = [sphere, features]
+        self.colors = colors + feature_colors
+        self.levels = [None] * len(point_counts)
+        self.levels[base_level] = np.arange(len(sphere) + len(features))
+        for level in range(base_level + 1, len(point_counts)):
+            coarse, _ = face_sphere(point_counts[level])
+            self.levels[level] = np.concatenate([np.unique(nearest_points(coarse, sphere)), features_index])
+        shell = np.arange(len(sphere))  # Sphere vertices of the level just built
+        size = len(sphere) + len(features)
+        for level in range(base_level - 1, -1, -1):
+            fine, fine_colors = face_sphere(point_counts[level])
+            # The fine point nearest each coarser sphere vertex is that vertex
+            taken = nearest_points(np.vstack(points)[shell], fine)
+            added = np.setdiff1d(np.arange(len(fine)), taken)
+            points.append(fine[added])
+            self.colors += [fine_colors[i] for i in added.tolist()]
+            shell = np.concatenate([shell, np.arange(size, size + len(added))])
+            size += len(added)
+            self.levels[level] = np.sort(np.concatenate([shell, features_index]))
+        self.off_level = [np.setdiff1d(np.arange(size), index) for index in self.levels]
+        self.lods = LodLevels(lod_pixels)
+        self.level = None  # Detail level drawn last frame
+
+        self.pos = np.vstack(points)
+        self.base = self.pos.copy()
+        self.prev_pos = self.pos.copy()  # Pose one tick ago, for interpolation
+        self.vel = np.zeros_like(self.pos)
+        self.radius = np.sqrt((self.base ** 2).sum(axis=1).max())
+
+    def lod_points(self):
+        """Vertex indices of the detail level for the face's size on screen"""
+        # The face sits at the origin, 3.5 units in front of the camera
+        level = self.lods.select(self.radius * FOV / 3.5, self.level)
+        if level != self.level:
+            self.settle(self.off_level[level])
+            self.level = level
+        return self.levels[level]
+
+    def settle(self, index):
+        """Put vertices back in their base shape, at rest"""
+        self.pos[index] = self.base[index]
+        self.prev_pos[index] = self.base[index]
+        self.vel[index] = 0.0
+
+    def update_elastic(self):
+        # Spring physics to return to base shape, every vertex of the level at once
+        if self.level is None or not len(self.off_level[self.level]):
+            self.vel += (self.base - self.pos) * SPRING_K
+            self.vel *= SPRING_D
+            self.pos += self.vel
+            return
+        index = self.levels[self.level]
+        vel = (self.vel[index] + (self.base[index] - self.pos[index]) * SPRING_K) * SPRING_D
+        self.vel[index] = vel
+        self.pos[index] += vel
+
+    def project_points(self, width, height, pos=None, rotation_y=None):
+        # Vectorized rotate_y + project for every vertex
+        if pos is None:
+            pos, rotation_y = self.pos, self.rotation_y
+        c, s = math.cos(rotation_y), math.sin(rotation_y)
+        x, y, z = pos[:, 0], pos[:, 1], pos[:, 2]
+        rx = x * c + z * s
+        rz = -x * s + z * c
+        factor = FOV / (rz + 3.5)
+        px = (rx * factor + width / 2).astype(int)
+        py = (-y * factor + height / 2).astype(int)
+        return rz, px, py, factor
 
     def update(self, mouse_pos, mouse_down, width, height):
+        self.prev_pos[:] = self.pos
+        self.prev_rotation_y = self.rotation_y
         self.rotation_y += 0.01
         
         mx, my = mouse_pos
         
         # Spring physics
-        for v in self.vertices:
-            v.update_elastic()
+        with prof.scope("spring"):
+            self.update_elastic()
 
         # Interaction
         if mouse_down:
-            # Find closest vertex to mouse in 2D projection
-            closest = None
-            min_dist = 50 # Grab radius
-            
-            for v in self.vertices:
-                # Calculate current projected position
-                # Apply rotation first
-                rx, ry, rz = rotate_y(v.x, v.y, v.z, self.rotation_y)
-                px, py, scale = project(rx, ry, rz, width, height, FOV, 3.5)
-                
-                dist = math.hypot(px - mx, py - my)
-                if dist < min_dist:
-                    min_dist = dist
-                    closest = v
+            # Find closest vertex to mouse among the points drawn last frame
+            with prof.scope("pick"):
+                if self.pick_grid is None:
+                    if self.screen_points is None:
+                        self.screen_index = self.lod_points()
+                        self.screen_points = self.project_points(
+                            width, height, self.pos[self.screen_index], self.rotation_y)[1:3]
+                    self.pick_grid = PickGrid(*self.screen_points, width, height)
+                closest = self.pick_grid.nearest(mx, my, GRAB_RADIUS)
+                if closest is not None:
+                    closest = self.screen_index[closest]
             
-            if closest:
+            if closest is not None:
                 # Pull vertex towards mouse (approximate unprojection)
                 # This is a hacky "pull", essentially dragging the vertex in 3D space
                 # relative to camera plane
-                closest.x += (mx - width/2) * 0.001
-                closest.y -= (my - height/2) * 0.001
+                self.pos[closest, 0] += (mx - width/2) * 0.001
+                self.pos[closest, 1] -= (my - height/2) * 0.001
     
-    def draw(self, surface):
+    def draw(self, surface, alpha=1.0):
         # Sort vertices by Z depth for painter's algorithm
-        # We need to compute rotated positions first
-        projected_points = []
-        
-        for v in self.vertices:
-            rx, ry, rz = rotate_y(v.x, v.y, v.z, self.rotation_y)
-            px, py, scale = project(rx, ry, rz, WIDTH, HEIGHT, FOV, 3.5)
-            projected_points.append((rz, px, py, scale, v.color))
-            
-        projected_points.sort(key=lambda x: x[0], reverse=False)
+        # We need to compute rotated positions first, blended alpha of the
+        # way from the previous tick's pose to the current one
+        with prof.scope("project"):
+            index = self.lod_points()
+            pos = self.prev_pos[index] + (self.pos[index] - self.prev_pos[index]) * alpha
+            rotation_y = lerp(self.prev_rotation_y, self.rotation_y, alpha)
+            rz, px, py, scale = self.project_points(WIDTH, HEIGHT, pos, rotation_y)
+        self.screen_points = (px, py)
+        self.screen_index = index
+        self.pick_grid = None
+        with prof.scope("sort"):
+            order = self.sorter.sort(rz)
+        sizes = np.maximum(2, (10 * scale).astype(int))
+        colors = self.colors
+
+        # Points are large discs: anything drawn before the last disc that covers the
+        # whole surface is painted over, so start from that one
+        w, h = surface.get_size()
+        far_x = np.maximum(px, w - 1 - px)
+        far_y = np.maximum(py, h - 1 - py)
+        covers = far_x * far_x + far_y * far_y < (sizes - 1) ** 2
+        covering = np.flatnonzero(covers[order])
+        if len(covering):
+            order = order[covering[-1]:]
+        prof.count("points", len(rz))
+        prof.count("lod", self.level)
+        prof.count("drawn", len(order))
         
-        for p in projected_points:
-            rz, px, py, scale, color = p
-            size = max(2, int(10 * scale))
-            pygame.draw.circle(surface, color, (px, py), size)
-            
-            # Simple shading
-            if rz < 0:
-                pygame.draw.circle(surface, (0,0,0), (px, py), size, 1)
+        with prof.scope("raster"):
+            for i, x, y, size, z in zip(index[order].tolist(), px[order].tolist(), py[order].tolist(),
+                                        sizes[order].tolist(), rz[order].tolist()):
+                pygame.draw.circle(surface, colors[i], (x, y), size)
+
+                # Simple shading
+                if z < 0:
+                    pygame.draw.circle(surface, (0,0,0), (x, y), size, 1)
 
 class DemoRunner:
     def __init__(self):
         self.time = 0
         self.cam_angle = 0
+        self.prev_time = 0
+        self.prev_cam_angle = 0
+
+        # Mario runs a circle; body parts hang off his node. Parts are drawn as
+        # axis-aligned cubes, so only their world centres are used.
+        self.scene = SceneNode()
+        self.mario = SceneNode(self.scene)
+        self.parts, extents, self.part_colors = [], [], []
+        def part(off_x, off_y, off_z, w, h, d, col):
+            node = SceneNode(self.mario, pos=(off_x, off_y, off_z))
+            self.parts.append(node)
+            extents.append((w, h, d))
+            self.part_colors.append(col)
+            return node
+        # Torso
+        part(0, 0, 0, 0.5, 0.6, 0.3, RED)
+        # Head
+        part(0, 1.0, 0, 0.4, 0.4, 0.4, SKIN)
+        # Hat
+        part(0, 1.4, 0, 0.5, 0.1, 0.5, RED)
+        # Legs and arms, swung along z each frame
+        self.left_leg = part(-0.3, -1.0, 0, 0.2, 0.4, 0.2, BLUE)
+        self.right_leg = part(0.3, -1.0, 0, 0.2, 0.4, 0.2, BLUE)
+        self.left_arm = part(-0.7, 0.2, 0, 0.15, 0.4, 0.15, RED)
+        self.right_arm = part(0.7, 0.2, 0, 0.15, 0.4, 0.15, RED)
+        self.part_extents = np.array(extents, dtype=float)
         
-    def draw_cube(self, surface, x, y, z, w, h, d, color):
-        # A simple cube renderer
-        # Define 8 corners
-        corners = [
-            (x-w, y-h, z-d), (x+w, y-h, z-d), (x+w, y+h, z-d), (x-w, y+h, z-d),
-            (x-w, y-h, z+d), (x+w, y-h, z+d), (x+w, y+h, z+d), (x-w, y+h, z+d)
-        ]
-        
-        # Rotate world around camera
-        rot_corners = []
-        for cx, cy, cz in corners:
-            # Rotate around Y (orbit)
-            rx, ry, rz = rotate_y(cx, cy, cz, -self.cam_angle)
-            # Offset for camera
-            rz += 15 # Move world away from camera
-            ry -= 2  # Camera height
-            rot_corners.append((rx, ry, rz))
-            
-        # Project
-        proj_points = []
-        for rx, ry, rz in rot_corners:
-            px, py, s = project(rx, ry, rz, WIDTH, HEIGHT, FOV, 0)
-            proj_points.append((px, py))
-            
-        # Draw edges (Wireframe style for speed)
-        edges = [
-            (0,1), (1,2), (2,3), (3,0), # Back face
-            (4,5), (5,6), (6,7), (7,4), # Front face
-            (0,4), (1,5), (2,6), (3,7)  # Connecting
-        ]
+    # Corner signs and edges shared by every cube
+    CUBE_CORNERS = np.array([
+        (-1, -1, -1), (1, -1, -1), (1, 1, -1), (-1, 1, -1),
+        (-1, -1, 1), (1, -1, 1), (1, 1, 1), (-1, 1, 1)
+    ])
+    CUBE_EDGES = [
+        (0,1), (1,2), (2,3), (3,0), # Back face
+        (4,5), (5,6), (6,7), (7,4), # Front face
+        (0,4), (1,5), (2,6), (3,7)  # Connecting
+    ]
+
+    def draw_cubes(self, surface, centers, extents, colors, view):
+        # Simple cube renderer for k cubes at once: centers and half extents are
+        # (k, 3); the corners of all of them are transformed and projected together
+        corners = centers[:, None, :] + self.CUBE_CORNERS * extents[:, None, :]
+        homogeneous = np.concatenate([corners, np.ones(corners.shape[:2] + (1,))], axis=2)
         
-        for s, e in edges:
-            pygame.draw.line(surface, color, proj_points[s], proj_points[e], 3)
-            
+        # Into camera space (orbit, then camera offset) and project
+        rot = homogeneous @ view
+        factor = FOV / rot[..., 2]
+        xs = (rot[..., 0] * factor + WIDTH / 2).astype(int)
+        ys = (-rot[..., 1] * factor + HEIGHT / 2).astype(int)
         # Fill center (rough)
-        center_x = sum(p[0] for p in proj_points) // 8
-        center_y = sum(p[1] for p in proj_points) // 8
-        pygame.draw.circle(surface, color, (center_x, center_y), 5)
+        center_xs = (xs.sum(axis=1) // 8).tolist()
+        center_ys = (ys.sum(axis=1) // 8).tolist()
+        
+        for color, px, py, cx, cy in zip(colors, xs.tolist(), ys.tolist(), center_xs, center_ys):
+            # Draw edges (Wireframe style for speed)
+            for s, e in self.CUBE_EDGES:
+                pygame.draw.line(surface, color, (px[s], py[s]), (px[e], py[e]), 3)
+            pygame.draw.circle(surface, color, (cx, cy), 5)
 
-    def update_and_draw(self, surface):
+    def update(self):
+        self.prev_time, self.prev_cam_angle = self.time, self.cam_angle
         self.time += 0.05
         self.cam_angle += 0.01
+
+    def draw(self, surface, alpha=1.0):
+        time_val = lerp(self.prev_time, self.time, alpha)
+        cam_angle = lerp(self.prev_cam_angle, self.cam_angle, alpha)
         
         # Floor grid
         for i in range(-5, 6):
             # Horizontal lines
-            p1 = rotate_y(i*2, -2, -10, -self.cam_angle)
-            p2 = rotate_y(i*2, -2, 10, -self.cam_angle)
+            p1 = rotate_y(i*2, -2, -10, -cam_angle)
+            p2 = rotate_y(i*2, -2, 10, -cam_angle)
             pp1 = project(p1[0], p1[1]-2, p1[2]+15, WIDTH, HEIGHT, FOV, 0)
             pp2 = project(p2[0], p2[1]-2, p2[2]+15, WIDTH, HEIGHT, FOV, 0)
             pygame.draw.line(surface, (50, 100, 50), (pp1[0], pp1[1]), (pp2[0], pp2[1]), 1)
             
             # Vertical lines
-            p3 = rotate_y(-10, -2, i*2, -self.cam_angle)
-            p4 = rotate_y(10, -2, i*2, -self.cam_angle)
+            p3 = rotate_y(-10, -2, i*2, -cam_angle)
+            p4 = rotate_y(10, -2, i*2, -cam_angle)
             pp3 = project(p3[0], p3[1]-2, p3[2]+15, WIDTH, HEIGHT, FOV, 0)
             pp4 = project(p4[0], p4[1]-2, p4[2]+15, WIDTH, HEIGHT, FOV, 0)
             pygame.draw.line(surface, (50, 100, 50), (pp3[0], pp3[1]), (pp4[0], pp4[1]), 1)
 
         # Animate Mario
-        # Running circle path
-        mx = math.sin(self.time) * 5
-        mz = math.cos(self.time) * 5
-        my = math.sin(self.time * 5) * 0.5 # Bobbing
-        
-        facing = self.time + math.pi/2 # Face tangent to circle
-        
-        # Draw Body Parts relative to Mario Pos
-        def draw_part(off_x, off_y, off_z, w, h, d, col, anim_rot=0):
-            # 1. Rotate part local
-            # 2. Translate to Mario Pos
-            # 3. Rotate Mario around World Origin
-            
-            # Simplified: Just calculating world positions manually for demo
-            
-            # Limb animation
-            lx = off_x
-            ly = off_y
-            lz = off_z
-            
-            # Apply Mario rotation
-            rx, ry, rz = rotate_y(lx, ly, lz, facing)
-            
-            # World pos
-            wx = mx + rx
-            wy = my + ry
-            wz = mz + rz
-            
-            self.draw_cube(surface, wx, wy, wz, w, h, d, col)
-
-        # Torso
-        draw_part(0, 0, 0, 0.5, 0.6, 0.3, RED)
-        # Head
-        draw_part(0, 1.0, 0, 0.4, 0.4, 0.4, SKIN)
-        # Hat
-        draw_part(0, 1.4, 0, 0.5, 0.1, 0.5, RED)
+        # Running circle path, bobbing, facing tangent to the circle
+        self.mario.set_position(math.sin(time_val) * 5, math.sin(time_val * 5) * 0.5, math.cos(time_val) * 5)
+        self.mario.set_rotation(0, time_val + math.pi/2, 0)
         
         # Limbs (Simple Swing)
-        leg_swing = math.sin(self.time * 10) * 0.5
-        arm_swing = math.cos(self.time * 10) * 0.5
-        
-        # Left Leg
-        draw_part(-0.3, -1.0, leg_swing, 0.2, 0.4, 0.2, BLUE)
-        # Right Leg
-        draw_part(0.3, -1.0, -leg_swing, 0.2, 0.4, 0.2, BLUE)
-        # Left Arm
-        draw_part(-0.7, 0.2, arm_swing, 0.15, 0.4, 0.15, RED)
-        # Right Arm
-        draw_part(0.7, 0.2, -arm_swing, 0.15, 0.4, 0.15, RED)
+        leg_swing = math.sin(time_val * 10) * 0.5
+        arm_swing = math.cos(time_val * 10) * 0.5
+        self.left_leg.set_position(-0.3, -1.0, leg_swing)
+        self.right_leg.set_position(0.3, -1.0, -leg_swing)
+        self.left_arm.set_position(-0.7, 0.2, arm_swing)
+        self.right_arm.set_position(0.7, 0.2, -arm_swing)
+
+        # Rotate world around camera, then move it away and below the eye
+        view = transform_matrix(0, -2, 15, 0, -cam_angle, 0)
+        centers = np.array([node.world_position for node in self.parts])
+        self.draw_cubes(surface, centers, self.part_extents, self.part_colors, view)
 
 # --- MAIN ---
 
+def simulate(ticks):
+    """Step the face and the demo with a scripted drag and no rendering (`--sim N`)"""
+    face = MarioFace()
+    demo = DemoRunner()
+
+    def step(tick):
+        mouse = (400 + int(math.cos(tick * 0.05) * 120), 300 + int(math.sin(tick * 0.05) * 90))
+        face.update(mouse, True, WIDTH, HEIGHT)
+        demo.update()
+        # Nothing draws here, so drop the projection the way draw() would;
+        # the next pick projects the face as it is now
+        face.screen_points = face.pick_grid = None
+    run_simulation(step, ticks)
+
 def main():
     pygame.init()
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     pygame.display.set_caption("ULTRA MARIO 3D BROS")
     clock = pygame.time.Clock()
-    font_title = pygame.font.SysFont("Arial", 64, bold=True)
-    font_sub = pygame.font.SysFont("Arial", 32)
+    font_title = text_cache.font("Arial", 64, bold=True)
+    font_sub = text_cache.font("Arial", 32)
+    debug_font = text_cache.font("monospace", 14)
     
     face = MarioFace()
     demo = DemoRunner()
+    timestep = FixedTimestep(SIM_HZ)
+    frame_time = 1.0 / SIM_HZ
+    inputs = InputLog.from_env(())  # Only events and the mouse drive this game
     
     state = "MENU" # MENU or DEMO
     
     running = True
     while running:
+        prof.begin_frame()
         mouse_down = False
-        for event in pygame.event.get():
+        frame = inputs.poll()
+        for event in frame.events:
             if event.type == pygame.QUIT:
                 running = False
             if event.type == pygame.MOUSEBUTTONDOWN:
@@ -315,46 +469,70 @@ def main():
                         state = "DEMO"
                     else:
                         state = "MENU"
+                if event.key == pygame.K_F3:
+                    prof.toggle_overlay()
         
-        screen.fill(SKY_BLUE)
+        steps = timestep.advance(frame_time)
+        prof.count("ticks", steps)
         
         if state == "MENU":
+            # No dirty rects here: the face's discs always include one that
+            # covers the whole screen, so every menu frame repaints it all
+            screen.fill(SKY_BLUE)
+            
             # Draw Face
-            face.update(pygame.mouse.get_pos(), pygame.mouse.get_pressed()[0], WIDTH, HEIGHT)
-            face.draw(screen)
+            mouse_pos, mouse_held = frame.mouse_pos, frame.mouse_buttons[0]
+            for _ in range(steps):
+                face.update(mouse_pos, mouse_held, WIDTH, HEIGHT)
+            face.draw(screen, timestep.alpha)
             
             # Draw UI
-            title = font_title.render("ULTRA MARIO 3D", True, YELLOW)
-            shadow = font_title.render("ULTRA MARIO 3D", True, BLACK)
-            
-            # Bouncing Text
-            y_off = math.sin(pygame.time.get_ticks() * 0.005) * 10
-            
-            screen.blit(shadow, (WIDTH//2 - title.get_width()//2 + 4, 54 + y_off))
-            screen.blit(title, (WIDTH//2 - title.get_width()//2, 50 + y_off))
-            
-            sub = font_sub.render("PRESS SPACE TO START", True, WHITE)
-            screen.blit(sub, (WIDTH//2 - sub.get_width()//2, HEIGHT - 100))
-            
-            info = font_sub.render("(Click & Drag Face!)", True, BLACK)
-            screen.blit(info, (WIDTH//2 - info.get_width()//2, HEIGHT - 50))
+            with prof.scope("ui"):
+                title = text_cache.render(font_title, "ULTRA MARIO 3D", YELLOW)
+                shadow = text_cache.render(font_title, "ULTRA MARIO 3D", BLACK)
+                
+                # Bouncing Text
+                y_off = math.sin(inputs.time_ms * 0.005) * 10
+                
+                screen.blit(shadow, (WIDTH//2 - title.get_width()//2 + 4, 54 + y_off))
+                screen.blit(title, (WIDTH//2 - title.get_width()//2, 50 + y_off))
+                
+                sub = text_cache.render(font_sub, "PRESS SPACE TO START", WHITE)
+                screen.blit(sub, (WIDTH//2 - sub.get_width()//2, HEIGHT - 100))
+                
+                info = text_cache.render(font_sub, "(Click & Drag Face!)", BLACK)
+                screen.blit(info, (WIDTH//2 - info.get_width()//2, HEIGHT - 50))
             
         elif state == "DEMO":
             # Draw Demo
+            screen.fill(SKY_BLUE)
             # Draw Ground Plane Half
             pygame.draw.rect(screen, GRASS_GREEN, (0, HEIGHT//2, WIDTH, HEIGHT//2))
             
-            demo.update_and_draw(screen)
+            with prof.scope("demo"):
+                for _ in range(steps):
+                    demo.update()
+                demo.draw(screen, timestep.alpha)
             
             # UI
-            txt = font_sub.render("DEMO MODE - AI RUNNING", True, WHITE)
-            screen.blit(txt, (20, 20))
+            with prof.scope("ui"):
+                txt = text_cache.render(font_sub, "DEMO MODE - AI RUNNING", WHITE)
+                screen.blit(txt, (20, 20))
             
-        pygame.display.flip()
-        clock.tick(FPS)
+        prof.draw_overlay(screen, debug_font)
+        with prof.scope("present"):
+            pygame.display.flip()
+        prof.end_frame()
+        frame_time = inputs.tick(clock, FPS) / 1000
 
+    inputs.close()
+    prof.export()
     pygame.quit()
     sys.exit()
 
 if __name__ == "__main__":
-    main()
+    ticks = sim_ticks_from_argv()
+    if ticks is not None:
+        simulate(ticks)
+    else:
+        main()
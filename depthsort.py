@@ -0,0 +1,37 @@
+"""Frame-coherent depth ordering for the painter's algorithm.
+
+Draw lists barely change order from one frame to the next, so the sorter
+starts from last frame's order:
+
+    sorter = DepthSorter(descending=True)   # one per draw list
+    order = sorter.sort(z)                  # indices to draw, in order
+
+The result is always the same as a stable sort on z (or on -z when
+descending), so equal depths keep index order. When the seeded order is
+already sorted the cost is a single comparison pass; otherwise NumPy's
+timsort finishes it in near-linear time.
+"""
+import numpy as np
+
+class DepthSorter:
+    """Stable depth order seeded with the previous call's order"""
+    def __init__(self, descending=False):
+        self.descending = descending
+        self.order = None
+
+    def sort(self, z):
+        key = np.asarray(z, dtype=float)
+        if self.descending:
+            key = -key
+        n = len(key)
+        order = self.order if self.order is not None and len(self.order) == n else np.arange(n)
+        seeded = key[order]
+        if (seeded[1:] < seeded[:-1]).any():
+            step = np.argsort(seeded, kind='stable')
+            order, seeded = order[step], seeded[step]
+        # Equal depths must stay in index order, like list.sort
+        ties = seeded[1:] == seeded[:-1]
+        if ties.any() and (order[1:][ties] < order[:-1][ties]).any():
+            order = np.lexsort((np.arange(n), key))
+        self.order = order
+        return order
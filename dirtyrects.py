@@ -0,0 +1,63 @@
+"""Dirty-rectangle presentation for mostly static screens.
+
+Instead of clearing and flipping the whole display, a screen keeps a cached
+background and repaints only the regions that changed:
+
+    presenter.begin(screen)                  # erase last frame's dynamic rects
+    presenter.mark(draw_something(screen))   # every rect drawn this frame
+    ...
+    presenter.present()                      # display.update(changed rects)
+
+Anything drawn but not marked must look the same every frame, since it is
+only pushed to the display when it falls inside a changed region. When the
+changed area grows past max_fraction of the screen, present() flips the
+whole display instead.
+"""
+import pygame
+
+MAX_DIRTY_FRACTION = 0.5  # Share of the screen above which a full flip is cheaper
+
+class DirtyRectPresenter:
+    """Tracks rects drawn per frame and presents only what changed"""
+    def __init__(self, max_fraction=MAX_DIRTY_FRACTION):
+        self.max_fraction = max_fraction
+        self.background = None
+        self.rects = []       # Drawn this frame
+        self.prev_rects = []  # Drawn last frame, erased at begin()
+        self.full = True
+        self.full_frames = 0
+        self.partial_frames = 0
+
+    def set_background(self, background):
+        """Use a new background surface; the next frame repaints everything"""
+        self.background = background
+        self.invalidate()
+
+    def invalidate(self):
+        self.full = True
+
+    def begin(self, screen):
+        if self.full:
+            screen.blit(self.background, (0, 0))
+        else:
+            for rect in self.prev_rects:
+                screen.blit(self.background, rect, rect)
+
+    def mark(self, rect):
+        if rect:
+            self.rects.append(pygame.Rect(rect))
+
+    def present(self):
+        screen = pygame.display.get_surface()
+        dirty = [r.clip(screen.get_rect()) for r in self.prev_rects + self.rects]
+        dirty = [r for r in dirty if r]
+        area = sum(r.width * r.height for r in dirty)
+        if self.full or area > self.max_fraction * screen.get_width() * screen.get_height():
+            pygame.display.flip()
+            self.full_frames += 1
+        else:
+            pygame.display.update(dirty)
+            self.partial_frames += 1
+        self.prev_rects, self.rects = self.rects, []
+        self.full = False
+        return dirty
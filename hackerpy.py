@@ -1,17 +1,34 @@
 #!/usr/bin/env python3
+"""Title screen and 2D platformer.
+
+Importing this module only defines things: Game brings up pygame, the
+display, fonts and the title background the first time it needs them, so
+a benchmark or another launcher can create, step and draw a game without
+handing it the process.
+
+    python hackerpy.py              # play
+    python hackerpy.py --sim N      # N simulation ticks, no rendering
+    python hackerpy.py --startup    # time to first frame, by stage
+"""
+import time
+IMPORT_START = time.perf_counter()  # Start of the "import" startup stage
+
 import pygame
 import math
 import random
 import sys
-
-# Initialize Pygame
-pygame.init()
+from profiler import FrameProfiler
+from textcache import text_cache
+from dirtyrects import DirtyRectPresenter
+from inputlog import InputLog
+from platforms import PlatformLevel
+from timestep import FixedTimestep, HeldKeys, lerp, run_simulation, sim_ticks_from_argv
 
 # Screen setup
 WIDTH, HEIGHT = 800, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("SUPER MARIO 64 - Pygame Edition")
-clock = pygame.time.Clock()
+prof = FrameProfiler.from_env()
+FPS = 60      # Render frame cap; 0 renders as fast as the machine allows
+SIM_HZ = 60   # Simulation ticks per second
 
 # Colors
 SKY_BLUE = (0, 120, 255)
@@ -27,43 +44,35 @@ BEIGE = (255, 220, 150)
 # Mario head parameters
 head_radius = 80
 head_x, head_y = WIDTH // 2, HEIGHT // 2
-rotation_angle = 0
-stretch_factor = 1.0
-dragging = False
-
-# Text setup
-title_font = pygame.font.SysFont('Arial', 80, bold=True)
-press_font = pygame.font.SysFont('Arial', 36)
-blink_timer = 0
-show_press_text = True
 
 def draw_mario_head(surface, x, y, radius, rotation, stretch):
+    # Returns the bounding rect of everything drawn
     # Draw head (ellipse for stretch effect)
     head_rect = pygame.Rect(x - radius * stretch, y - radius, radius * 2 * stretch, radius * 2)
-    pygame.draw.ellipse(surface, BEIGE, head_rect)
+    drawn = [pygame.draw.ellipse(surface, BEIGE, head_rect)]
     
     # Draw cap (red)
     cap_rect = pygame.Rect(x - radius * 1.1 * stretch, y - radius * 0.7, radius * 2.2 * stretch, radius * 1.3)
-    pygame.draw.ellipse(surface, RED, cap_rect)
+    drawn.append(pygame.draw.ellipse(surface, RED, cap_rect))
     
     # Draw eyes
     eye_offset_x = radius * 0.5 * math.cos(rotation) * stretch
     eye_offset_y = radius * 0.5 * math.sin(rotation)
     
     # Left eye
-    pygame.draw.circle(surface, WHITE, (int(x - eye_offset_x), int(y - eye_offset_y)), int(radius * 0.3))
-    pygame.draw.circle(surface, BLUE, (int(x - eye_offset_x), int(y - eye_offset_y)), int(radius * 0.15))
-    pygame.draw.circle(surface, BLACK, (int(x - eye_offset_x), int(y - eye_offset_y)), int(radius * 0.08))
+    drawn.append(pygame.draw.circle(surface, WHITE, (int(x - eye_offset_x), int(y - eye_offset_y)), int(radius * 0.3)))
+    drawn.append(pygame.draw.circle(surface, BLUE, (int(x - eye_offset_x), int(y - eye_offset_y)), int(radius * 0.15)))
+    drawn.append(pygame.draw.circle(surface, BLACK, (int(x - eye_offset_x), int(y - eye_offset_y)), int(radius * 0.08)))
     
     # Right eye
-    pygame.draw.circle(surface, WHITE, (int(x + eye_offset_x), int(y - eye_offset_y)), int(radius * 0.3))
-    pygame.draw.circle(surface, BLUE, (int(x + eye_offset_x), int(y - eye_offset_y)), int(radius * 0.15))
-    pygame.draw.circle(surface, BLACK, (int(x + eye_offset_x), int(y - eye_offset_y)), int(radius * 0.08))
+    drawn.append(pygame.draw.circle(surface, WHITE, (int(x + eye_offset_x), int(y - eye_offset_y)), int(radius * 0.3)))
+    drawn.append(pygame.draw.circle(surface, BLUE, (int(x + eye_offset_x), int(y - eye_offset_y)), int(radius * 0.15)))
+    drawn.append(pygame.draw.circle(surface, BLACK, (int(x + eye_offset_x), int(y - eye_offset_y)), int(radius * 0.08)))
     
     # Draw nose
     nose_x = x + radius * 0.7 * math.cos(rotation) * stretch
     nose_y = y + radius * 0.1 * math.sin(rotation)
-    pygame.draw.circle(surface, ORANGE, (int(nose_x), int(nose_y)), int(radius * 0.25))
+    drawn.append(pygame.draw.circle(surface, ORANGE, (int(nose_x), int(nose_y)), int(radius * 0.25)))
     
     # Draw mustache
     mustache_y = y + radius * 0.2
@@ -77,7 +86,7 @@ def draw_mario_head(surface, x, y, radius, rotation, stretch):
         int(mustache_width), 
         int(mustache_height)
     )
-    pygame.draw.ellipse(surface, BLACK, left_mustache)
+    drawn.append(pygame.draw.ellipse(surface, BLACK, left_mustache))
     
     # Right mustache
     right_mustache = pygame.Rect(
@@ -86,162 +95,324 @@ def draw_mario_head(surface, x, y, radius, rotation, stretch):
         int(mustache_width), 
         int(mustache_height)
     )
-    pygame.draw.ellipse(surface, BLACK, right_mustache)
-
-def draw_title_screen():
-    global blink_timer, show_press_text
-    
-    # Draw sky background
-    screen.fill(SKY_BLUE)
-    
-    # Draw title
-    title_text = title_font.render("SUPER MARIO 64", True, YELLOW)
-    title_rect = title_text.get_rect(center=(WIDTH // 2, HEIGHT // 4))
-    screen.blit(title_text, title_rect)
-    
-    # Draw blinking "PRESS START" text
-    blink_timer += 1
-    if blink_timer >= 60:  # Blink every second
-        show_press_text = not show_press_text
-        blink_timer = 0
-    
-    if show_press_text:
-        press_text = press_font.render("PRESS SPACE TO START", True, WHITE)
-        press_rect = press_text.get_rect(center=(WIDTH // 2, HEIGHT * 3 // 4))
-        screen.blit(press_text, press_rect)
-    
-    # Draw Mario head
-    draw_mario_head(screen, head_x, head_y, head_radius, rotation_angle, stretch_factor)
-
-def draw_game_screen():
-    screen.fill((100, 200, 255))  # Light blue background
-    
-    # Draw ground
-    pygame.draw.rect(screen, (50, 200, 50), (0, HEIGHT - 100, WIDTH, 100))
-    
-    # Draw platforms
-    for i in range(5):
-        platform_x = 100 + i * 150
-        platform_y = HEIGHT - 200 - i * 50
-        pygame.draw.rect(screen, (200, 200, 100), (platform_x, platform_y, 100, 20))
-    
-    # Draw Mario (simple red square)
-    mario_size = 40
-    mario_x = WIDTH // 2
-    mario_y = HEIGHT - 140
-    pygame.draw.rect(screen, RED, (mario_x - mario_size // 2, mario_y - mario_size, mario_size, mario_size))
-    
-    # Draw eyes on Mario
-    pygame.draw.circle(screen, WHITE, (mario_x - 10, mario_y - mario_size + 15), 5)
-    pygame.draw.circle(screen, WHITE, (mario_x + 10, mario_y - mario_size + 15), 5)
-    pygame.draw.circle(screen, BLACK, (mario_x - 10, mario_y - mario_size + 15), 2)
-    pygame.draw.circle(screen, BLACK, (mario_x + 10, mario_y - mario_size + 15), 2)
-    
-    # Draw cap
-    pygame.draw.rect(screen, RED, (mario_x - mario_size // 2, mario_y - mario_size - 10, mario_size, 15))
-    
-    # Draw instructions
-    instr_font = pygame.font.SysFont('Arial', 24)
-    instr_text = instr_font.render("Use ARROW KEYS to move, SPACE to jump", True, BLACK)
-    screen.blit(instr_text, (20, 20))
+    drawn.append(pygame.draw.ellipse(surface, BLACK, right_mustache))
+    return drawn[0].unionall(drawn)
 
 # Game states
 TITLE_SCREEN = 0
 GAME_SCREEN = 1
-current_state = TITLE_SCREEN
+WATCHED_KEYS = (pygame.K_LEFT, pygame.K_RIGHT)  # Held keys the simulation reads
+
+# Level layout: platform rects (x, y, w, h), checked for landings in this order
+PLATFORMS = [
+    (100, HEIGHT - 200, 100, 20),
+    (250, HEIGHT - 250, 100, 20),
+    (400, HEIGHT - 300, 100, 20),
+    (550, HEIGHT - 350, 100, 20),
+    (700, HEIGHT - 400, 100, 20),
+]
+PLATFORM_COLOR = (200, 200, 100)
+GROUND_Y = HEIGHT - 140  # Where Mario's feet rest on the ground
+level = PlatformLevel(PLATFORMS)
 
-# Mario position for game screen
-mario_pos = [WIDTH // 2, HEIGHT - 140]
-mario_velocity = [0, 0]
+MARIO_HALF_WIDTH = 20  # Mario lands this close past either end of a platform
+MARIO_HEIGHT = 40      # and from this far above its top
 mario_speed = 5
 jump_power = 15
 gravity = 0.8
-on_ground = False
 
-# Main game loop
-running = True
-while running:
-    for event in pygame.event.get():
+STARTUP_STAGES = ("import", "pygame.init", "display", "fonts", "first frame")
+
+class Game:
+    """Title screen and platformer state, with pygame brought up on demand"""
+    def __init__(self):
+        self.current_state = TITLE_SCREEN
+        self.rotation_angle = 0
+        self.stretch_factor = 1.0
+        self.prev_rotation_angle = 0   # Values one tick ago, for interpolated drawing
+        self.prev_stretch_factor = 1.0
+        self.dragging = False
+        self.blink_timer = 0
+        self.show_press_text = True
+
+        # Mario position for game screen
+        self.mario_pos = [WIDTH // 2, GROUND_Y]
+        self.mario_velocity = [0, 0]
+        self.on_ground = False
+
+        # Created by the init_* methods on first use
+        self.screen = None
+        self.clock = None
+        self.fonts = None
+        self.presenter = None
+        self.startup = {}  # Stage -> ms, filled in as each stage first runs
+
+    # --- LAZY INITIALIZATION ---
+
+    def init_display(self):
+        if self.screen is None:
+            start = time.perf_counter()
+            pygame.init()
+            opened = time.perf_counter()
+            self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+            pygame.display.set_caption("SUPER MARIO 64 - Pygame Edition")
+            self.clock = pygame.time.Clock()
+            self.startup["pygame.init"] = (opened - start) * 1000
+            self.startup["display"] = (time.perf_counter() - opened) * 1000
+        return self.screen
+
+    def init_fonts(self):
+        # The first SysFont call scans the system's fonts
+        if self.fonts is None:
+            self.init_display()
+            start = time.perf_counter()
+            self.fonts = {
+                'title': text_cache.font('Arial', 80, bold=True),
+                'press': text_cache.font('Arial', 36),
+                'instr': text_cache.font('Arial', 24),
+                'debug': text_cache.font('monospace', 14),
+            }
+            self.startup["fonts"] = (time.perf_counter() - start) * 1000
+        return self.fonts
+
+    def init_presenter(self):
+        if self.presenter is None:
+            self.init_fonts()
+            self.presenter = DirtyRectPresenter()
+            self.presenter.set_background(self.make_title_background())
+        return self.presenter
+
+    # --- SIMULATION ---
+
+    def jump(self):
+        if self.on_ground:
+            self.mario_velocity[1] = -jump_power
+            self.on_ground = False
+
+    def update_simulation(self, keys, mouse_pos):
+        """Advance the game by one fixed SIM_HZ tick"""
+        self.prev_rotation_angle, self.prev_stretch_factor = self.rotation_angle, self.stretch_factor
+        if self.current_state == TITLE_SCREEN:
+            self.rotation_angle += 0.02
+            
+            # Handle stretching
+            if self.dragging:
+                mouse_x, mouse_y = mouse_pos
+                distance = math.sqrt((mouse_x - head_x)**2 + (mouse_y - head_y)**2)
+                self.stretch_factor = max(0.5, min(2.0, distance / head_radius))
+            else:
+                # Gradually return to normal
+                self.stretch_factor += (1.0 - self.stretch_factor) * 0.1
+
+            # Blink "PRESS START"
+            self.blink_timer += 1
+            if self.blink_timer >= 60:  # Blink every second
+                self.show_press_text = not self.show_press_text
+                self.blink_timer = 0
+        
+        elif self.current_state == GAME_SCREEN:
+            mario_pos, mario_velocity = self.mario_pos, self.mario_velocity
+            # Handle movement
+            mario_velocity[0] = 0
+            
+            if keys[pygame.K_LEFT]:
+                mario_velocity[0] = -mario_speed
+            if keys[pygame.K_RIGHT]:
+                mario_velocity[0] = mario_speed
+            
+            # Apply gravity
+            mario_velocity[1] += gravity
+            
+            # Update position
+            mario_pos[0] += mario_velocity[0]
+            mario_pos[1] += mario_velocity[1]
+            
+            # Ground collision
+            if mario_pos[1] >= GROUND_Y:
+                mario_pos[1] = GROUND_Y
+                mario_velocity[1] = 0
+                self.on_ground = True
+            
+            # Platform collisions, through the level's broadphase grid
+            hit = level.land(mario_pos[0], mario_pos[1], mario_velocity[1], MARIO_HALF_WIDTH, MARIO_HEIGHT)
+            if hit >= 0:
+                mario_pos[1] = level.platforms[hit][1] - MARIO_HEIGHT
+                mario_velocity[1] = 0
+                self.on_ground = True
+            
+            # Screen boundaries
+            mario_pos[0] = max(20, min(WIDTH - 20, mario_pos[0]))
+
+    def sim_step(self, tick):
+        # Scripted input for simulation-only mode: run back and forth, hopping
+        if tick % 40 == 0:
+            self.jump()
+        self.update_simulation(HeldKeys({pygame.K_RIGHT} if (tick // 120) % 2 == 0 else {pygame.K_LEFT}), (0, 0))
+
+    def simulate(self, ticks):
+        """Step the platformer without drawing (`--sim N`)"""
+        self.current_state = GAME_SCREEN
+        return run_simulation(self.sim_step, ticks)
+
+    # --- DRAWING ---
+
+    def make_title_background(self):
+        # Sky and title never change, so they live in the dirty-rect background
+        background = pygame.Surface((WIDTH, HEIGHT)).convert()
+        background.fill(SKY_BLUE)
+        title_text = text_cache.render(self.fonts['title'], "SUPER MARIO 64", YELLOW)
+        title_rect = title_text.get_rect(center=(WIDTH // 2, HEIGHT // 4))
+        background.blit(title_text, title_rect)
+        return background
+
+    def draw_title_screen(self, alpha=1.0):
+        screen, presenter = self.screen, self.presenter
+        # Restore the sky and title under last frame's head and text
+        presenter.begin(screen)
+        
+        # Draw blinking "PRESS START" text (toggled by the simulation)
+        if self.show_press_text:
+            press_text = text_cache.render(self.fonts['press'], "PRESS SPACE TO START", WHITE)
+            press_rect = press_text.get_rect(center=(WIDTH // 2, HEIGHT * 3 // 4))
+            presenter.mark(screen.blit(press_text, press_rect))
+        
+        # Draw Mario head between the last two ticks
+        presenter.mark(draw_mario_head(screen, head_x, head_y, head_radius,
+                                       lerp(self.prev_rotation_angle, self.rotation_angle, alpha),
+                                       lerp(self.prev_stretch_factor, self.stretch_factor, alpha)))
+
+    def draw_game_screen(self):
+        screen = self.screen
+        self.presenter.invalidate()
+        screen.fill((100, 200, 255))  # Light blue background
+        
+        # Draw ground
+        pygame.draw.rect(screen, (50, 200, 50), (0, HEIGHT - 100, WIDTH, 100))
+        
+        # Draw platforms
+        for i in level.visible(0, 0, WIDTH, HEIGHT):
+            pygame.draw.rect(screen, PLATFORM_COLOR, level.platforms[i])
+        
+        # Draw Mario (simple red square)
+        mario_size = 40
+        mario_x = WIDTH // 2
+        mario_y = HEIGHT - 140
+        pygame.draw.rect(screen, RED, (mario_x - mario_size // 2, mario_y - mario_size, mario_size, mario_size))
+        
+        # Draw eyes on Mario
+        pygame.draw.circle(screen, WHITE, (mario_x - 10, mario_y - mario_size + 15), 5)
+        pygame.draw.circle(screen, WHITE, (mario_x + 10, mario_y - mario_size + 15), 5)
+        pygame.draw.circle(screen, BLACK, (mario_x - 10, mario_y - mario_size + 15), 2)
+        pygame.draw.circle(screen, BLACK, (mario_x + 10, mario_y - mario_size + 15), 2)
+        
+        # Draw cap
+        pygame.draw.rect(screen, RED, (mario_x - mario_size // 2, mario_y - mario_size - 10, mario_size, 15))
+        
+        # Draw instructions
+        instr_text = text_cache.render(self.fonts['instr'], "Use ARROW KEYS to move, SPACE to jump", BLACK)
+        screen.blit(instr_text, (20, 20))
+
+    def draw_frame(self, alpha=1.0):
+        """Draw and present the current state"""
+        self.init_presenter()
+        with prof.scope("draw"):
+            if self.current_state == TITLE_SCREEN:
+                self.draw_title_screen(alpha)
+            elif self.current_state == GAME_SCREEN:
+                self.draw_game_screen()
+        
+        self.presenter.mark(prof.draw_overlay(self.screen, self.fonts['debug']))
+        with prof.scope("present"):
+            if self.current_state == TITLE_SCREEN:
+                self.presenter.present()
+            else:
+                pygame.display.flip()
+
+    # --- MAIN LOOP ---
+
+    def handle_event(self, event):
+        """Apply one pygame event; returns False on quit"""
         if event.type == pygame.QUIT:
-            running = False
+            return False
         
         if event.type == pygame.KEYDOWN:
-            if current_state == TITLE_SCREEN and event.key == pygame.K_SPACE:
-                current_state = GAME_SCREEN
-            elif current_state == GAME_SCREEN and event.key == pygame.K_SPACE and on_ground:
-                mario_velocity[1] = -jump_power
-                on_ground = False
+            if event.key == pygame.K_F3:
+                prof.toggle_overlay()
+            if self.current_state == TITLE_SCREEN and event.key == pygame.K_SPACE:
+                self.current_state = GAME_SCREEN
+            elif self.current_state == GAME_SCREEN and event.key == pygame.K_SPACE:
+                self.jump()
         
         if event.type == pygame.MOUSEBUTTONDOWN:
-            if current_state == TITLE_SCREEN:
+            if self.current_state == TITLE_SCREEN:
                 # Check if clicking on Mario head for stretch effect
-                mouse_x, mouse_y = pygame.mouse.get_pos()
+                mouse_x, mouse_y = event.pos
                 distance = math.sqrt((mouse_x - head_x)**2 + (mouse_y - head_y)**2)
                 if distance <= head_radius:
-                    dragging = True
+                    self.dragging = True
         
         if event.type == pygame.MOUSEBUTTONUP:
-            dragging = False
-    
-    # Update
-    if current_state == TITLE_SCREEN:
-        rotation_angle += 0.02
-        
-        # Handle stretching
-        if dragging:
-            mouse_x, mouse_y = pygame.mouse.get_pos()
-            distance = math.sqrt((mouse_x - head_x)**2 + (mouse_y - head_y)**2)
-            stretch_factor = max(0.5, min(2.0, distance / head_radius))
-        else:
-            # Gradually return to normal
-            stretch_factor += (1.0 - stretch_factor) * 0.1
-    
-    elif current_state == GAME_SCREEN:
-        # Handle movement
-        keys = pygame.key.get_pressed()
-        mario_velocity[0] = 0
-        
-        if keys[pygame.K_LEFT]:
-            mario_velocity[0] = -mario_speed
-        if keys[pygame.K_RIGHT]:
-            mario_velocity[0] = mario_speed
-        
-        # Apply gravity
-        mario_velocity[1] += gravity
-        
-        # Update position
-        mario_pos[0] += mario_velocity[0]
-        mario_pos[1] += mario_velocity[1]
-        
-        # Ground collision
-        if mario_pos[1] >= HEIGHT - 140:
-            mario_pos[1] = HEIGHT - 140
-            mario_velocity[1] = 0
-            on_ground = True
-        
-        # Platform collisions (simple)
-        for i in range(5):
-            platform_x = 100 + i * 150
-            platform_y = HEIGHT - 200 - i * 50
+            self.dragging = False
+        return True
+
+    def run(self, max_frames=None):
+        """Play until the window closes, or for max_frames frames"""
+        self.init_fonts()  # The title background is drawn with the first frame
+        timestep = FixedTimestep(SIM_HZ)
+        frame_time = 1.0 / SIM_HZ
+        inputs = InputLog.from_env(WATCHED_KEYS)
+        running = True
+        frames = 0
+        while running and frames != max_frames:
+            prof.begin_frame()
+            frame = inputs.poll()
+            for event in frame.events:
+                running = self.handle_event(event) and running
             
-            if (mario_pos[0] > platform_x - 20 and mario_pos[0] < platform_x + 120 and
-                mario_pos[1] > platform_y - 40 and mario_pos[1] < platform_y and
-                mario_velocity[1] > 0):
-                mario_pos[1] = platform_y - 40
-                mario_velocity[1] = 0
-                on_ground = True
-        
-        # Screen boundaries
-        mario_pos[0] = max(20, min(WIDTH - 20, mario_pos[0]))
-    
-    # Draw
-    if current_state == TITLE_SCREEN:
-        draw_title_screen()
-    elif current_state == GAME_SCREEN:
-        draw_game_screen()
-    
-    pygame.display.flip()
-    clock.tick(60)
+            # Update
+            with prof.scope("update"):
+                keys, mouse_pos = frame.keys, frame.mouse_pos
+                steps = timestep.advance(frame_time)
+                for _ in range(steps):
+                    self.update_simulation(keys, mouse_pos)
+            prof.count("ticks", steps)
+            
+            first = "first frame" not in self.startup
+            start = time.perf_counter()
+            self.draw_frame(timestep.alpha)
+            if first:
+                self.startup["first frame"] = (time.perf_counter() - start) * 1000
+            prof.end_frame()
+            frames += 1
+            frame_time = inputs.tick(self.clock, FPS) / 1000
+        inputs.close()
+
+    def startup_report(self):
+        """Lines of startup stage timings, in order, with the total to first frame"""
+        lines = ["%-12s %8.1f ms" % (stage, self.startup[stage])
+                 for stage in STARTUP_STAGES if stage in self.startup]
+        lines.append("%-12s %8.1f ms" % ("total", sum(self.startup.values())))
+        return lines
+
+IMPORT_TIME = (time.perf_counter() - IMPORT_START) * 1000
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    game = Game()
+    game.startup["import"] = IMPORT_TIME
+    ticks = sim_ticks_from_argv(argv)
+    if ticks is not None:
+        # Simulation-only mode: step the platformer without drawing
+        game.simulate(ticks)
+    elif "--startup" in argv:
+        # Startup profiling: bring everything up, draw one frame, report
+        game.run(max_frames=1)
+        print("\n".join(game.startup_report()))
+    else:
+        game.run()
+        prof.export()
+    pygame.quit()
 
-pygame.quit()
-sys.exit()
+if __name__ == "__main__":
+    main()
+    sys.exit()
@@ -0,0 +1,151 @@
+"""Per-frame input shared by the games, with recording and replay.
+
+Games read input through one poll() per frame instead of calling pygame
+directly, and let tick() run the frame clock:
+
+    inputs = InputLog.from_env(WATCHED_KEYS)
+    while running:
+        frame = inputs.poll()
+        for event in frame.events: ...           # QUIT, KEY*, MOUSEBUTTON* only
+        frame.keys[pygame.K_w], frame.mouse_pos, frame.mouse_buttons
+        ...
+        frame_time = inputs.tick(clock, FPS) / 1000
+    inputs.close()
+
+MARIO_RECORD=<file.npz> saves every frame's input and frame time on
+close(). MARIO_REPLAY=<file.npz> feeds a recording back through the same
+calls: devices are ignored, tick() returns the recorded frame time at once
+instead of sleeping, and a QUIT follows the last frame. With the same
+frame times a fixed-timestep game runs the same ticks on the same input,
+so a replay does identical work on every build, as fast as it can. For
+the same reason v1.0 pins its adaptive quality level while replaying
+(see quality.py).
+
+Only the watched keys are recorded; a replay reports every other key as
+up. Recordings stay small: 19 bytes per frame plus 9 per event, before
+compression.
+"""
+import os
+import sys
+
+import numpy as np
+import pygame
+
+from timestep import HeldKeys
+
+RECORD_ENV = "MARIO_RECORD"
+REPLAY_ENV = "MARIO_REPLAY"
+INPUT_LOG_VERSION = 1
+
+FRAME_DTYPE = np.dtype([
+    ('dt', '<f8'),           # Milliseconds returned by tick(), exactly
+    ('mouse', '<i2', (2,)),
+    ('buttons', 'u1'),       # Bit i: mouse button i held
+    ('keys', '<u4'),         # Bit i: watched key i held
+    ('events', '<u2'),       # Events in this frame
+])
+EVENT_DTYPE = np.dtype([
+    ('type', 'u1'),          # Index into EVENT_TYPES
+    ('code', '<i4'),         # Key or mouse button
+    ('pos', '<i2', (2,)),
+])
+EVENT_TYPES = (pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)
+
+class FrameInput:
+    """Events and device state for one frame"""
+    def __init__(self, events, keys, mouse_pos, mouse_buttons):
+        self.events = events
+        self.keys = keys                    # Indexable by key constant, like key.get_pressed()
+        self.mouse_pos = mouse_pos
+        self.mouse_buttons = mouse_buttons  # Like mouse.get_pressed()
+
+def make_event(kind, code, pos):
+    if kind in (pygame.KEYDOWN, pygame.KEYUP):
+        return pygame.event.Event(kind, key=code, mod=0, unicode='', scancode=0)
+    if kind in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+        return pygame.event.Event(kind, button=code, pos=pos)
+    return pygame.event.Event(kind)
+
+class InputLog:
+    """Live, recorded or replayed frame input"""
+    def __init__(self, watched_keys, record_path=None, replay_path=None):
+        if len(watched_keys) > 32:
+            raise ValueError("at most 32 watched keys fit a frame record")
+        self.watched_keys = tuple(watched_keys)
+        self.record_path = record_path
+        self.replay_path = replay_path
+        self.frame = 0
+        self.time_ms = 0  # Sum of frame times so far; replaces time.get_ticks() for animation
+        self.frames, self.events = [], []  # While recording
+        self.pending = None
+        if replay_path:
+            with np.load(replay_path) as data:
+                if int(data['version']) != INPUT_LOG_VERSION:
+                    raise ValueError("%s has input log version %d, expected %d"
+                                     % (replay_path, int(data['version']), INPUT_LOG_VERSION))
+                self.watched_keys = tuple(data['watched_keys'].tolist())
+                self.frames, self.events = data['frames'], data['events']
+            self.event_starts = np.cumsum(self.frames['events']) - self.frames['events']
+
+    @classmethod
+    def from_env(cls, watched_keys):
+        return cls(watched_keys, os.environ.get(RECORD_ENV), os.environ.get(REPLAY_ENV))
+
+    @property
+    def replaying(self):
+        return self.replay_path is not None
+
+    def poll(self):
+        """This frame's input: the devices, or the recording when replaying"""
+        if self.replaying:
+            return self.replay_frame()
+        events = [e for e in pygame.event.get() if e.type in EVENT_TYPES]
+        frame = FrameInput(events, pygame.key.get_pressed(), pygame.mouse.get_pos(), pygame.mouse.get_pressed())
+        if self.record_path:
+            self.pending = frame
+        return frame
+
+    def replay_frame(self):
+        # The window can still be closed mid-replay
+        events = [e for e in pygame.event.get() if e.type == pygame.QUIT]
+        if self.frame >= len(self.frames):
+            return FrameInput(events + [pygame.event.Event(pygame.QUIT)], HeldKeys(), (0, 0), (False,) * 3)
+        row = self.frames[self.frame]
+        start = self.event_starts[self.frame]
+        for kind, code, pos in self.events[start:start + row['events']].tolist():
+            events.append(make_event(EVENT_TYPES[kind], code, tuple(pos)))
+        mask, buttons = int(row['keys']), int(row['buttons'])
+        keys = HeldKeys(key for i, key in enumerate(self.watched_keys) if mask >> i & 1)
+        return FrameInput(events, keys, tuple(row['mouse'].tolist()), tuple(bool(buttons >> i & 1) for i in range(3)))
+
+    def tick(self, clock, fps):
+        """End the frame; returns its duration in ms like Clock.tick()"""
+        if self.replaying:
+            ms = float(self.frames['dt'][self.frame]) if self.frame < len(self.frames) else 0
+        else:
+            ms = clock.tick(fps)
+            if self.pending is not None:
+                self.store(self.pending, ms)
+                self.pending = None
+        self.frame += 1
+        self.time_ms += ms
+        return ms
+
+    def store(self, frame, ms):
+        keys = sum(1 << i for i, key in enumerate(self.watched_keys) if frame.keys[key])
+        buttons = sum(1 << i for i, held in enumerate(frame.mouse_buttons[:3]) if held)
+        self.frames.append((ms, frame.mouse_pos, buttons, keys, len(frame.events)))
+        for e in frame.events:
+            code = getattr(e, 'key', getattr(e, 'button', 0))
+            self.events.append((EVENT_TYPES.index(e.type), code, getattr(e, 'pos', (0, 0))))
+
+    def close(self):
+        """Write the recording, if there is one"""
+        if not self.record_path or self.replaying:
+            return
+        game = os.path.basename(os.path.abspath(sys.argv[0]))
+        np.savez_compressed(self.record_path, version=INPUT_LOG_VERSION, game=game,
+                            watched_keys=np.array(self.watched_keys, dtype=np.int64),
+                            frames=np.array(self.frames, FRAME_DTYPE).reshape(-1),
+                            events=np.array(self.events, EVENT_DTYPE).reshape(-1))
+        print("recorded %d frames to %s" % (len(self.frames), self.record_path))
@@ -0,0 +1,58 @@
+"""Level-of-detail selection shared by the games.
+
+A generator builds an object at several detail levels, finest first, and
+LodLevels picks one from the object's projected size on screen:
+
+    lods = LodLevels(pixels=(200, 80))  # level 0 from 200 px, 1 from 80 px, else 2
+    level = lods.select(radius_px, level)
+
+Passing the level used last frame adds hysteresis: a level is kept until
+the size moves a margin past the threshold, so an object hovering at a
+threshold does not pop between levels every frame.
+
+lod_quality.bias scales every projected size before selection. Below 1
+picks coarser levels sooner (weak hardware); above 1 keeps detail longer.
+MARIO_LOD_BIAS sets its starting value.
+"""
+import os
+
+import numpy as np
+
+LOD_HYSTERESIS = 0.15  # Fraction past a threshold the size must move to switch level
+
+class LodQuality:
+    """Global detail setting applied on top of every LodLevels"""
+    def __init__(self, bias=1.0):
+        self.bias = bias
+
+lod_quality = LodQuality(float(os.environ.get("MARIO_LOD_BIAS", "1")))
+
+class LodLevels:
+    """Projected-size thresholds between detail levels, finest first"""
+    def __init__(self, pixels, hysteresis=LOD_HYSTERESIS):
+        self.pixels = np.asarray(pixels, dtype=float)  # Level i is used from pixels[i] up
+        self.hysteresis = hysteresis
+        self.count = len(self.pixels) + 1
+        self.switches = 0  # Level changes, for profiling
+
+    def select(self, size, current=None):
+        """Level for a projected size in pixels, given the level shown last frame"""
+        return int(self.select_many(np.array([size]), None if current is None else np.array([current]))[0])
+
+    def select_many(self, sizes, current=None):
+        """select() for an array of sizes; current holds each one's previous level"""
+        sizes = np.asarray(sizes, dtype=float) * lod_quality.bias
+        # Thresholds run from large to small, so count the ones each size falls below
+        level = np.searchsorted(-self.pixels, -sizes, side='left')
+        if current is None:
+            return level
+        current = np.asarray(current)
+        # Going coarser needs the size a margin below the current level's
+        # threshold, going finer a margin above the next finer level's
+        hi = np.append(self.pixels, 0.0)
+        lo = np.concatenate([[np.inf], self.pixels])
+        stay_coarse = (level < current) & (sizes < lo[current] * (1 + self.hysteresis))
+        stay_fine = (level > current) & (sizes >= hi[current] * (1 - self.hysteresis))
+        level = np.where(stay_coarse | stay_fine, current, level)
+        self.switches += int(np.count_nonzero(level != current))
+        return level
@@ -0,0 +1,163 @@
+"""Binary mesh/level files, memory-mapped for loading.
+
+A file is a small header followed by flat little-endian tables:
+
+    vertices        float64 (n, 3)  every mesh's vertices, mesh after mesh
+    face_verts      int64           face corners back to back, indexing the mesh's own vertices
+    face_counts     int32           corners per face
+    face_materials  uint32          per face, a row of colors
+    double_sided    uint8           per face, 1 to skip backface culling
+    colors          uint8 (m, 3)    RGB material table
+    parts           PART_DTYPE      name, vertex/face/corner ranges and a 4x4 placement matrix
+
+Parts placing the same mesh share its ranges. MeshFile maps the file
+read-only and every array it hands out is a view into that mapping, so
+loading costs a header parse however big the level is, and processes
+reading the same file share its pages through the OS cache:
+
+    write_mesh_file(path, meshes, parts)
+    level = MeshFile(path)
+    part = level.part("castle/main_tower")
+    part.vertices, part.face_verts, part.matrix, ...    # zero-copy views
+"""
+import mmap
+import os
+import struct
+
+import numpy as np
+
+MESH_MAGIC = b"MMSH"
+MESH_VERSION = 1
+HEADER = struct.Struct("<4sI")
+TABLE_ENTRY = struct.Struct("<QQ")  # Byte offset and row count of a table
+TABLE_ALIGN = 16
+NAME_BYTES = 32  # Longest part name, UTF-8 encoded
+
+PART_DTYPE = np.dtype([
+    ('name', 'S%d' % NAME_BYTES),
+    ('vertex_start', '<i8'), ('vertex_count', '<i8'),
+    ('face_start', '<i8'), ('face_count', '<i8'),
+    ('corner_start', '<i8'), ('corner_count', '<i8'),
+    ('matrix', '<f8', (4, 4)),
+])
+
+# Table name, row dtype and row shape, in file order
+TABLES = (
+    ('vertices', np.dtype('<f8'), (3,)),
+    ('face_verts', np.dtype('<i8'), ()),
+    ('face_counts', np.dtype('<i4'), ()),
+    ('face_materials', np.dtype('<u4'), ()),
+    ('double_sided', np.dtype('u1'), ()),
+    ('colors', np.dtype('u1'), (3,)),
+    ('parts', PART_DTYPE, ()),
+)
+
+class MeshPart:
+    """One part's slices of the file tables"""
+    def __init__(self, level, i):
+        row = level.parts[i]
+        self.name = level.names[i]
+        vs, fs, cs = row['vertex_start'], row['face_start'], row['corner_start']
+        self.vertices = level.vertices[vs:vs + row['vertex_count']]
+        self.face_verts = level.face_verts[cs:cs + row['corner_count']]
+        self.face_counts = level.face_counts[fs:fs + row['face_count']]
+        self.face_materials = level.face_materials[fs:fs + row['face_count']]  # Rows of colors
+        self.colors = level.colors
+        self.double_sided = level.double_sided[fs:fs + row['face_count']].view(bool)
+        self.matrix = level.parts['matrix'][i]
+
+class MeshFile:
+    """Read-only memory map of a mesh file, exposing its tables as arrays"""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self._map)
+        if magic != MESH_MAGIC:
+            raise ValueError("%s is not a mesh file" % path)
+        if version != MESH_VERSION:
+            raise ValueError("%s has mesh format version %d, expected %d" % (path, version, MESH_VERSION))
+        for i, (name, dtype, shape) in enumerate(TABLES):
+            offset, rows = TABLE_ENTRY.unpack_from(self._map, HEADER.size + i * TABLE_ENTRY.size)
+            count = rows * int(np.prod(shape, dtype=np.int64))
+            setattr(self, name, np.frombuffer(self._map, dtype, count, offset).reshape((rows,) + shape))
+        self.names = [name.decode() for name in self.parts['name']]
+        self._index = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def part(self, name):
+        return MeshPart(self, self._index[name])
+
+    def find(self, prefix):
+        """Parts whose names start with prefix, in file order"""
+        return [MeshPart(self, i) for i, name in enumerate(self.names) if name.startswith(prefix)]
+
+def write_mesh_file(path, meshes, parts):
+    """Write a mesh file.
+
+    meshes is a list of (vertices, face_verts, face_counts, face_colors,
+    double_sided) with one RGB color and one double-sided flag (or a
+    single flag for all) per face; parts a list of (name, mesh index,
+    4x4 matrix). The file is written beside path and moved into place.
+    Raises ValueError for a part name longer than NAME_BYTES in UTF-8.
+    """
+    for name, _, _ in parts:
+        if len(name.encode()) > NAME_BYTES:
+            raise ValueError("part name %r is longer than %d bytes" % (name, NAME_BYTES))
+    colors, color_index = [], {}
+    vertices, face_verts, face_counts, face_materials, double_sided = [], [], [], [], []
+    ranges = []
+    totals = np.zeros(3, dtype=np.int64)  # Vertices, faces, corners so far
+    for verts, corners, counts, face_colors, sided in meshes:
+        verts = np.asarray(verts, dtype=float).reshape(-1, 3)
+        counts = np.asarray(counts, dtype=np.int32)
+        sizes = np.array([len(verts), len(counts), len(corners)])
+        ranges.append((totals.copy(), sizes))
+        totals += sizes
+        vertices.append(verts)
+        face_verts.append(np.asarray(corners, dtype=np.int64))
+        face_counts.append(counts)
+        for rgb in face_colors:
+            rgb = tuple(int(c) for c in rgb)
+            if rgb not in color_index:
+                color_index[rgb] = len(colors)
+                colors.append(rgb)
+            face_materials.append(color_index[rgb])
+        double_sided.append(np.broadcast_to(np.asarray(sided, dtype=np.uint8), len(counts)))
+
+    rows = np.zeros(len(parts), PART_DTYPE)
+    for row, (name, mesh, matrix) in zip(rows, parts):
+        (vs, fs, cs), (vn, fn, cn) = ranges[mesh]
+        row['name'] = name.encode()
+        row['vertex_start'], row['face_start'], row['corner_start'] = vs, fs, cs
+        row['vertex_count'], row['face_count'], row['corner_count'] = vn, fn, cn
+        row['matrix'] = matrix
+
+    tables = {
+        'vertices': np.concatenate(vertices) if vertices else np.zeros((0, 3)),
+        'face_verts': np.concatenate(face_verts) if face_verts else np.zeros(0),
+        'face_counts': np.concatenate(face_counts) if face_counts else np.zeros(0),
+        'face_materials': np.array(face_materials),
+        'double_sided': np.concatenate(double_sided) if double_sided else np.zeros(0),
+        'colors': np.array(colors).reshape(-1, 3),
+        'parts': rows,
+    }
+    directory, blobs = [], []
+    offset = HEADER.size + len(TABLES) * TABLE_ENTRY.size
+    for name, dtype, shape in TABLES:
+        data = np.ascontiguousarray(tables[name], dtype=dtype).tobytes()
+        offset += -offset % TABLE_ALIGN
+        directory.append(TABLE_ENTRY.pack(offset, len(tables[name])))
+        blobs.append((offset, data))
+        offset += len(data)
+
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MESH_MAGIC, MESH_VERSION))
+        f.write(b"".join(directory))
+        for start, data in blobs:
+            f.write(b"\0" * (start - f.tell()))
+            f.write(data)
+    os.replace(tmp, path)
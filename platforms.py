@@ -0,0 +1,129 @@
+"""Platform levels with a uniform-grid broadphase.
+
+A level is a table of platform rects (x, y, w, h). The rects are binned
+into CELL_SIZE squares once, so a body only ever tests the platforms that
+share a cell with it, however long the level is:
+
+    level = PlatformLevel([(100, 400, 100, 20), ...])
+    hit = level.land(x, y, vy, half_width=20, height=40)  # platform index or -1
+    hits = level.land_many(xs, ys, vys, 20, 40)          # the same for many bodies
+    for i in level.visible(0, 0, WIDTH, HEIGHT):         # platforms to draw
+        ...
+
+A body at (x, y) lands on a platform when it is falling, x is less than
+half_width beyond either end of the platform, and y is less than height
+above the platform's top (all strict). Of several such platforms the one
+listed first wins, exactly as if the whole table were scanned in order.
+"""
+import numpy as np
+
+CELL_SIZE = 128  # Grid cell side in pixels; about a platform's width works well
+
+class PlatformLevel:
+    """Platform rects plus a grid of the cells each one covers"""
+    def __init__(self, platforms, cell_size=CELL_SIZE):
+        self.platforms = [tuple(p) for p in platforms]  # As given, so snapping keeps their types
+        rects = np.array(self.platforms, dtype=float).reshape(-1, 4)
+        self.x, self.y, self.w, self.h = rects.T
+        self.cell_size = cell_size
+        self.queries = 0     # Bodies tested, for profiling
+        self.candidates = 0  # Platforms they were tested against
+
+        # Grid over the level's bounds; queries outside it clamp to the edge cells
+        self.x0 = float(self.x.min()) if len(rects) else 0.0
+        self.y0 = float(self.y.min()) if len(rects) else 0.0
+        self.cols = int((self.x + self.w).max() - self.x0) // cell_size + 1 if len(rects) else 1
+        self.rows = int((self.y + self.h).max() - self.y0) // cell_size + 1 if len(rects) else 1
+        cx0, cy0, cx1, cy1 = self._cells(self.x, self.y, self.x + self.w, self.y + self.h)
+        # One (platform, cell) pair per covered cell, grouped by cell in
+        # ascending platform order
+        nx = cx1 - cx0 + 1
+        n = nx * (cy1 - cy0 + 1)
+        item = np.repeat(np.arange(len(rects)), n)
+        local = np.arange(len(item)) - np.repeat(np.cumsum(n) - n, n)
+        cell = (cy0[item] + local // nx[item]) * self.cols + cx0[item] + local % nx[item]
+        order = np.argsort(cell, kind='stable')
+        self.items = item[order]
+        self.ends = np.cumsum(np.bincount(cell, minlength=self.cols * self.rows))
+        self.starts = self.ends - np.bincount(cell, minlength=self.cols * self.rows)
+        # Plain-list copies: a single body's query is cheaper without NumPy calls
+        self._items, self._starts, self._ends = self.items.tolist(), self.starts.tolist(), self.ends.tolist()
+
+    def __len__(self):
+        return len(self.platforms)
+
+    def _cells(self, x0, y0, x1, y1):
+        """Inclusive cell ranges covered by boxes, clamped to the grid"""
+        size = self.cell_size
+        return (np.clip((np.asarray(x0) - self.x0) // size, 0, self.cols - 1).astype(np.intp),
+                np.clip((np.asarray(y0) - self.y0) // size, 0, self.rows - 1).astype(np.intp),
+                np.clip((np.asarray(x1) - self.x0) // size, 0, self.cols - 1).astype(np.intp),
+                np.clip((np.asarray(y1) - self.y0) // size, 0, self.rows - 1).astype(np.intp))
+
+    def query(self, x0, y0, x1, y1):
+        """Sorted indices of the platforms sharing a cell with a box; a superset of the overlaps"""
+        size, last_col, last_row = self.cell_size, self.cols - 1, self.rows - 1
+        cx0 = min(max(int((x0 - self.x0) // size), 0), last_col)
+        cx1 = min(max(int((x1 - self.x0) // size), 0), last_col)
+        cy0 = min(max(int((y0 - self.y0) // size), 0), last_row)
+        cy1 = min(max(int((y1 - self.y0) // size), 0), last_row)
+        if cx0 == cx1 and cy0 == cy1:
+            cell = cy0 * self.cols + cx0
+            return self._items[self._starts[cell]:self._ends[cell]]
+        found = set()
+        for cy in range(cy0, cy1 + 1):
+            row = cy * self.cols
+            found.update(self._items[self._starts[row + cx0]:self._ends[row + cx1]])
+        return sorted(found)
+
+    def visible(self, x0, y0, x1, y1):
+        """Indices of the platforms overlapping a view rect, in table order"""
+        visible = []
+        for i in self.query(x0, y0, x1, y1):
+            px, py, pw, ph = self.platforms[i]
+            if px < x1 and px + pw > x0 and py < y1 and py + ph > y0:
+                visible.append(i)
+        return visible
+
+    def land(self, x, y, vy, half_width, height):
+        """Index of the first platform a body at (x, y) lands on, or -1"""
+        if not vy > 0:
+            return -1
+        # Platforms whose top edge could be in reach: below y by up to height
+        candidates = self.query(x - half_width, y, x + half_width, y + height)
+        self.queries += 1
+        self.candidates += len(candidates)
+        for i in candidates:
+            px, py, pw = self.platforms[i][:3]
+            if px - half_width < x < px + pw + half_width and py - height < y < py:
+                return i
+        return -1
+
+    def land_many(self, x, y, vy, half_width, height):
+        """land() for arrays of bodies; returns an index array with -1 for no landing"""
+        x, y, vy = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (x, y, vy)))
+        hits = np.full(x.shape, len(self.platforms), dtype=np.intp)
+        body = np.flatnonzero(vy > 0)
+        if len(body) and len(self.platforms):
+            bx, by = x[body], y[body]
+            cx0, cy0, cx1, cy1 = self._cells(bx - half_width, by, bx + half_width, by + height)
+            # Each body's cells come as one run of columns per row
+            nrows = cy1 - cy0 + 1
+            run = np.repeat(np.arange(len(body)), nrows)
+            cy = cy0[run] + np.arange(len(run)) - np.repeat(np.cumsum(nrows) - nrows, nrows)
+            first = self.starts[cy * self.cols + cx0[run]]
+            n = self.ends[cy * self.cols + cx1[run]] - first
+            # Every (body, candidate) pair, then the exact test on each
+            pair = np.repeat(run, n)
+            cand = self.items[np.repeat(first, n) + np.arange(len(pair)) - np.repeat(np.cumsum(n) - n, n)]
+            self.queries += len(body)
+            self.candidates += len(cand)
+            px, py = self.x[cand], self.y[cand]
+            bx, by = bx[pair], by[pair]
+            ok = ((px - half_width < bx) & (bx < px + self.w[cand] + half_width)
+                  & (py - height < by) & (by < py))
+            # A platform spanning several cells shows up more than once; the
+            # minimum index is the same either way
+            np.minimum.at(hits, body[pair[ok]], cand[ok])
+        hits[hits == len(self.platforms)] = -1
+        return hits
@@ -0,0 +1,153 @@
+"""Per-stage frame profiler shared by the games.
+
+Wrap pipeline stages in named scopes and report item counts:
+
+    with prof.scope("sort"):
+        order = sorter.sort(z)
+    prof.count("items", len(z))
+    ...
+    prof.end_frame()    # and prof.begin_frame() at the top of the loop
+
+While disabled, scope() hands back one shared no-op context manager and
+count() returns immediately, so instrumented code pays only a method call.
+Set MARIO_PROFILE=<file.json|file.csv> to record every frame and dump the
+timings on exit, or press F3 in game to toggle the on-screen overlay.
+Occasional events go through log(name, record); a JSON export lists them
+under name, each tagged with the frame it happened in. CSV has no room
+for them and keeps only the per-frame columns.
+"""
+import csv
+import json
+import os
+import time
+from collections import deque
+
+PROFILE_ENV = "MARIO_PROFILE"
+WINDOW = 60  # Frames in the rolling overlay average
+
+class _NullScope:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SCOPE = _NullScope()
+
+class _Scope:
+    __slots__ = ("stages", "name", "start")
+
+    def __init__(self, stages, name):
+        self.stages = stages
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = (time.perf_counter() - self.start) * 1000
+        self.stages[self.name] = self.stages.get(self.name, 0.0) + elapsed
+        return False
+
+class FrameProfiler:
+    """Collects per-stage milliseconds and counts for each frame"""
+    def __init__(self, enabled=False, export_path=None, window=WINDOW):
+        self.enabled = enabled
+        self.export_path = export_path
+        self.overlay = False
+        self.stages = {}   # Stage -> ms, current frame
+        self.counts = {}   # Counter -> value, current frame
+        self.history = deque(maxlen=window)
+        self.frames = []   # Every finished frame, kept only when exporting
+        self.logs = {}     # Name -> logged records, kept only when exporting
+        self.frame = 0
+        self.frame_start = time.perf_counter()
+
+    @classmethod
+    def from_env(cls):
+        path = os.environ.get(PROFILE_ENV)
+        return cls(enabled=bool(path), export_path=path or None)
+
+    def scope(self, name):
+        if not self.enabled:
+            return _NULL_SCOPE
+        return _Scope(self.stages, name)
+
+    def count(self, name, value):
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def log(self, name, record):
+        if self.export_path:
+            self.logs.setdefault(name, []).append(dict(record, frame=self.frame))
+
+    def toggle_overlay(self):
+        # The overlay needs live numbers, so showing it switches timing on
+        self.overlay = not self.overlay
+        if self.overlay:
+            self.enabled = True
+        elif not self.export_path:
+            self.enabled = False
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        now = time.perf_counter()
+        if self.enabled:
+            row = {"frame": self.frame, "frame_ms": (now - self.frame_start) * 1000,
+                   "stages": self.stages, "counts": self.counts}
+            self.history.append(row)
+            if self.export_path:
+                self.frames.append(row)
+            self.stages, self.counts = {}, {}
+        self.frame += 1
+
+    def averages(self):
+        """Rolling mean of frame time, each stage and each counter"""
+        if not self.history:
+            return 0.0, {}, {}
+        n = len(self.history)
+        stages, counts = {}, {}
+        for row in self.history:
+            for name, ms in row["stages"].items():
+                stages[name] = stages.get(name, 0.0) + ms / n
+            for name, value in row["counts"].items():
+                counts[name] = counts.get(name, 0) + value / n
+        return sum(r["frame_ms"] for r in self.history) / n, stages, counts
+
+    def draw_overlay(self, surface, font, pos=(10, 10)):
+        """Draw the rolling averages; returns the rect covered, or None"""
+        if not self.overlay:
+            return None
+        frame_ms, stages, counts = self.averages()
+        lines = ["frame %6.2f ms" % frame_ms]
+        lines += ["%-8s %6.2f ms" % (name, ms) for name, ms in stages.items()]
+        lines += ["%-8s %6.0f" % (name, value) for name, value in counts.items()]
+        x, y = pos
+        rects = []
+        for line in lines:
+            img = font.render(line, True, (255, 255, 0), (0, 0, 0))
+            rects.append(surface.blit(img, (x, y)))
+            y += img.get_height()
+        return rects[0].unionall(rects)
+
+    def export(self, path=None):
+        """Write recorded frames as JSON, or CSV if the path ends in .csv"""
+        path = path or self.export_path
+        if not path:
+            return
+        if path.endswith(".csv"):
+            stage_names = sorted({k for r in self.frames for k in r["stages"]})
+            count_names = sorted({k for r in self.frames for k in r["counts"]})
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["frame", "frame_ms"] + [s + "_ms" for s in stage_names] + count_names)
+                for r in self.frames:
+                    writer.writerow([r["frame"], "%.4f" % r["frame_ms"]]
+                                    + ["%.4f" % r["stages"].get(s, 0.0) for s in stage_names]
+                                    + [r["counts"].get(c, 0) for c in count_names])
+        else:
+            with open(path, "w") as f:
+                json.dump(dict(self.logs, frames=self.frames), f)
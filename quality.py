@@ -0,0 +1,113 @@
+"""Adaptive quality that holds a frame-time budget.
+
+A game lists its quality settings from best to cheapest. The controller
+times every frame and steps down the list when frames run over budget,
+and back up when there is room again:
+
+    quality = QualityController.from_env(QUALITY_LEVELS, FPS)
+    while running:
+        quality.begin_frame()
+        ...                                  # draw with quality.settings
+        if quality.end_frame():
+            apply(quality.settings)          # the level changed
+        clock.tick(FPS)
+
+Only begin_frame() to end_frame() counts, so the sleep in clock.tick()
+never looks like load. Stepping down takes a window of frames averaging
+over budget; stepping back up takes a window well under it and a hold
+since the last change. A step up undone within the hold doubles the hold,
+so a scene sitting right at the budget settles on the cheaper level
+instead of alternating. Twice the hold without a change halves it again,
+so a rough patch early on does not pin the level for the rest of the
+session. Every change is printed and kept in changes.
+
+MARIO_QUALITY=<n> pins level n with the controller off; the default,
+"auto", adapts, and anything else is a ValueError. Without a frame cap
+(fps 0) there is no budget and the best level stays. A game replaying
+recorded input calls pin() unless MARIO_QUALITY is set, so the replay
+does the same work however fast the build runs.
+"""
+import os
+import time
+from collections import deque
+
+QUALITY_ENV = "MARIO_QUALITY"
+QUALITY_WINDOW = 30      # Frames averaged for each decision
+BUDGET_FRACTION = 0.9    # Share of the frame period drawing may take
+UPGRADE_FRACTION = 0.6   # Step up only when frames average under this share of the budget
+HOLD_FRAMES = 90         # Frames after a change before stepping up again
+MAX_HOLD_FRAMES = 1800
+
+class QualityController:
+    """Steps through quality levels to keep the rolling frame time under budget"""
+    def __init__(self, levels, budget_ms=None, level=0, adaptive=True, window=QUALITY_WINDOW):
+        self.levels = list(levels)
+        self.budget_ms = budget_ms
+        self.level = level
+        self.adaptive = adaptive and budget_ms is not None
+        self.times = deque(maxlen=window)  # Frame times since the last change
+        self.hold = HOLD_FRAMES
+        self.frame = 0
+        self.last_change = 0
+        self.last_relax = 0  # Last change or hold halving
+        self.last_upgrade = None
+        self.changes = []  # {"frame", "from", "to", "frame_ms"} per change
+        self.frame_start = time.perf_counter()
+
+    @classmethod
+    def from_env(cls, levels, fps):
+        budget = 1000.0 / fps * BUDGET_FRACTION if fps else None
+        value = os.environ.get(QUALITY_ENV, "auto")
+        if value == "auto":
+            return cls(levels, budget)
+        if not value.isdigit() or int(value) >= len(levels):
+            raise ValueError("%s must be 'auto' or a level from 0 to %d, not %r"
+                             % (QUALITY_ENV, len(levels) - 1, value))
+        return cls(levels, budget, level=int(value), adaptive=False)
+
+    def pin(self):
+        """Stop adapting; the current level stays"""
+        self.adaptive = False
+
+    @property
+    def settings(self):
+        return self.levels[self.level]
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        """Record the frame's time; True when the level changed"""
+        ms = (time.perf_counter() - self.frame_start) * 1000
+        return self.adaptive and self.update(ms)
+
+    def update(self, ms):
+        """Count a frame that took ms; True when the level changed"""
+        self.frame += 1
+        if self.hold > HOLD_FRAMES and self.frame - self.last_relax >= 2 * self.hold:
+            self.hold = max(HOLD_FRAMES, self.hold // 2)
+            self.last_relax = self.frame
+        self.times.append(ms)
+        if len(self.times) < self.times.maxlen:
+            return False
+        mean = sum(self.times) / len(self.times)
+        if mean > self.budget_ms and self.level < len(self.levels) - 1:
+            if self.last_upgrade is not None and self.frame - self.last_upgrade < self.hold:
+                # The step up did not fit after all; wait longer before the next try
+                self.hold = min(self.hold * 2, MAX_HOLD_FRAMES)
+            self.set_level(self.level + 1, mean)
+            return True
+        if (mean < self.budget_ms * UPGRADE_FRACTION and self.level > 0
+                and self.frame - self.last_change >= self.hold):
+            self.set_level(self.level - 1, mean)
+            self.last_upgrade = self.frame
+            return True
+        return False
+
+    def set_level(self, level, mean_ms):
+        self.changes.append({"frame": self.frame, "from": self.level, "to": level, "frame_ms": mean_ms})
+        print("quality %d -> %d at frame %d: %.1f ms per frame, budget %.1f ms"
+              % (self.level, level, self.frame, mean_ms, self.budget_ms))
+        self.level = level
+        self.last_change = self.last_relax = self.frame
+        self.times.clear()
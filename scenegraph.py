@@ -0,0 +1,147 @@
+"""Transform hierarchy shared by the games.
+
+A SceneNode holds a local position, rotation and scale relative to its
+parent. Its world matrix is composed lazily and cached: moving a node only
+marks it and its descendants dirty, and the matrices are rebuilt the next
+time someone asks for them. A part that did not move since last frame costs
+nothing, and a parent's rotation is composed once per change rather than
+once per child vertex.
+
+Matrices are 4x4 and act on homogeneous row vectors, `world_point =
+(x, y, z, 1) @ node.world`, so a child's world matrix is
+`child.local @ parent.world`.
+"""
+import math
+
+import numpy as np
+
+def transform_matrix(px, py, pz, rx, ry, rz, sx=1, sy=1, sz=1):
+    """Scale -> rotate_x -> rotate_y -> rotate_z -> translate, as a 4x4 matrix"""
+    cx, sn_x = math.cos(rx), math.sin(rx)
+    cy, sn_y = math.cos(ry), math.sin(ry)
+    cz, sn_z = math.cos(rz), math.sin(rz)
+    # Rz * Ry * Rx expanded by hand (transposed for row vectors)
+    return np.array([
+        [cz*cy*sx, sn_z*cy*sx, -sn_y*sx, 0.0],
+        [(cz*sn_y*sn_x - sn_z*cx)*sy, (sn_z*sn_y*sn_x + cz*cx)*sy, cy*sn_x*sy, 0.0],
+        [(cz*sn_y*cx + sn_z*sn_x)*sz, (sn_z*sn_y*cx - cz*sn_x)*sz, cy*cx*sz, 0.0],
+        [px, py, pz, 1.0]
+    ])
+
+def transform_matrices(px, py, pz, rx, ry, rz, sx=1, sy=1, sz=1):
+    """transform_matrix for arrays of parameters (broadcast together): (k, 4, 4)"""
+    px, py, pz, rx, ry, rz, sx, sy, sz = (np.atleast_1d(a) for a in np.broadcast_arrays(
+        *(np.asarray(a, dtype=float) for a in (px, py, pz, rx, ry, rz, sx, sy, sz))))
+    cx, sn_x = np.cos(rx), np.sin(rx)
+    cy, sn_y = np.cos(ry), np.sin(ry)
+    cz, sn_z = np.cos(rz), np.sin(rz)
+    m = np.zeros(px.shape + (4, 4))
+    m[..., 0, 0], m[..., 0, 1], m[..., 0, 2] = cz*cy*sx, sn_z*cy*sx, -sn_y*sx
+    m[..., 1, 0] = (cz*sn_y*sn_x - sn_z*cx)*sy
+    m[..., 1, 1] = (sn_z*sn_y*sn_x + cz*cx)*sy
+    m[..., 1, 2] = cy*sn_x*sy
+    m[..., 2, 0] = (cz*sn_y*cx + sn_z*sn_x)*sz
+    m[..., 2, 1] = (sn_z*sn_y*cx - cz*sn_x)*sz
+    m[..., 2, 2] = cy*cx*sz
+    m[..., 3, 0], m[..., 3, 1], m[..., 3, 2], m[..., 3, 3] = px, py, pz, 1.0
+    return m
+
+class SceneNode:
+    """Local transform plus a lazily composed, cached world matrix"""
+    def __init__(self, parent=None, pos=(0, 0, 0), rot=(0, 0, 0), scale=(1, 1, 1),
+                 mesh=None, material=None):
+        self.parent = None
+        self.children = []
+        self.pos = tuple(pos)
+        self.rot = tuple(rot)
+        self.scale = tuple(scale)
+        self.mesh = mesh          # Drawn with this node's world matrix, if set
+        self.material = material  # Optional material override for the mesh
+        self._local = None
+        self._world = None
+        self._normal = None
+        self.updates = 0          # World matrices composed, for profiling
+        if parent is not None:
+            parent.add(self)
+
+    def add(self, child):
+        if child.parent is not None:
+            child.parent.children.remove(child)
+        child.parent = self
+        self.children.append(child)
+        child.invalidate()
+        return child
+
+    def set_position(self, x, y, z):
+        if (x, y, z) != self.pos:
+            self.pos = (x, y, z)
+            self._local = None
+            self.invalidate()
+
+    def set_rotation(self, rx, ry, rz):
+        if (rx, ry, rz) != self.rot:
+            self.rot = (rx, ry, rz)
+            self._local = None
+            self.invalidate()
+
+    def set_scale(self, sx, sy, sz):
+        if (sx, sy, sz) != self.scale:
+            self.scale = (sx, sy, sz)
+            self._local = None
+            self.invalidate()
+
+    def invalidate(self):
+        # A dirty node's descendants are already dirty, so the walk stops there
+        if self._world is None:
+            return
+        self._world = self._normal = None
+        for child in self.children:
+            child.invalidate()
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = transform_matrix(*self.pos, *self.rot, *self.scale)
+        return self._local
+
+    @property
+    def world(self):
+        if self._world is None:
+            self._world = self.local if self.parent is None else self.local @ self.parent.world
+            self.updates += 1
+        return self._world
+
+    @property
+    def normal_matrix(self):
+        """Inverse transpose of world, which keeps normals perpendicular under scale"""
+        if self._normal is None:
+            world = self.world
+            if self.rigid:
+                self._normal = world
+            else:
+                self._normal = np.zeros((4, 4))
+                self._normal[:3, :3] = np.linalg.inv(world[:3, :3]).T
+        return self._normal
+
+    @property
+    def rigid(self):
+        """True when neither this node nor any ancestor is scaled"""
+        node = self
+        while node is not None:
+            if node.scale != (1, 1, 1):
+                return False
+            node = node.parent
+        return True
+
+    @property
+    def world_position(self):
+        w = self.world
+        return w[3, 0], w[3, 1], w[3, 2]
+
+    def walk(self):
+        """This node and every descendant, parents before children"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
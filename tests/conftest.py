@@ -0,0 +1,24 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+@pytest.fixture(scope="session")
+def castle():
+    """v1.0.py, which is not an importable module name"""
+    spec = importlib.util.spec_from_file_location("castle", os.path.join(ROOT, "v1.0.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(scope="session")
+def title():
+    import build251125
+    return build251125
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from depthsort import DepthSorter
+
+def depth_frames(rng, n, frames):
+    """Depths that drift a little each frame, with plenty of exact ties"""
+    z = rng.integers(0, 40, n) / 8.0
+    for _ in range(frames):
+        yield z.copy()
+        moved = rng.random(n) < 0.1
+        z[moved] += rng.integers(-2, 3, moved.sum()) / 8.0
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("n", [0, 1, 2, 50, 1000])
+def test_sorter_matches_stable_sort(n, descending):
+    sorter = DepthSorter(descending)
+    sign = -1 if descending else 1
+    for z in depth_frames(np.random.default_rng(n), n, 20):
+        assert sorter.sort(z).tolist() == np.argsort(sign * z, kind='stable').tolist()
+
+@pytest.mark.parametrize("start, count, shuffled", [
+    (0, 300, False), (100, 300, False), (100, 0, False), (0, 0, False), (100, 300, True), (500, 200, True),
+])
+def test_merge_presorted_matches_stable_sort(castle, start, count, shuffled):
+    rng = np.random.default_rng(start + count)
+    for z in depth_frames(rng, 700, 10):
+        # The static run comes back to front, except where faces crossed since
+        z[start:start + count] = -np.sort(-z[start:start + count], kind='stable')
+        if shuffled and count > 1:
+            i = rng.integers(start, start + count - 1, 5)
+            z[i], z[i + 1] = z[i + 1], z[i].copy()
+        order = castle.merge_presorted(z, start, count, DepthSorter(descending=True))
+        assert order.tolist() == np.argsort(-z, kind='stable').tolist()
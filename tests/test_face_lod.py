@@ -0,0 +1,72 @@
+import math
+
+import numpy as np
+import pytest
+
+from lod import lod_quality
+
+def drag(face, ticks):
+    for tick in range(ticks):
+        mouse = (400 + int(math.cos(tick * 0.05) * 120), 300 + int(math.sin(tick * 0.05) * 90))
+        face.update(mouse, True, 800, 600)
+        face.screen_points = face.pick_grid = None
+
+def test_title_face_is_the_original_face(title):
+    face = title.MarioFace()
+    assert face.lod_points().tolist() == list(range(114))
+    sphere, _ = title.face_sphere(100)
+    features, _ = title.face_features()
+    assert (face.base[:114] == np.vstack([sphere, features])).all()
+
+def test_base_level_springs_match_a_single_level_face(title):
+    face = title.MarioFace()
+    single = title.MarioFace(point_counts=(100,), lod_pixels=(), base_level=0)
+    face.lod_points()
+    single.lod_points()
+    drag(face, 200)
+    drag(single, 200)
+    assert (face.pos[:114] == single.pos).all()
+    assert (face.vel[:114] == single.vel).all()
+
+def test_every_level_shares_the_base_vertices(title):
+    face = title.MarioFace()
+    base = face.levels[title.FACE_BASE_LEVEL]
+    for level, index in enumerate(face.levels):
+        if level < title.FACE_BASE_LEVEL:
+            assert np.isin(base, index).all()
+        else:
+            assert np.isin(index, base).all()
+    assert len(face.levels[0]) == len(face.pos)
+
+def test_bias_selects_the_dense_level(title, monkeypatch):
+    monkeypatch.setattr(lod_quality, "bias", 1.6)
+    face = title.MarioFace()
+    assert len(face.lod_points()) == len(face.pos)
+    assert face.level == 0
+
+def test_vertices_leaving_the_level_settle(title, monkeypatch):
+    monkeypatch.setattr(lod_quality, "bias", 1.6)
+    face = title.MarioFace()
+    face.lod_points()
+    drag(face, 100)
+    dense_only = face.off_level[title.FACE_BASE_LEVEL]
+    assert (face.pos[dense_only] != face.base[dense_only]).any()
+    shared = face.levels[title.FACE_BASE_LEVEL]
+    dented = face.pos[shared].copy()
+    monkeypatch.setattr(lod_quality, "bias", 1.0)
+    face.lod_points()
+    assert face.level == title.FACE_BASE_LEVEL
+    assert (face.pos[dense_only] == face.base[dense_only]).all()
+    assert (face.prev_pos[dense_only] == face.base[dense_only]).all()
+    assert not face.vel[dense_only].any()
+    assert (face.pos[shared] == dented).all()  # Dents in shared vertices stay
+    # Off the drawn level nothing moves
+    drag(face, 50)
+    assert (face.pos[dense_only] == face.base[dense_only]).all()
+
+@pytest.mark.parametrize("bias, level", [(1.0, 1), (0.5, 2), (0.1, 3)])
+def test_level_follows_bias(title, monkeypatch, bias, level):
+    monkeypatch.setattr(lod_quality, "bias", bias)
+    face = title.MarioFace()
+    face.lod_points()
+    assert face.level == level
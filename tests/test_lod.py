@@ -0,0 +1,25 @@
+import numpy as np
+
+from lod import LodLevels
+
+def test_select_without_history_uses_thresholds():
+    lods = LodLevels(pixels=(200, 80))
+    assert [lods.select(s) for s in (500, 200, 199, 80, 79, 0)] == [0, 0, 1, 1, 2, 2]
+
+def test_hysteresis_holds_level_near_threshold():
+    lods = LodLevels(pixels=(200, 80), hysteresis=0.15)
+    # Coarser only once the size is a margin below the threshold
+    assert lods.select(195, 0) == 0
+    assert lods.select(169, 0) == 1
+    # Finer only once it is a margin above
+    assert lods.select(220, 1) == 1
+    assert lods.select(231, 1) == 0
+    assert lods.switches == 2
+
+def test_select_many_matches_select():
+    rng = np.random.default_rng(0)
+    sizes = rng.uniform(0, 300, 1000)
+    current = rng.integers(0, 3, 1000)
+    lods = LodLevels(pixels=(200, 80))
+    expected = [LodLevels(pixels=(200, 80)).select(s, c) for s, c in zip(sizes.tolist(), current.tolist())]
+    assert lods.select_many(sizes, current).tolist() == expected
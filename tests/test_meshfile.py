@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from meshfile import MeshFile, NAME_BYTES, write_mesh_file
+
+def cube():
+    vertices = [(x, y, z) for z in (-1, 1) for y in (-1, 1) for x in (-1, 1)]
+    faces = [(0, 1, 3, 2), (5, 4, 6, 7), (4, 0, 2, 6), (1, 5, 7, 3), (2, 3, 7, 6), (4, 5, 1, 0)]
+    colors = [(255, 0, 0), (0, 255, 0), (255, 0, 0), (0, 0, 255), (0, 0, 255), (255, 0, 0)]
+    return vertices, [i for f in faces for i in f], [4] * 6, colors, [0, 0, 1, 0, 0, 0]
+
+def pyramid():
+    vertices = [(0, 1, 0), (-1, -1, -1), (1, -1, -1), (1, -1, 1), (-1, -1, 1)]
+    return vertices, [0, 1, 2, 0, 2, 3, 0, 3, 4, 0, 4, 1, 4, 3, 2, 1], [3, 3, 3, 3, 4], [(9, 9, 9)] * 5, True
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "level.mesh")
+    meshes = [cube(), pyramid()]
+    moved = np.eye(4)
+    moved[3, :3] = (1, 2, 3)
+    write_mesh_file(path, meshes, [("a/cube", 0, np.eye(4)), ("b/roof", 1, moved), ("a/again", 0, moved)])
+    level = MeshFile(path)
+    assert level.names == ["a/cube", "b/roof", "a/again"]
+    assert [p.name for p in level.find("a/")] == ["a/cube", "a/again"]
+    for name, (vertices, corners, counts, colors, sided) in [("a/cube", meshes[0]), ("b/roof", meshes[1])]:
+        part = level.part(name)
+        assert part.vertices.tolist() == [list(map(float, v)) for v in vertices]
+        assert part.face_verts.tolist() == corners
+        assert part.face_counts.tolist() == counts
+        assert [tuple(c) for c in part.colors[part.face_materials].tolist()] == colors
+        assert part.double_sided.tolist() == np.broadcast_to(np.asarray(sided, bool), len(counts)).tolist()
+    assert level.part("a/again").matrix.tolist() == moved.tolist()
+    # Parts placing the same mesh share its ranges
+    assert np.shares_memory(level.part("a/cube").vertices, level.part("a/again").vertices)
+
+def test_long_name_is_rejected(tmp_path):
+    path = str(tmp_path / "level.mesh")
+    write_mesh_file(path, [cube()], [("x" * NAME_BYTES, 0, np.eye(4))])
+    with pytest.raises(ValueError):
+        write_mesh_file(path, [cube()], [("x" * (NAME_BYTES + 1), 0, np.eye(4))])
+    with pytest.raises(ValueError):
+        write_mesh_file(path, [cube()], [("é" * (NAME_BYTES // 2 + 1), 0, np.eye(4))])
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+def brute_nearest(px, py, x, y, radius):
+    dist = np.hypot(px - x, py - y)
+    best = int(np.argmin(dist))  # First of equal distances
+    return best if dist[best] < radius else None
+
+@pytest.mark.parametrize("width, height, cell", [(800, 600, 50), (4000, 3000, 10)])
+def test_nearest_matches_brute_force(title, width, height, cell):
+    rng = np.random.default_rng(1)
+    # Points spill past the screen edges and come in coincident pairs
+    px = np.repeat(rng.integers(-2 * cell, width + 2 * cell, 1500), 2)
+    py = np.repeat(rng.integers(-2 * cell, height + 2 * cell, 1500), 2)
+    grid = title.PickGrid(px, py, width, height, cell)
+    for x, y in zip(rng.integers(0, width, 500).tolist(), rng.integers(0, height, 500).tolist()):
+        assert grid.nearest(x, y, cell) == brute_nearest(px, py, x, y, cell)
+
+def test_large_grid_keeps_every_point(title):
+    # More cells than an int16 key can address
+    px = np.array([0, 3999, 3999, 10])
+    py = np.array([0, 2999, 0, 2999])
+    grid = title.PickGrid(px, py, 4000, 3000, 10)
+    assert sorted(grid.order.tolist()) == [0, 1, 2, 3]
+    assert grid.nearest(3998, 2998, 10) == 1
@@ -0,0 +1,20 @@
+import json
+
+from profiler import FrameProfiler
+
+def test_logged_records_export_with_their_frame(tmp_path):
+    path = str(tmp_path / "profile.json")
+    prof = FrameProfiler(enabled=True, export_path=path)
+    prof.end_frame()
+    prof.log("quality", {"from": 0, "to": 1, "frame": 99})
+    prof.end_frame()
+    prof.export()
+    with open(path) as f:
+        data = json.load(f)
+    assert len(data["frames"]) == 2
+    assert data["quality"] == [{"from": 0, "to": 1, "frame": 1}]
+
+def test_nothing_is_logged_without_an_export():
+    prof = FrameProfiler(enabled=True)
+    prof.log("quality", {"from": 0, "to": 1})
+    assert prof.logs == {}
@@ -0,0 +1,76 @@
+import pytest
+
+import quality
+from quality import QualityController
+
+LEVELS = ("best", "good", "cheap")
+
+def run(controller, ms, frames):
+    """Feed the controller frames that each took ms"""
+    for _ in range(frames):
+        controller.update(ms)
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    monkeypatch.setattr("builtins.print", lambda *args, **kwargs: None)
+
+def test_steps_down_one_window_at_a_time():
+    controller = QualityController(LEVELS, budget_ms=10)
+    run(controller, 20, quality.QUALITY_WINDOW - 1)
+    assert controller.level == 0
+    run(controller, 20, 1)
+    assert controller.level == 1
+    run(controller, 20, 10 * quality.QUALITY_WINDOW)
+    assert controller.level == 2  # And no further
+    assert [(c["from"], c["to"]) for c in controller.changes] == [(0, 1), (1, 2)]
+
+def test_steps_up_only_well_under_budget_after_the_hold():
+    controller = QualityController(LEVELS, budget_ms=10, level=2)
+    run(controller, 8, 10 * quality.HOLD_FRAMES)
+    assert controller.level == 2  # Under budget, but not by enough
+    controller = QualityController(LEVELS, budget_ms=10, level=2)
+    run(controller, 1, quality.HOLD_FRAMES - 1)
+    assert controller.level == 2
+    run(controller, 1, 1)
+    assert controller.level == 1
+
+def test_failed_step_up_doubles_hold_which_relaxes_when_stable():
+    controller = QualityController(LEVELS, budget_ms=10, level=1)
+    run(controller, 1, quality.HOLD_FRAMES)
+    assert controller.level == 0
+    run(controller, 20, quality.QUALITY_WINDOW)
+    assert controller.level == 1
+    assert controller.hold == 2 * quality.HOLD_FRAMES
+    for _ in range(6):  # Keep failing
+        run(controller, 1, controller.hold)
+        run(controller, 20, quality.QUALITY_WINDOW)
+    assert controller.hold == quality.MAX_HOLD_FRAMES
+    # A steady scene under budget but too slow to step up: the hold decays back
+    run(controller, 8, 8 * quality.MAX_HOLD_FRAMES)
+    assert controller.hold == quality.HOLD_FRAMES
+    assert controller.level == 1
+
+def test_pinned_level_and_no_budget_never_change(monkeypatch):
+    monkeypatch.setenv(quality.QUALITY_ENV, "2")
+    pinned = QualityController.from_env(LEVELS, 30)
+    monkeypatch.setenv(quality.QUALITY_ENV, "auto")
+    uncapped = QualityController.from_env(LEVELS, 0)
+    for controller, level in ((pinned, 2), (uncapped, 0)):
+        controller.begin_frame()
+        assert not controller.end_frame()
+        assert controller.level == level and not controller.adaptive
+
+def test_pin_keeps_the_level_under_any_load():
+    controller = QualityController(LEVELS, budget_ms=10)
+    controller.pin()
+    for _ in range(10 * quality.QUALITY_WINDOW):
+        controller.begin_frame()
+        controller.frame_start -= 1.0  # A second per frame
+        assert not controller.end_frame()
+    assert controller.level == 0 and not controller.changes
+
+@pytest.mark.parametrize("value", ["high", "-1", "3", "1.5", ""])
+def test_bad_env_value_is_rejected(monkeypatch, value):
+    monkeypatch.setenv(quality.QUALITY_ENV, value)
+    with pytest.raises(ValueError, match=quality.QUALITY_ENV):
+        QualityController.from_env(LEVELS, 30)
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from tiles import TilePool
+from zbuffer import ZBuffer
+
+WIDTH, HEIGHT = 200, 150
+
+def scene(seed, count):
+    """Overlapping triangles, some past the screen edges, with outlined edges"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform((-20, -20), (WIDTH + 20, HEIGHT + 20), (count, 1, 2))
+    corners = centers + rng.uniform(-40, 40, (count, 3, 2))
+    inv_depth = 1.0 / rng.uniform(1, 10, (count, 1)) + rng.uniform(-0.02, 0.02, (count, 3))
+    colors = rng.integers(1, 1 << 24, count)
+    outline = rng.random((count, 3)) < 0.5
+    return corners[..., 0], corners[..., 1], inv_depth, colors, outline
+
+def render(triangles, tiles=None):
+    zbuf = ZBuffer(WIDTH, HEIGHT)
+    pixels = np.zeros((WIDTH, HEIGHT), dtype=np.uint32)
+    zbuf.draw_triangles(pixels, *triangles[:4], outline=triangles[4], outline_color=0xFFFFFFFF, tiles=tiles)
+    return pixels, zbuf.depth
+
+@pytest.mark.parametrize("tile_size", [7, 32, 128])
+def test_tiled_matches_untiled(tile_size):
+    triangles = scene(tile_size, 300)
+    pixels, depth = render(triangles)
+    tiles = TilePool(WIDTH, HEIGHT, workers=1, tile_size=tile_size)
+    tiled_pixels, tiled_depth = render(triangles, tiles)
+    assert (tiled_depth == depth).all()
+    assert (tiled_pixels == pixels).all()
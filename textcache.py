@@ -0,0 +1,66 @@
+"""Rendered-text cache shared by the games.
+
+Fonts are resolved once through font() and every distinct (font, string,
+color) is rendered once:
+
+    title_font = text_cache.font("Arial", 64, bold=True)   # at startup
+    ...
+    screen.blit(text_cache.render(title_font, "ULTRA MARIO 3D", YELLOW), pos)
+
+Strings that change from frame to frame (counters, timers) go through
+blit_glyphs(), which composes the line from cached single-character
+surfaces so a new value never costs a font render. Glyph composition drops
+kerning, which is fine for HUD digits.
+"""
+from collections import OrderedDict
+
+import pygame
+
+MAX_ENTRIES = 512  # Rendered strings kept around; glyphs share the same budget
+
+class TextCache:
+    """Fonts by (name, size, style) and rendered surfaces by (font, text, colors)"""
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.fonts = {}
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, name, size, bold=False, italic=False):
+        key = (name, size, bold, italic)
+        font = self.fonts.get(key)
+        if font is None:
+            font = self.fonts[key] = pygame.font.SysFont(name, size, bold=bold, italic=italic)
+        return font
+
+    def render(self, font, text, color, background=None, antialias=True):
+        key = (font, text, color, background, antialias)
+        img = self.entries.get(key)
+        if img is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return img
+        self.misses += 1
+        img = font.render(text, antialias, color, background)
+        if pygame.display.get_surface() is not None:
+            img = img.convert_alpha() if background is None else img.convert()
+        self.entries[key] = img
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return img
+
+    def size(self, font, text):
+        """Width and height of a line drawn by blit_glyphs"""
+        return sum(self.render(font, ch, (0, 0, 0)).get_width() for ch in text), font.get_linesize()
+
+    def blit_glyphs(self, surface, font, text, color, pos):
+        """Draw a frequently changing string one cached character at a time"""
+        x, y = pos
+        for ch in text:
+            img = self.render(font, ch, color)
+            surface.blit(img, (x, y))
+            x += img.get_width()
+        return pygame.Rect(pos[0], y, x - pos[0], font.get_linesize())
+
+text_cache = TextCache()
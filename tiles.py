@@ -0,0 +1,72 @@
+"""Screen tiles rendered in parallel on a thread pool.
+
+The screen is cut into TILE_SIZE squares. Primitives are binned by their
+screen bounding boxes, and every tile is rasterized on a worker thread:
+
+    pool = TilePool(WIDTH, HEIGHT, workers=8)
+    for tile, items in zip(pool.tiles, pool.bin(x0, y0, x1, y1)):
+        ...                                  # items overlapping tile, in order
+    pool.run(draw_tile, jobs)                # draw_tile(*job) on every worker
+
+Tiles never share a pixel, so workers can write straight into one
+surfarray view and one depth buffer. Only NumPy work on whole tiles
+releases the GIL; the per-tile Python overhead stays serial, so tiles
+must be big enough to amortize it.
+
+The worker count comes from MARIO_WORKERS; 0 or 1 renders serially.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TILE_SIZE = 128  # Pixels per tile side
+RENDER_WORKERS = int(os.environ.get("MARIO_WORKERS", "0"))
+
+class TilePool:
+    """Fixed grid of screen tiles plus the threads that rasterize them"""
+    def __init__(self, width, height, workers=RENDER_WORKERS, tile_size=TILE_SIZE):
+        self.width, self.height = width, height
+        self.tile_size = tile_size
+        self.cols = -(-width // tile_size)
+        self.rows = -(-height // tile_size)
+        # (x0, y0, x1, y1) inclusive, row by row
+        self.tiles = [(x, y, min(x + tile_size, width) - 1, min(y + tile_size, height) - 1)
+                      for y in range(0, height, tile_size) for x in range(0, width, tile_size)]
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(self.workers) if self.workers > 1 else None
+
+    def bin(self, x0, y0, x1, y1):
+        """Indices of the boxes overlapping each tile, in ascending order.
+
+        Boxes are inclusive pixel bounds; parts off screen are ignored and
+        boxes entirely off screen land in no tile.
+        """
+        x0, y0, x1, y1 = (np.asarray(a, dtype=float) for a in (x0, y0, x1, y1))
+        on_screen = np.flatnonzero((x1 >= 0) & (x0 < self.width) & (y1 >= 0) & (y0 < self.height)
+                                   & (x1 >= x0) & (y1 >= y0))
+        size = self.tile_size
+        tx0 = np.clip(x0[on_screen] // size, 0, self.cols - 1).astype(np.intp)
+        tx1 = np.clip(x1[on_screen] // size, 0, self.cols - 1).astype(np.intp)
+        ty0 = np.clip(y0[on_screen] // size, 0, self.rows - 1).astype(np.intp)
+        ty1 = np.clip(y1[on_screen] // size, 0, self.rows - 1).astype(np.intp)
+        # One (box, tile) pair per covered tile, then grouped by tile
+        nx = tx1 - tx0 + 1
+        n = nx * (ty1 - ty0 + 1)
+        box = np.repeat(np.arange(len(on_screen)), n)
+        local = np.arange(len(box)) - np.repeat(np.cumsum(n) - n, n)
+        tile = (ty0[box] + local // nx[box]) * self.cols + tx0[box] + local % nx[box]
+        order = np.argsort(tile, kind='stable')
+        ends = np.cumsum(np.bincount(tile, minlength=len(self.tiles)))
+        return np.split(on_screen[box[order]], ends[:-1])
+
+    def run(self, fn, jobs):
+        """fn(*job) for every job, spread over the workers; returns the results in order"""
+        if self.executor is None:
+            return [fn(*job) for job in jobs]
+        return list(self.executor.map(lambda job: fn(*job), jobs))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
@@ -0,0 +1,64 @@
+"""Fixed-timestep helpers shared by the games.
+
+Simulation advances in whole ticks of 1/hz seconds no matter how long a
+rendered frame took; rendering then blends the last two simulation states
+by FixedTimestep.alpha. A slow frame costs smoothness, never game speed,
+and the same inputs always produce the same ticks.
+
+Every game also accepts `--sim N`, which runs N simulation ticks with no
+rendering and reports the tick rate.
+"""
+import sys
+import time
+
+MAX_FRAME_TIME = 0.25  # Longest frame fed to the accumulator (avoids a spiral of death)
+
+class FixedTimestep:
+    """Turns variable frame times into a whole number of fixed simulation ticks"""
+    def __init__(self, hz, max_frame_time=MAX_FRAME_TIME):
+        self.dt = 1.0 / hz
+        self.max_frame_time = max_frame_time
+        self.accumulator = 0.0
+        self.ticks = 0
+
+    def advance(self, frame_time):
+        """Add a frame's duration (seconds) and return how many ticks to run"""
+        self.accumulator += min(frame_time, self.max_frame_time)
+        # The epsilon keeps a frame of exactly one tick from rounding down to zero
+        steps = int((self.accumulator + 1e-9) // self.dt)
+        self.accumulator = max(0.0, self.accumulator - steps * self.dt)
+        self.ticks += steps
+        return steps
+
+    @property
+    def alpha(self):
+        """How far rendering sits between the previous and the current tick"""
+        return min(1.0, self.accumulator / self.dt)
+
+def lerp(a, b, t):
+    return a + (b - a) * t
+
+class HeldKeys:
+    """Stand-in for pygame.key.get_pressed() holding a fixed set of keys"""
+    def __init__(self, keys=()):
+        self.keys = set(keys)
+
+    def __getitem__(self, key):
+        return key in self.keys
+
+def sim_ticks_from_argv(argv=None):
+    """Tick count given as `--sim N` on the command line, or None"""
+    argv = sys.argv[1:] if argv is None else argv
+    if "--sim" not in argv:
+        return None
+    i = argv.index("--sim")
+    return int(argv[i + 1]) if i + 1 < len(argv) else 10000
+
+def run_simulation(step, ticks):
+    """Call step(tick) ticks times without rendering and report the rate"""
+    start = time.perf_counter()
+    for tick in range(ticks):
+        step(tick)
+    elapsed = time.perf_counter() - start
+    print("%d ticks in %.3f s (%.0f ticks/s)" % (ticks, elapsed, ticks / elapsed if elapsed else float("inf")))
+    return elapsed
@@ -1,13 +1,53 @@
 import pygame
 import math
 import random
+import os
+import hashlib
+import sys
+from collections import OrderedDict
+import numpy as np
+from profiler import FrameProfiler
+from textcache import text_cache
+from dirtyrects import DirtyRectPresenter
+from scenegraph import SceneNode, transform_matrix, transform_matrices
+from zbuffer import ZBuffer
+from depthsort import DepthSorter
+from tiles import TilePool, RENDER_WORKERS
+from lod import LodLevels, lod_quality
+from meshfile import MeshFile, write_mesh_file
+from atlas import SpriteAtlas
+from inputlog import InputLog
+from quality import QualityController, QUALITY_ENV
+from timestep import FixedTimestep, HeldKeys, lerp, run_simulation, sim_ticks_from_argv
 
 # --- CONFIGURATION ---
 WIDTH, HEIGHT = 800, 600
-FPS = 30
+FPS = 30           # Render frame cap; 0 renders as fast as the machine allows
+SIM_HZ = 30        # Simulation ticks per second (gameplay speeds are tuned per tick)
 FOV = 500
 VIEW_DIST = 6
 SCALE = 100
+SPRITE_SIZE_STEP = 2            # Scaled sprite sizes snap to multiples of this (px)
+SPRITE_CACHE_PIXELS = 1 << 22   # Total w*h of scaled sprites kept around
+YAW_BINS = 720                  # Camera-yaw bins precomputed for static geometry
+YAW_TABLE_BUDGET = 1 << 20      # Bytes the per-bin static draw orders may use
+ACTOR_LOD_PIXELS = (12, 1.5)    # Projected actor radius from which the full / proxy-box level is used
+# Quality steps from best to cheapest, walked down under load (see quality.py)
+QUALITY_LEVELS = (
+    {"render_scale": 1.0, "outlines": True, "sprite_step": SPRITE_SIZE_STEP, "lod_bias": 1.0},
+    {"render_scale": 1.0, "outlines": False, "sprite_step": SPRITE_SIZE_STEP, "lod_bias": 1.0},
+    {"render_scale": 1.0, "outlines": False, "sprite_step": 4 * SPRITE_SIZE_STEP, "lod_bias": 0.7},
+    {"render_scale": 0.75, "outlines": False, "sprite_step": 4 * SPRITE_SIZE_STEP, "lod_bias": 0.7},
+    {"render_scale": 0.5, "outlines": False, "sprite_step": 8 * SPRITE_SIZE_STEP, "lod_bias": 0.5},
+)
+RENDER_BACKEND = os.environ.get("MARIO_RENDERER", "painter")  # "painter" or "zbuffer"; F4 toggles
+CACHE_DIR = os.environ.get("MARIO_CACHE_DIR",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+LEVEL_PATH = os.environ.get("MARIO_LEVEL",
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), "levels", "castle.mesh"))
+
+prof = FrameProfiler.from_env()
+quality = QualityController.from_env(QUALITY_LEVELS, FPS)
 
 # --- GAME STATES ---
 STATE_MENU = "menu"
@@ -71,6 +111,17 @@ def create_window_sprite():
     pygame.draw.circle(surf, (255, 200, 100), (32, 18), 6)
     return surf
 
+# Every sprite variant drawn in game, generated once into the atlas
+SPRITES = {
+    'eye_open': (create_eye_sprite, ('open',)),
+    'eye_closed': (create_eye_sprite, ('closed',)),
+    'mouth_neutral': (create_mouth_sprite, ('neutral',)),
+    'mouth_smile': (create_mouth_sprite, ('smile',)),
+    'mouth_open': (create_mouth_sprite, ('open',)),
+    'window': (create_window_sprite, ()),
+}
+sprites = SpriteAtlas(SPRITES, CACHE_DIR)
+
 # --- 3D MATH ENGINE ---
 
 class Vector3:
@@ -99,111 +150,417 @@ def project(x, y, z, width, height, scale_factor=1.0):
     py = -y * factor + height / 2
     return (int(px), int(py), factor)
 
+# --- RENDER QUEUE ---
+ITEM_POLY, ITEM_SPRITE = 0, 1
+
+class MaterialTable:
+    """Interns colors and sprite surfaces as small integer IDs"""
+    def __init__(self):
+        self.items = []
+        self.ids = {}
+
+    def id(self, value):
+        i = self.ids.get(value)
+        if i is None:
+            i = self.ids[value] = len(self.items)
+            self.items.append(value)
+        return i
+
+materials = MaterialTable()
+
+class RenderQueue:
+    """Columnar render list reused across frames.
+
+    Each row is one polygon or sprite: kind, depth, a [start, start+count)
+    range in the shared vertex pool, a material ID (color or sprite surface)
+    and a sprite size. Arrays only grow; clear() just rewinds the counters.
+    """
+    ITEM_DTYPE = np.dtype([
+        ('kind', np.uint8), ('z', np.float64), ('start', np.int32),
+        ('count', np.int32), ('material', np.int32), ('size', np.float64)
+    ])
+
+    def __init__(self, capacity=256, vertex_capacity=1024):
+        self.items = np.zeros(capacity, self.ITEM_DTYPE)
+        self.verts = np.zeros((vertex_capacity, 3))
+        self.n = 0   # Items in use
+        self.nv = 0  # Vertices in use
+        self.presorted = None  # (start, count) of items already in back-to-front order
+
+    def clear(self):
+        self.n = self.nv = 0
+        self.presorted = None
+
+    def reserve(self, items, verts):
+        if self.n + items > len(self.items):
+            grown = np.zeros(max(2 * len(self.items), self.n + items), self.ITEM_DTYPE)
+            grown[:self.n] = self.items[:self.n]
+            self.items = grown
+        if self.nv + verts > len(self.verts):
+            grown = np.zeros((max(2 * len(self.verts), self.nv + verts), 3))
+            grown[:self.nv] = self.verts[:self.nv]
+            self.verts = grown
+
+    def add_polygons(self, verts, counts, z, material):
+        """Append polygons whose vertices are stored back to back in verts"""
+        k, m = len(counts), len(verts)
+        self.reserve(k, m)
+        rows = self.items[self.n:self.n + k]
+        rows['kind'] = ITEM_POLY
+        rows['z'] = z
+        ends = np.cumsum(counts)
+        rows['start'] = ends - counts + self.nv
+        rows['count'] = counts
+        rows['material'] = material
+        self.verts[self.nv:self.nv + m] = verts
+        self.n += k
+        self.nv += m
+
+    def mark_presorted(self, start, count):
+        """Items [start, start+count) are back to front already; render_scene merges into them"""
+        self.presorted = (start, count)
+
+    def add_sprite(self, pos, size, img, z=None):
+        """Append a sprite; z defaults to the depth of pos"""
+        self.reserve(1, 1)
+        self.items[self.n] = (ITEM_SPRITE, pos[2] if z is None else z, self.nv, 1, materials.id(img), size)
+        self.verts[self.nv] = pos
+        self.n += 1
+        self.nv += 1
+
+    def add_sprites(self, pos, size, img, z=None):
+        """Append one sprite per row of pos (k, 3), all sharing size and img"""
+        k = len(pos)
+        self.reserve(k, k)
+        rows = self.items[self.n:self.n + k]
+        rows['kind'] = ITEM_SPRITE
+        rows['z'] = pos[:, 2] if z is None else z
+        rows['start'] = np.arange(self.nv, self.nv + k)
+        rows['count'] = 1
+        rows['material'] = materials.id(img)
+        rows['size'] = size
+        self.verts[self.nv:self.nv + k] = pos
+        self.n += k
+        self.nv += k
+
+class CullStats:
+    """Faces submitted to / rejected by backface culling, per frame"""
+    def __init__(self):
+        self.submitted = self.culled = 0
+        self.last_submitted = self.last_culled = 0
+
+    def add(self, submitted, culled):
+        self.submitted += submitted
+        self.culled += culled
+
+    def next_frame(self):
+        self.last_submitted, self.last_culled = self.submitted, self.culled
+        self.submitted = self.culled = 0
+
+cull_stats = CullStats()
+
 class Mesh:
     """Represents a 3D part"""
+    face_colors = None    # Per-face colors; None means every face uses self.color
+    double_sided = False  # Skip backface culling (bool, or one bool per face)
+
     def __init__(self, w, h, d, color):
         self.w, self.h, self.d = w, h, d
         self.color = color
-        self.vertices = [
-            Vector3(-w/2, -h/2, -d/2), Vector3(w/2, -h/2, -d/2),
-            Vector3(w/2, h/2, -d/2),   Vector3(-w/2, h/2, -d/2),
-            Vector3(-w/2, -h/2, d/2),  Vector3(w/2, -h/2, d/2),
-            Vector3(w/2, h/2, d/2),    Vector3(-w/2, h/2, d/2)
-        ]
+        self.vertices = np.array([
+            (-w/2, -h/2, -d/2), (w/2, -h/2, -d/2),
+            (w/2, h/2, -d/2),   (-w/2, h/2, -d/2),
+            (-w/2, -h/2, d/2),  (w/2, -h/2, d/2),
+            (w/2, h/2, d/2),    (-w/2, h/2, d/2)
+        ], dtype=float)
         self.faces = [
             (0, 1, 2, 3), (5, 4, 7, 6), (4, 0, 3, 7),
             (1, 5, 6, 2), (3, 2, 6, 7), (4, 5, 1, 0)
         ]
+        self.build_face_index()
 
-    def get_world_polygons(self, px, py, pz, rx, ry, rz, sx=1, sy=1, sz=1):
-        transformed_verts = []
-        for v in self.vertices:
-            tx, ty, tz = v.x * sx, v.y * sy, v.z * sz
-            tx, ty, tz = rotate_x(tx, ty, tz, rx)
-            tx, ty, tz = rotate_y(tx, ty, tz, ry)
-            tx, ty, tz = rotate_z(tx, ty, tz, rz)
-            transformed_verts.append((tx + px, ty + py, tz + pz))
-            
-        polygons = []
-        for face_indices in self.faces:
-            points_3d = [transformed_verts[i] for i in face_indices]
-            # Updated to support triangles (len 3) or quads (len 4)
-            avg_z = sum(p[2] for p in points_3d) / len(points_3d)
-            
-            # Basic Backface Culling
-            if len(points_3d) >= 3:
-                v1 = (points_3d[1][0] - points_3d[0][0], points_3d[1][1] - points_3d[0][1], points_3d[1][2] - points_3d[0][2])
-                v2 = (points_3d[2][0] - points_3d[1][0], points_3d[2][1] - points_3d[1][1], points_3d[2][2] - points_3d[1][2])
-                normal_z = v1[0]*v2[1] - v1[1]*v2[0]
-                # if normal_z > 0: 
-                polygons.append({ 'type': 'poly', 'z': avg_z, 'points_3d': points_3d, 'color': self.color })
-        return polygons
+    def build_face_index(self):
+        # Faces flattened back to back, as the render queue stores them
+        self.face_verts = np.array([i for f in self.faces for i in f], dtype=np.intp)
+        self.face_counts = np.array([len(f) for f in self.faces], dtype=np.int32)
+        colors = self.face_colors or [self.color] * len(self.faces)
+        self.face_materials = np.array([materials.id(c) for c in colors], dtype=np.int32)
+        self.build_batch()
+
+    @classmethod
+    def from_arrays(cls, vertices, face_verts, face_counts, face_materials, double_sided=False):
+        """Mesh over flat face arrays, which are kept as given (no copy)"""
+        mesh = cls.__new__(cls)
+        mesh.color = None
+        mesh.vertices = vertices
+        mesh.face_verts, mesh.face_counts, mesh.face_materials = face_verts, face_counts, face_materials
+        mesh.double_sided = double_sided
+        mesh.build_batch()
+        return mesh
+
+    @classmethod
+    def from_part(cls, part):
+        """Mesh over a meshfile.MeshPart's views, with its colors interned as materials"""
+        ids = np.array([materials.id(tuple(int(c) for c in rgb)) for rgb in part.colors], dtype=np.int32)
+        return cls.from_arrays(part.vertices, part.face_verts, part.face_counts, ids[part.face_materials],
+                               part.double_sided)
+
+    def build_batch(self):
+        # Homogeneous rows: vertices, face centroids, then outward face normals
+        # (w = 0, so they rotate but do not translate). The transform is affine,
+        # so one matmul yields world vertices, each face's average z and the
+        # normals needed for culling. That average is rounded differently from
+        # averaging the transformed vertices: faces whose depths tied exactly
+        # that way (roof sides, the bridge and the moat) can now differ by an
+        # ulp, either way round, and swap draw order.
+        starts = np.cumsum(self.face_counts) - self.face_counts
+        corners = self.vertices[self.face_verts]
+        centroids = np.add.reduceat(corners, starts, axis=0) / self.face_counts[:, None]
+        # Faces wind clockwise seen from outside, so (v1-v0) x (v2-v1) points inward
+        v0, v1, v2 = (corners[starts + i] for i in range(3))
+        normals = -np.cross(v1 - v0, v2 - v1)
+        self.batch = np.vstack([
+            np.hstack([self.vertices, np.ones((len(self.vertices), 1))]),
+            np.hstack([centroids, np.ones((len(centroids), 1))]),
+            np.hstack([normals, np.zeros((len(normals), 1))])
+        ])
+        self.vertex_count = len(self.vertices)
+        self.face_count = len(self.face_counts)
+
+    def submit(self, queue, px, py, pz, rx, ry, rz, sx=1, sy=1, sz=1, material=None):
+        """Transform, cull and append the faces to queue (material overrides the colors)"""
+        normal_matrix = None
+        if not sx == sy == sz == 1:
+            # Normals transform by the inverse scale (assumes positive scale factors)
+            normal_matrix = transform_matrix(0, 0, 0, rx, ry, rz, 1/sx, 1/sy, 1/sz)
+        self.submit_matrix(queue, transform_matrix(px, py, pz, rx, ry, rz, sx, sy, sz),
+                           normal_matrix, material)
+
+    def submit_matrix(self, queue, matrix, normal_matrix=None, material=None):
+        """submit() with a 4x4 world matrix, e.g. SceneNode.world.
+
+        normal_matrix is needed only when matrix scales; rigid matrices
+        carry the normals along with everything else.
+        """
+        self.submit_instances(queue, matrix[None], None if normal_matrix is None else normal_matrix[None],
+                              None if material is None else (material,))
+
+    def submit_instances(self, queue, matrices, normal_matrices=None, materials=None):
+        """Transform, cull and queue k copies at once.
+
+        matrices is (k, 4, 4), normal_matrices likewise (only needed when they
+        scale), and materials one material per copy (None keeps the mesh's
+        own colors). Copies are queued in order, as k submit_matrix() calls
+        would, but every stage runs on all of them together.
+        """
+        k = len(matrices)
+        world = np.matmul(self.batch, matrices[:, :, :3])  # (k, rows, 3)
+        n, f = self.vertex_count, self.face_count
+        centroids = world[:, n:n+f]
+        if normal_matrices is None:
+            normals = world[:, n+f:]
+        else:
+            normals = np.matmul(self.batch[n+f:], normal_matrices[:, :, :3])
+
+        # Backface culling against the perspective camera at (0, 0, -VIEW_DIST)
+        facing = (normals[..., 0] * centroids[..., 0] + normals[..., 1] * centroids[..., 1]
+                  + normals[..., 2] * (centroids[..., 2] + VIEW_DIST)) < 0
+        facing |= self.double_sided
+        shown = int(np.count_nonzero(facing))
+        cull_stats.add(k * f, k * f - shown)
+        if not shown:
+            return
+
+        counts = np.broadcast_to(self.face_counts, (k, f))[facing]
+        verts = world[:, self.face_verts][np.repeat(facing, self.face_counts, axis=1)]
+        if materials is None:
+            face_materials = np.broadcast_to(self.face_materials, (k, f))[facing]
+        else:
+            face_materials = np.broadcast_to(np.asarray(materials)[:, None], (k, f))[facing]
+        queue.add_polygons(verts, counts, centroids[..., 2][facing], face_materials)
 
 class PyramidMesh(Mesh):
     """Represents a Roof/Spire"""
     def __init__(self, w, h, d, color):
         self.w, self.h, self.d = w, h, d
         self.color = color
-        self.vertices = [
-            Vector3(0, h/2, 0),          # 0: Apex
-            Vector3(-w/2, -h/2, -d/2),   # 1: FL
-            Vector3(w/2, -h/2, -d/2),    # 2: FR
-            Vector3(w/2, -h/2, d/2),     # 3: BR
-            Vector3(-w/2, -h/2, d/2)     # 4: BL
-        ]
+        self.vertices = np.array([
+            (0, h/2, 0),          # 0: Apex
+            (-w/2, -h/2, -d/2),   # 1: FL
+            (w/2, -h/2, -d/2),    # 2: FR
+            (w/2, -h/2, d/2),     # 3: BR
+            (-w/2, -h/2, d/2)     # 4: BL
+        ], dtype=float)
         self.faces = [
             (0, 1, 2), (0, 2, 3), (0, 3, 4), (0, 4, 1), # Sides
             (4, 3, 2, 1) # Bottom
         ]
+        self.build_face_index()
+
+class StaticBatch(Mesh):
+    """Static parts baked into one vertex/face buffer.
+
+    parts is a list of (mesh, matrix) with 4x4 matrices placing each mesh in
+    the batch's space, so the whole batch can then be transformed as a
+    single mesh.
+    """
+    def __init__(self, parts):
+        vertices, face_verts, face_materials, double_sided = [], [], [], []
+        base = 0
+        for mesh, matrix in parts:
+            vertices.append(mesh.vertices @ matrix[:3, :3] + matrix[3, :3])
+            face_verts.append(mesh.face_verts + base)
+            face_materials.append(mesh.face_materials)
+            double_sided.append(np.broadcast_to(mesh.double_sided, mesh.face_count))
+            base += len(mesh.vertices)
+        self.color = None
+        self.vertices = np.vstack(vertices)
+        self.face_verts = np.concatenate(face_verts)
+        self.face_counts = np.concatenate([mesh.face_counts for mesh, _ in parts])
+        self.face_materials = np.concatenate(face_materials)
+        self.double_sided = np.concatenate(double_sided)
+        self.build_batch()
+
+    @classmethod
+    def from_tree(cls, root):
+        """Bake every mesh below root, placed relative to root"""
+        parts, stack = [], [(child, child.local) for child in reversed(root.children)]
+        while stack:
+            node, matrix = stack.pop()
+            if node.mesh is not None:
+                parts.append((node.mesh, matrix))
+            stack.extend((child, child.local @ matrix) for child in reversed(node.children))
+        return cls(parts)
+
+    def submit_yaw(self, queue, matrix, table):
+        """Submit with a pure yaw matrix using table's precomputed culling and order"""
+        yaw = math.atan2(matrix[2, 0], matrix[0, 0])
+        faces, verts = table.lookup(yaw)
+        f = self.face_count
+        cull_stats.add(f, f - len(faces))
+        if not len(faces):
+            return
+        n = self.vertex_count
+        world = self.batch[:n] @ matrix[:, :3]
+        z = self.batch[n:n+f][faces] @ matrix[:, 2]
+        start = queue.n
+        queue.add_polygons(world[verts], self.face_counts[faces], z, self.face_materials[faces])
+        queue.mark_presorted(start, len(faces))
+
+class YawVisibility:
+    """Visible faces of a static mesh per camera-yaw bin, back to front.
+
+    Valid while the mesh is only ever turned about y around the origin, like
+    the castle under the orbiting camera. A bin keeps every face that faces
+    the camera anywhere inside it (conservative culling), ordered by centroid
+    depth at the bin centre. Tables are cached in CACHE_DIR keyed by the
+    geometry, and the bin count shrinks to fit the byte budget.
+    """
+    def __init__(self, mesh, bins=YAW_BINS, budget=YAW_TABLE_BUDGET, cache_dir=CACHE_DIR):
+        f = mesh.face_count
+        dtype = np.int16 if f < (1 << 15) else np.int32
+        self.bins = max(1, min(bins, budget // max(1, f * np.dtype(dtype).itemsize)))
+        self.width = 2 * math.pi / self.bins
+        self.mesh = mesh
+        key = hashlib.sha1(mesh.batch.tobytes() + np.asarray(mesh.double_sided).tobytes()
+                           + repr((self.bins, VIEW_DIST)).encode()).hexdigest()[:16]
+        path = os.path.join(cache_dir, "yaw-%s.npz" % key) if cache_dir else None
+        if path and os.path.exists(path):
+            with np.load(path) as data:
+                self.faces, self.offsets = data['faces'], data['offsets']
+        else:
+            self.faces, self.offsets = self.build(mesh, dtype)
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp = "%s.%d.tmp" % (path, os.getpid())  # Moved into place whole
+                with open(tmp, 'wb') as f:
+                    np.savez(f, faces=self.faces, offsets=self.offsets)
+                os.replace(tmp, path)
+        # Face start in the mesh's flat face_verts, for gathering a bin's vertices
+        self.face_starts = np.cumsum(mesh.face_counts) - mesh.face_counts
+        self.last_bin = None
+
+    def build(self, mesh, dtype):
+        n, f = mesh.vertex_count, mesh.face_count
+        centroids = mesh.batch[n:n+f, :3]
+        normals = mesh.batch[n+f:, :3]
+        lo = (np.arange(self.bins) - 0.5)[:, None] * self.width
+        centre = np.arange(self.bins)[:, None] * self.width
+        # After a yaw of t the normal's z is A cos t + B sin t = R cos(t - phi),
+        # while n . c stays put; a face is visible in a bin if
+        # n . c + VIEW_DIST * n_z < 0 for some angle in it
+        A, B = normals[:, 2], -normals[:, 0]
+        nz_min = np.minimum(A * np.cos(lo) + B * np.sin(lo),
+                            A * np.cos(lo + self.width) + B * np.sin(lo + self.width))
+        lowest = np.arctan2(B, A) + math.pi  # Angle where n_z bottoms out at -R
+        inside = np.mod(lowest - lo, 2 * math.pi) <= self.width
+        nz_min = np.where(inside, -np.hypot(A, B), nz_min)
+        visible = ((normals * centroids).sum(axis=1) + VIEW_DIST * nz_min) < 0
+        visible |= mesh.double_sided
+        z = -centroids[:, 0] * np.sin(centre) + centroids[:, 2] * np.cos(centre)
+
+        faces, offsets = [], [0]
+        index = np.arange(f)
+        for b in range(self.bins):
+            shown = index[visible[b]]
+            # Back to front; equal depths keep face order, like the runtime sort
+            shown = shown[np.lexsort((shown, -z[b, shown]))]
+            faces.append(shown)
+            offsets.append(offsets[-1] + len(shown))
+        return np.concatenate(faces).astype(dtype), np.array(offsets, dtype=np.int64)
+
+    def lookup(self, yaw):
+        """(face indices, flat vertex indices) for the bin holding yaw"""
+        b = int(round(yaw / self.width)) % self.bins
+        if b != self.last_bin:
+            faces = self.faces[self.offsets[b]:self.offsets[b + 1]].astype(np.intp)
+            counts = self.mesh.face_counts[faces]
+            ends = np.cumsum(counts)
+            within = np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - counts, counts)
+            verts = self.mesh.face_verts[np.repeat(self.face_starts[faces], counts) + within]
+            self.last_bin, self.last = b, (faces, verts)
+        return self.last
+
+def is_yaw_only(matrix):
+    """True for a pure rotation about y through the origin"""
+    return (abs(matrix[1, 1] - 1) < 1e-12 and not matrix[3, :3].any()
+            and not matrix[1, [0, 2]].any() and not matrix[[0, 2], 1].any())
+
+def submit_node(queue, node, mesh=None):
+    """Submit one scene node's mesh (or the given one) with its cached world matrix"""
+    normal_matrix = None if node.rigid else node.normal_matrix
+    (mesh or node.mesh).submit_matrix(queue, node.world, normal_matrix, node.material)
+
+def submit_tree(queue, root):
+    for node in root.walk():
+        if node.mesh is not None:
+            submit_node(queue, node)
 
 # --- GAME OBJECTS ---
 
 class Castle:
-    def __init__(self):
-        self.parts = []
-        self.window_sprite = create_window_sprite()
-        
-        # 1. Main Tower
-        self.parts.append({'mesh': Mesh(4, 3, 4, WALL_WHITE), 'pos': (0, 0, 0)})
-        self.parts.append({'mesh': PyramidMesh(4.5, 2, 4.5, RED_ROOF), 'pos': (0, 2.5, 0)})
-        
-        # 2. Side Towers
-        offsets = [(-3, -2), (3, -2), (-3, 2), (3, 2)]
-        for ox, oz in offsets:
-            self.parts.append({'mesh': Mesh(1.5, 4, 1.5, WALL_WHITE), 'pos': (ox, -0.5, oz)})
-            self.parts.append({'mesh': PyramidMesh(1.8, 1.5, 1.8, RED_ROOF), 'pos': (ox, 2.0, oz)})
-            
-        # 3. Bridge
-        self.parts.append({'mesh': Mesh(2, 0.2, 6, BROWN), 'pos': (0, -1.5, 5)})
-        
-        # 4. Water/Moat
-        self.parts.append({'mesh': Mesh(15, 0.1, 10, WATER_BLUE), 'pos': (0, -2.0, 5)})
+    def __init__(self, parent=None, level=None):
+        self.root = SceneNode(parent)  # Turned by the camera
+        self.window_sprite = sprites['window']
 
-    def get_render_data(self, cam_angle_y):
-        render_list = []
-        
-        # Add stained glass window sprite
-        # We need to manually rotate the sprite position around the world origin (0,0,0) based on camera
-        wx, wy, wz = 0, 0.5, 2.1 # Local position on castle front
-        rwx, rwy, rwz = rotate_y(wx, wy, wz, cam_angle_y)
-        
-        render_list.append({
-            'type': 'sprite',
-            'z': rwz,
-            'pos': (rwx, rwy, rwz),
-            'img': self.window_sprite,
-            'size': 0.8
-        })
-
-        for part in self.parts:
-            # Rotate part POSITION around world center (0,0,0) by camera angle
-            px, py, pz = part['pos']
-            rpx, rpy, rpz = rotate_y(px, py, pz, cam_angle_y)
-            
-            # Rotate part GEOMETRY by camera angle
-            render_list.extend(part['mesh'].get_world_polygons(rpx, rpy, rpz, 0, cam_angle_y, 0))
-            
-        return render_list
+        # Stained glass window sprite on the castle front
+        self.window = SceneNode(self.root, pos=(0, 0.5, 2.1))
+
+        # The parts come from the level file and never move, so bake them
+        # once; each frame only the camera turns them. Baking transforms the
+        # mapped vertices into new world-space arrays: the file's views only
+        # save parsing, they are not what the renderer draws from
+        level = level or load_level()
+        self.static = StaticBatch([(Mesh.from_part(part), part.matrix) for part in level.find("castle/")])
+        self.visibility = YawVisibility(self.static)
+
+    def get_render_data(self, queue):
+        queue.add_sprite(self.window.world_position, 0.8, self.window_sprite)
+        world = self.root.world
+        if is_yaw_only(world):
+            self.static.submit_yaw(queue, world, self.visibility)
+        else:
+            self.static.submit_matrix(queue, world)
 
 class MarioHead:
     def __init__(self):
@@ -212,183 +569,602 @@ class MarioHead:
         self.hat_brim = Mesh(2.2, 0.2, 1.0, RED)
         self.nose_mesh = Mesh(0.6, 0.5, 0.6, SKIN)
         self.mustache_mesh = Mesh(1.2, 0.3, 0.2, BLACK)
-        self.sprites = {
-            'eye_open': create_eye_sprite('open'),
-            'eye_closed': create_eye_sprite('closed'),
-            'mouth_neutral': create_mouth_sprite('neutral'),
-            'mouth_smile': create_mouth_sprite('smile'),
-            'mouth_open': create_mouth_sprite('open')
-        }
+        self.sprites = {name: sprites[name] for name in
+                        ('eye_open', 'eye_closed', 'mouth_neutral', 'mouth_smile', 'mouth_open')}
         self.blink_timer = 0
         self.eye_state = 'eye_open'
 
-    def get_render_data(self, mx, my, time_val):
-        render_list = []
-        rot_x, rot_y = my * 0.5, mx * 0.5
-        
-        def t(ox, oy, oz):
-            tx, ty, tz = rotate_x(ox, oy, oz, rot_x)
-            tx, ty, tz = rotate_y(tx, ty, tz, rot_y)
-            return 0 + tx, 0 + ty, -1 + tz
+        # The mouse turns the root; every part follows it
+        self.root = SceneNode(pos=(0, 0, -1))
+        SceneNode(self.root, mesh=self.face_mesh)
+        SceneNode(self.root, pos=(0, 0.8, 0), mesh=self.hat_dome)
+        SceneNode(self.root, pos=(0, 0.7, 0.8), rot=(0.2, 0, 0), mesh=self.hat_brim)
+        SceneNode(self.root, pos=(0, -0.1, 1.0), mesh=self.nose_mesh)
+        SceneNode(self.root, pos=(0, -0.4, 1.05), mesh=self.mustache_mesh)
+        self.left_eye = SceneNode(self.root, pos=(-0.4, 0.2, 0.92))
+        self.right_eye = SceneNode(self.root, pos=(0.4, 0.2, 0.92))
+        self.mouth = SceneNode(self.root, pos=(0, -0.6, 0.9))
 
-        # Geometry
-        render_list.extend(self.face_mesh.get_world_polygons(*t(0,0,0), rot_x, rot_y, 0))
-        render_list.extend(self.hat_dome.get_world_polygons(*t(0,0.8,0), rot_x, rot_y, 0))
-        render_list.extend(self.hat_brim.get_world_polygons(*t(0,0.7,0.8), rot_x+0.2, rot_y, 0))
-        render_list.extend(self.nose_mesh.get_world_polygons(*t(0,-0.1,1.0), rot_x, rot_y, 0))
-        render_list.extend(self.mustache_mesh.get_world_polygons(*t(0,-0.4,1.05), rot_x, rot_y, 0))
-        
-        # Eyes/Mouth Logic
+    def tick(self):
         self.blink_timer += 1
         if self.blink_timer > 150: self.eye_state = 'eye_closed'
         if self.blink_timer > 155: self.eye_state, self.blink_timer = 'eye_open', 0
-            
-        lex, ley, lez = t(-0.4, 0.2, 0.92)
-        rex, rey, rez = t(0.4, 0.2, 0.92)
-        mox, moy, moz = t(0, -0.6, 0.9)
-        
-        render_list.append({'type':'sprite', 'z':lez, 'pos':(lex,ley,lez), 'img':self.sprites[self.eye_state], 'size':0.4})
-        render_list.append({'type':'sprite', 'z':rez, 'pos':(rex,rey,rez), 'img':self.sprites[self.eye_state], 'size':0.4})
-        render_list.append({'type':'sprite', 'z':moz, 'pos':(mox,moy,moz), 'img':self.sprites['mouth_neutral'], 'size':0.5})
 
-        return render_list
+    def get_render_data(self, queue, mx, my, time_val):
+        self.root.set_rotation(my * 0.5, mx * 0.5, 0)
+
+        # Geometry
+        submit_tree(queue, self.root)
+        
+        # Eyes/Mouth (blinking advances in tick())
+        queue.add_sprite(self.left_eye.world_position, 0.4, self.sprites[self.eye_state])
+        queue.add_sprite(self.right_eye.world_position, 0.4, self.sprites[self.eye_state])
+        queue.add_sprite(self.mouth.world_position, 0.5, self.sprites['mouth_neutral'])
 
 class MarioActor:
-    def __init__(self):
+    def __init__(self, parent=None):
         self.body = Mesh(0.5, 0.6, 0.4, BLUE)
         self.head = Mesh(0.4, 0.4, 0.4, SKIN)
         self.limb = Mesh(0.15, 0.4, 0.15, RED)
         self.limb_b = Mesh(0.15, 0.4, 0.15, BLUE)
         self.pos = Vector3(0, -1.2, 4) # Start on bridge
         self.yaw = 0
-        self.face = create_eye_sprite('open')
+        self.face = sprites['eye_open']  # Same atlas region as MarioHead's open eye
 
-    def get_render_data(self, time_val, cam_angle_y):
-        render_list = []
-        gx, gy, gz = self.pos.x, self.pos.y, self.pos.z
-        
-        def add(mesh, ox, oy, oz, rx, color=None):
-            # Rotate offset by Actor Yaw
-            tox, toy, toz = rotate_y(ox, oy, oz, self.yaw)
-            # Global Pos
-            fx, fy, fz = gx + tox, gy + toy, gz + toz
-            # Rotate Global Pos by Camera
-            cfx, cfy, cfz = rotate_y(fx, fy, fz, cam_angle_y)
-            polys = mesh.get_world_polygons(cfx, cfy, cfz, rx, self.yaw + cam_angle_y, 0)
-            if color: 
-                for p in polys: p['color'] = color
-            render_list.extend(polys)
-            return cfx, cfy, cfz
+        # Root carries position and yaw; limbs swing about x under it
+        self.root = SceneNode(parent)
+        self.body_node = SceneNode(self.root, pos=(0, -0.5, 0), mesh=self.body)
+        self.head_node = SceneNode(self.root, pos=(0, 0.1, 0), mesh=self.head)
+        self.limbs = [
+            SceneNode(self.root, pos=(-0.3, -0.5, 0), mesh=self.limb, material=materials.id(RED)),
+            SceneNode(self.root, pos=(0.3, -0.5, 0), mesh=self.limb, material=materials.id(RED)),
+            SceneNode(self.root, pos=(-0.2, -1.0, 0), mesh=self.limb_b, material=materials.id(BLUE)),
+            SceneNode(self.root, pos=(0.2, -1.0, 0), mesh=self.limb_b, material=materials.id(BLUE)),
+        ]
+        self.limb_materials = np.array([node.material for node in self.limbs])
+
+        # Far away the parts give way to one box from feet to head, then to nothing
+        self.proxy = Mesh(0.6, 1.5, 0.4, BLUE)
+        self.proxy_node = SceneNode(self.root, pos=(0, -0.45, 0))
+        self.radius = 0.83  # Of the proxy box's bounding sphere
+        self.lods = LodLevels(ACTOR_LOD_PIXELS)
+        self.level = None         # Detail level drawn last frame
+        self.crowd_levels = None  # Same, per crowd copy
+
+    def screen_radius(self, z):
+        """Projected radius in pixels of actors whose proxy centres sit at depth z"""
+        depth = np.asarray(z) + VIEW_DIST
+        # Nothing behind the camera is drawn anyway; keep it at full detail
+        return np.where(depth > 0.1, FOV * self.radius / np.maximum(depth, 0.1), np.inf)
+
+    def get_render_data(self, queue, time_val, pos=None, yaw=None):
+        # pos/yaw override the simulated pose with an interpolated one
+        self.root.set_position(*(pos or (self.pos.x, self.pos.y, self.pos.z)))
+        self.root.set_rotation(0, self.yaw if yaw is None else yaw, 0)
+        self.level = self.lods.select(self.screen_radius(self.proxy_node.world[3, 2]), self.level)
+        if self.level > 0:
+            if self.level == 1:
+                submit_node(queue, self.proxy_node, self.proxy)
+            return
 
         # Body & Head
-        add(self.body, 0, -0.5, 0, 0)
-        hx, hy, hz = add(self.head, 0, 0.1, 0, 0)
+        submit_node(queue, self.body_node)
+        submit_node(queue, self.head_node)
         
         # Face Sprite
-        render_list.append({'type':'sprite', 'z':hz, 'pos':(hx,hy,hz+0.2), 'img':self.face, 'size':0.15})
+        hx, hy, hz = self.head_node.world_position
+        queue.add_sprite((hx, hy, hz+0.2), 0.15, self.face, z=hz)
 
-        # Limbs (Simple Walk Cycle)
+        # Limbs (Simple Walk Cycle), two instances per limb mesh
         w = math.sin(time_val*10)
-        add(self.limb, -0.3, -0.5, 0, w, RED)
-        add(self.limb, 0.3, -0.5, 0, -w, RED)
-        add(self.limb_b, -0.2, -1.0, 0, -w, BLUE)
-        add(self.limb_b, 0.2, -1.0, 0, w, BLUE)
-        return render_list
+        for node, swing in zip(self.limbs, (w, -w, -w, w)):
+            node.set_rotation(swing, 0, 0)
+        limbs = np.stack([node.world for node in self.limbs])
+        self.limb.submit_instances(queue, limbs[:2], materials=self.limb_materials[:2])
+        self.limb_b.submit_instances(queue, limbs[2:], materials=self.limb_materials[2:])
+
+    def get_crowd_render_data(self, queue, poses, time_vals):
+        """Draw len(poses) copies of this actor with one submission per mesh.
+
+        poses is (k, 4) of x, y, z, yaw in the parent's space and time_vals
+        (scalar or k values) drives each copy's walk cycle.
+        """
+        poses = np.asarray(poses, dtype=float)
+        actors = transform_matrices(poses[:, 0], poses[:, 1], poses[:, 2], 0, poses[:, 3], 0)
+        if self.root.parent is not None:
+            actors = actors @ self.root.parent.world
+        proxies = self.proxy_node.local @ actors
+        current = self.crowd_levels if self.crowd_levels is not None and len(self.crowd_levels) == len(poses) else None
+        self.crowd_levels = levels = self.lods.select_many(self.screen_radius(proxies[:, 3, 2]), current)
+        if (levels == 1).any():
+            self.proxy.submit_instances(queue, proxies[levels == 1])
+        full = np.flatnonzero(levels == 0)
+        if not len(full):
+            return
+        actors = actors[full]
+        k = len(full)
+        body = self.body_node.local @ actors
+        head = self.head_node.local @ actors
+        self.body.submit_instances(queue, body)
+        self.head.submit_instances(queue, head)
+        faces = head[:, 3, :3] + (0, 0, 0.2)
+        queue.add_sprites(faces, 0.15, self.face, z=head[:, 3, 2])
+
+        w = np.broadcast_to(np.sin(np.asarray(time_vals, dtype=float) * 10), (len(poses),))[full]
+        limbs = [transform_matrices(*node.pos, swing, 0, 0) @ actors
+                 for node, swing in zip(self.limbs, (w, -w, -w, w))]
+        self.limb.submit_instances(queue, np.concatenate(limbs[:2]),
+                                   materials=np.repeat(self.limb_materials[:2], k))
+        self.limb_b.submit_instances(queue, np.concatenate(limbs[2:]),
+                                     materials=np.repeat(self.limb_materials[2:], k))
+
+# --- LEVEL DATA ---
+def castle_layout():
+    """The castle as (part name, mesh, position); export_level() writes it out"""
+    # 1. Main Tower
+    parts = [("castle/main_tower", Mesh(4, 3, 4, WALL_WHITE), (0, 0, 0)),
+             ("castle/main_roof", PyramidMesh(4.5, 2, 4.5, RED_ROOF), (0, 2.5, 0))]
+
+    # 2. Side Towers: four instances of one tower and one roof
+    tower, roof = Mesh(1.5, 4, 1.5, WALL_WHITE), PyramidMesh(1.8, 1.5, 1.8, RED_ROOF)
+    offsets = [(-3, -2), (3, -2), (-3, 2), (3, 2)]
+    for i, (ox, oz) in enumerate(offsets):
+        parts.append(("castle/tower%d" % i, tower, (ox, -0.5, oz)))
+        parts.append(("castle/tower%d_roof" % i, roof, (ox, 2.0, oz)))
+
+    # 3. Bridge
+    parts.append(("castle/bridge", Mesh(2, 0.2, 6, BROWN), (0, -1.5, 5)))
+
+    # 4. Water/Moat
+    parts.append(("castle/moat", Mesh(15, 0.1, 10, WATER_BLUE), (0, -2.0, 5)))
+    return parts
+
+def export_level(path=LEVEL_PATH):
+    """Write the castle layout and Mario's meshes to a mesh file (`--export-level [PATH]`)"""
+    head, actor = MarioHead(), MarioActor()
+    placed = [(name, mesh, transform_matrix(*pos, 0, 0, 0)) for name, mesh, pos in castle_layout()]
+    head_parts = ("face", "hat_dome", "hat_brim", "nose", "mustache")
+    placed += [("head/" + name, node.mesh, node.local)
+               for name, node in zip(head_parts, [n for n in head.root.children if n.mesh is not None])]
+    placed += [("actor/body", actor.body, actor.body_node.local), ("actor/head", actor.head, actor.head_node.local)]
+    placed += [("actor/limb%d" % i, node.mesh, node.local) for i, node in enumerate(actor.limbs)]
+    placed += [("actor/proxy", actor.proxy, actor.proxy_node.local)]
+
+    # Parts placing the same mesh share its tables in the file
+    meshes, index, parts = [], {}, []
+    for name, mesh, matrix in placed:
+        if id(mesh) not in index:
+            index[id(mesh)] = len(meshes)
+            meshes.append((mesh.vertices, mesh.face_verts, mesh.face_counts,
+                           [materials.items[i] for i in mesh.face_materials], mesh.double_sided))
+        parts.append((name, index[id(mesh)], matrix))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    write_mesh_file(path, meshes, parts)
+    return path
+
+def load_level(path=LEVEL_PATH):
+    """Map the level file, exporting the built-in layout first if there is none"""
+    if not os.path.exists(path):
+        export_level(path)
+    return MeshFile(path)
 
 # --- RENDERER ---
-def render_scene(screen, render_list):
-    visible = [p for p in render_list if p['z'] + VIEW_DIST > 0.5]
-    visible.sort(key=lambda p: p['z'], reverse=True)
-    
-    for item in visible:
-        if item['type'] == 'poly':
-            p2d = []
-            for p3d in item['points_3d']:
-                proj = project(p3d[0], p3d[1], p3d[2], WIDTH, HEIGHT)
-                if proj: p2d.append((proj[0], proj[1]))
-            if len(p2d) > 2:
-                pygame.draw.polygon(screen, item['color'], p2d)
-                pygame.draw.polygon(screen, (0,0,0,50), p2d, 1)
-        elif item['type'] == 'sprite':
-            proj = project(item['pos'][0], item['pos'][1], item['pos'][2], WIDTH, HEIGHT)
-            if proj:
-                size = int(item['size'] * SCALE * proj[2])
-                if size > 0:
-                    img = pygame.transform.scale(item['img'], (size, size))
-                    screen.blit(img, (proj[0]-size//2, proj[1]-size//2))
+class ScaledSpriteCache:
+    """LRU of scaled sprite surfaces, bounded by the total pixels it holds.
+
+    Sprites are often magnified far past the screen size, so only the source
+    pixels that land inside the clip rect are scaled. Entries are keyed by
+    source sprite, quantized size and that source region.
+    """
+    def __init__(self, max_pixels=SPRITE_CACHE_PIXELS, step=SPRITE_SIZE_STEP):
+        self.max_pixels = max_pixels
+        self.step = step
+        self.entries = OrderedDict()
+        self.pixels = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def quantize(self, size):
+        return max(self.step, (size + self.step // 2) // self.step * self.step)
+
+    def blit(self, screen, img, size, cx, cy):
+        """Draw img as a size x size square centred on (cx, cy)"""
+        size = self.quantize(size)
+        x, y = cx - size // 2, cy - size // 2
+        vis = screen.get_clip().clip((x, y, size, size))
+        if not vis:
+            return vis
+        sw, sh = img.get_size()
+        kx, ky = size / sw, size / sh
+        c0 = max(0, int((vis.left - x) / kx))
+        c1 = min(sw, -int(-(vis.right - x) // kx))
+        r0 = max(0, int((vis.top - y) / ky))
+        r1 = min(sh, -int(-(vis.bottom - y) // ky))
+        dx0, dy0 = round(c0 * kx), round(r0 * ky)
+        dw, dh = round(c1 * kx) - dx0, round(r1 * ky) - dy0
+        if dw <= 0 or dh <= 0:
+            return pygame.Rect(vis.x, vis.y, 0, 0)
+
+        key = (img, size, c0, r0, c1, r1)
+        scaled = self.entries.get(key)
+        if scaled is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            src = img if (c0, r0, c1, r1) == (0, 0, sw, sh) else img.subsurface((c0, r0, c1 - c0, r1 - r0))
+            scaled = pygame.transform.scale(src, (dw, dh))
+            self.store(key, scaled, dw * dh)
+        return screen.blit(scaled, (x + dx0, y + dy0))
+
+    def store(self, key, scaled, cost):
+        if cost > self.max_pixels:
+            return
+        while self.pixels + cost > self.max_pixels:
+            _, old = self.entries.popitem(last=False)
+            self.pixels -= old.get_width() * old.get_height()
+            self.evictions += 1
+        self.entries[key] = scaled
+        self.pixels += cost
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+            'entries': len(self.entries), 'pixels': self.pixels,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+sprite_cache = ScaledSpriteCache()
+LOD_BIAS = lod_quality.bias  # From MARIO_LOD_BIAS; quality levels scale it
+
+def apply_quality(settings):
+    """Switch the shared render state to a QUALITY_LEVELS entry"""
+    sprite_cache.step = settings["sprite_step"]
+    lod_quality.bias = LOD_BIAS * settings["lod_bias"]
+
+render_targets = {}  # Size -> surface for reduced-resolution frames
+
+def render_target(screen, scale):
+    """screen at scale 1, else a smaller surface to render into and scale up onto it"""
+    if scale == 1:
+        return screen
+    size = (int(WIDTH * scale), int(HEIGHT * scale))
+    if size not in render_targets:
+        render_targets[size] = pygame.Surface(size, 0, screen)
+    return render_targets[size]
+
+depth_sorter = DepthSorter(descending=True)
+
+def merge_presorted(z, start, count, sorter=depth_sorter):
+    """Back-to-front order of all items when [start, start+count) is already ordered.
+
+    Only the other (dynamic) items are sorted; each is then inserted into the
+    static run by binary search, behind static items at equal depth when it
+    was queued after them, in front otherwise.
+    """
+    static = np.arange(start, start + count)
+    keys = -z[static]
+    if (keys[1:] < keys[:-1]).any():
+        # The static order is exact at its bin centre; two faces crossed in
+        # depth since, and a stable pass over the nearly sorted run fixes it
+        step = np.argsort(keys, kind='stable')
+        static, keys = static[step], keys[step]
+    dynamic = np.concatenate([np.arange(start), np.arange(start + count, len(z))])
+    dynamic = dynamic[sorter.sort(z[dynamic])]
+    dyn_keys = -z[dynamic]
+    pos = np.where(dynamic < start, np.searchsorted(keys, dyn_keys, side='left'),
+                   np.searchsorted(keys, dyn_keys, side='right'))
+    return np.insert(static, pos, dynamic)
+
+def render_scene(screen, queue, sorter=depth_sorter, backend=None):
+    if (backend or RENDER_BACKEND) == "zbuffer":
+        return render_scene_zbuffer(screen, queue)
+    items = queue.items[:queue.n]
+    z = items['z']
+    with prof.scope("sort"):
+        if queue.presorted is None:
+            order = sorter.sort(z)
+        else:
+            order = merge_presorted(z, *queue.presorted, sorter)
+        order = order[z[order] + VIEW_DIST > 0.5]
+
+    with prof.scope("project"):
+        # Project every queued vertex at once; vertices behind the near plane are dropped
+        width, height = screen.get_size()
+        verts = queue.verts[:queue.nv]
+        depth = verts[:, 2] + VIEW_DIST
+        in_front = depth > 0.1
+        factor = FOV * (width / WIDTH) / np.where(in_front, depth, 1.0)
+        # Flat int lists: per-vertex point containers would feed the cyclic GC
+        xs = (verts[:, 0] * factor + width / 2).astype(int).tolist()
+        ys = (-verts[:, 1] * factor + height / 2).astype(int).tolist()
+        in_front = in_front.tolist()
+        factor = factor.tolist()
+    prof.count("items", queue.n)
+    prof.count("verts", queue.nv)
+    palette = materials.items
+    outlines = quality.settings["outlines"]
+
+    drawn = []
+    with prof.scope("raster"):
+        rows = items[order]
+        for kind, start, count, material, size in zip(rows['kind'].tolist(), rows['start'].tolist(),
+                                                      rows['count'].tolist(), rows['material'].tolist(),
+                                                      rows['size'].tolist()):
+            if kind == ITEM_POLY:
+                p2d = [(xs[i], ys[i]) for i in range(start, start + count) if in_front[i]]
+                if len(p2d) > 2:
+                    drawn.append(pygame.draw.polygon(screen, palette[material], p2d))
+                    if outlines:
+                        drawn.append(pygame.draw.polygon(screen, (0,0,0,50), p2d, 1))
+            elif kind == ITEM_SPRITE:
+                if in_front[start]:
+                    size = int(size * SCALE * factor[start])
+                    if size > 0:
+                        drawn.append(sprite_cache.blit(screen, palette[material], size, xs[start], ys[start]))
+    # Bounding box of everything drawn, for dirty-rect presentation
+    return drawn[0].unionall(drawn) if drawn else None
+
+zbuffer = ZBuffer(WIDTH, HEIGHT)
+tile_pool = TilePool(WIDTH, HEIGHT, RENDER_WORKERS) if RENDER_WORKERS > 1 else None
+scaled_zbuffers = {}  # Size -> (ZBuffer, TilePool or None) for reduced-resolution frames
+
+def zbuffer_for(size, tiles):
+    if size not in scaled_zbuffers:
+        scaled_zbuffers[size] = (ZBuffer(*size), TilePool(*size, workers=tiles.workers) if tiles else None)
+    return scaled_zbuffers[size]
+
+def render_scene_zbuffer(screen, queue, zbuf=zbuffer, tiles=tile_pool):
+    """render_scene backend that depth-tests every pixel instead of sorting faces.
+
+    Polygons are fanned into triangles and rasterized into a NumPy depth
+    buffer, so intersecting geometry resolves per pixel. Polygon outlines
+    become a one-pixel band inside each boundary edge. Sprites are blitted
+    back to front afterwards and masked wherever geometry is nearer than
+    their depth. With a TilePool (MARIO_WORKERS > 1) triangles are
+    rasterized tile by tile on its workers.
+    """
+    width, height = screen.get_size()
+    if (zbuf.width, zbuf.height) != (width, height):
+        zbuf, tiles = zbuffer_for((width, height), tiles)
+    items = queue.items[:queue.n]
+    verts = queue.verts[:queue.nv]
+    depth = verts[:, 2] + VIEW_DIST
+    in_front = depth > 0.1
+    factor = FOV * (width / WIDTH) / np.where(in_front, depth, 1.0)
+    xs = verts[:, 0] * factor + width / 2
+    ys = -verts[:, 1] * factor + height / 2
+    prof.count("items", queue.n)
+    prof.count("verts", queue.nv)
+    palette = materials.items
+    drawn = []
+
+    with prof.scope("project"):
+        polys = items[(items['kind'] == ITEM_POLY) & (items['z'] + VIEW_DIST > 0.5)]
+        # Like the painter, vertices behind the near plane are dropped from their polygon
+        counts = polys['count'].astype(np.intp)
+        index = np.repeat(polys['start'].astype(np.intp), counts) + np.arange(counts.sum()) \
+            - np.repeat(np.cumsum(counts) - counts, counts)
+        front = in_front[index]
+        index = index[front]
+        counts = np.add.reduceat(front, np.cumsum(counts) - counts) if len(counts) else counts
+        first = np.cumsum(counts) - counts
+        # Fan triangulation: (first, first+i, first+i+1) for i in 1..count-2
+        fans = np.maximum(counts - 2, 0)
+        poly = np.repeat(np.arange(len(polys)), fans)
+        step = np.arange(len(poly)) - np.repeat(np.cumsum(fans) - fans, fans) + 1
+        a = first[poly]
+        tri = index[np.stack([a, a + step, a + step + 1], axis=1)]
+        # Boundary edges: a->b only on the first fan triangle, c->a only on the last
+        outline = np.stack([step == 1, np.ones(len(step), dtype=bool), step == counts[poly] - 2], axis=1)
+        # Sprite materials never reach a polygon, so they map to a dummy pixel
+        mapped = np.array([0 if isinstance(c, pygame.Surface) else screen.map_rgb(c) for c in palette],
+                          dtype=np.uint32)
+        colors = mapped[polys['material'][poly]]
+
+    with prof.scope("raster"):
+        zbuf.clear()
+        pixels = pygame.surfarray.pixels2d(screen)
+        bounds = zbuf.draw_triangles(pixels, xs[tri], ys[tri], 1.0 / depth[tri], colors,
+                                     outline if quality.settings["outlines"] else None,
+                                     screen.map_rgb((0, 0, 0)), tiles)
+        del pixels
+        if bounds:
+            drawn.append(pygame.Rect(bounds[0], bounds[1], bounds[2] - bounds[0] + 1, bounds[3] - bounds[1] + 1))
+        prof.count("fragments", zbuf.fragments)
+
+        sprites = items[(items['kind'] == ITEM_SPRITE) & (items['z'] + VIEW_DIST > 0.5)]
+        sprites = sprites[np.argsort(-sprites['z'], kind='stable')]
+        for start, material, size, z in zip(sprites['start'].tolist(), sprites['material'].tolist(),
+                                            sprites['size'].tolist(), sprites['z'].tolist()):
+            if not in_front[start]:
+                continue
+            size = int(size * SCALE * factor[start])
+            if size <= 0:
+                continue
+            cx, cy = int(xs[start]), int(ys[start])
+            q = sprite_cache.quantize(size)
+            area = screen.get_clip().clip((cx - q // 2, cy - q // 2, q, q))
+            if not area:
+                continue
+            before = pygame.surfarray.array2d(screen.subsurface(area))
+            drawn.append(sprite_cache.blit(screen, palette[material], size, cx, cy))
+            hidden = zbuf.depth[area.left:area.right, area.top:area.bottom] > 1.0 / (z + VIEW_DIST)
+            if hidden.any():
+                pixels = pygame.surfarray.pixels2d(screen)
+                region = pixels[area.left:area.right, area.top:area.bottom]
+                region[hidden] = before[hidden]
+                del pixels, region
+    return drawn[0].unionall(drawn) if drawn else None
+
+# --- SIMULATION ---
+WATCHED_KEYS = (pygame.K_w, pygame.K_s, pygame.K_a, pygame.K_d, pygame.K_LEFT, pygame.K_RIGHT)  # Held keys step() reads
+
+class World:
+    """Game state advanced in fixed SIM_HZ ticks, independent of the frame rate"""
+    def __init__(self, mario_head, mario_actor):
+        self.mario_head = mario_head
+        self.mario_actor = mario_actor
+        self.state = STATE_MENU
+        self.time_val = 0
+        self.cam_angle_y = 0
+        self.coins = 0
+        self.prev = self.snapshot()
+
+    def snapshot(self):
+        """The continuous values rendering interpolates between ticks"""
+        a = self.mario_actor
+        return (self.time_val, self.cam_angle_y, a.pos.x, a.pos.y, a.pos.z, a.yaw)
+
+    def step(self, keys):
+        self.prev = self.snapshot()
+        if self.state == STATE_GAME:
+            if keys[pygame.K_LEFT]: self.cam_angle_y += 0.05
+            if keys[pygame.K_RIGHT]: self.cam_angle_y -= 0.05
+            # Tank controls for Mario
+            mario_actor = self.mario_actor
+            rad = mario_actor.yaw
+            if keys[pygame.K_w]: 
+                mario_actor.pos.z -= math.cos(rad) * 0.1
+                mario_actor.pos.x -= math.sin(rad) * 0.1
+            if keys[pygame.K_s]: 
+                mario_actor.pos.z += math.cos(rad) * 0.1
+                mario_actor.pos.x += math.sin(rad) * 0.1
+            if keys[pygame.K_a]: mario_actor.yaw -= 0.1
+            if keys[pygame.K_d]: mario_actor.yaw += 0.1
+        self.time_val += 0.05
+        self.mario_head.tick()
+
+    def interpolate(self, alpha):
+        return tuple(lerp(a, b, alpha) for a, b in zip(self.prev, self.snapshot()))
+
+def simulate(ticks):
+    """Step the game with scripted input and no rendering (`--sim N`)"""
+    world = World(MarioHead(), MarioActor())
+    world.state = STATE_GAME
+    walk, turn = HeldKeys({pygame.K_w, pygame.K_LEFT}), HeldKeys({pygame.K_w, pygame.K_a})
+    run_simulation(lambda tick: world.step(turn if (tick // 60) % 3 == 1 else walk), ticks)
 
 # --- MAIN ---
 def main():
+    global RENDER_BACKEND
     pygame.init()
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     pygame.display.set_caption("SM64: PEACH CASTLE LOADING...")
     clock = pygame.time.Clock()
-    font = pygame.font.SysFont("Arial", 30, bold=True)
+    font = text_cache.font("Arial", 30, bold=True)
+    debug_font = text_cache.font("monospace", 14)
 
+    camera = SceneNode()  # Turning the camera swings the whole scene about the origin
     mario_head = MarioHead()
-    mario_actor = MarioActor()
-    castle = Castle()
-    
-    game_state = STATE_MENU
-    time_val = 0
-    cam_angle_y = 0
+    mario_actor = MarioActor(camera)
+    castle = Castle(camera)
+    queue = RenderQueue()
+    world = World(mario_head, mario_actor)
+    presenter = DirtyRectPresenter()
+    menu_background = pygame.Surface((WIDTH, HEIGHT)).convert()
+    menu_background.fill(SKY_BLUE)
+    presenter.set_background(menu_background)
+    timestep = FixedTimestep(SIM_HZ)
+    frame_time = 1.0 / SIM_HZ  # First frame runs one tick, as before
+    inputs = InputLog.from_env(WATCHED_KEYS)
+    if inputs.replaying and QUALITY_ENV not in os.environ:
+        # Frame times differ from build to build; the level must not
+        quality.pin()
+    apply_quality(quality.settings)
     
     running = True
     while running:
-        mx, my = pygame.mouse.get_pos()
+        prof.begin_frame()
+        quality.begin_frame()
+        frame = inputs.poll()
+        mx, my = frame.mouse_pos
         norm_mx, norm_my = (mx - WIDTH/2)/(WIDTH/2), (my - HEIGHT/2)/(HEIGHT/2)
         
-        for event in pygame.event.get():
+        for event in frame.events:
             if event.type == pygame.QUIT: running = False
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_RETURN or event.key == pygame.K_SPACE:
-                    if game_state == STATE_MENU: game_state = STATE_GAME
+                    if world.state == STATE_MENU: world.state = STATE_GAME
+                if event.key == pygame.K_F3: prof.toggle_overlay()
+                if event.key == pygame.K_F4:
+                    RENDER_BACKEND = "painter" if RENDER_BACKEND == "zbuffer" else "zbuffer"
+                    presenter.invalidate()
 
-        keys = pygame.key.get_pressed()
-        if game_state == STATE_GAME:
-            if keys[pygame.K_LEFT]: cam_angle_y += 0.05
-            if keys[pygame.K_RIGHT]: cam_angle_y -= 0.05
-            # Tank controls for Mario
-            rad = mario_actor.yaw
-            if keys[pygame.K_w]: 
-                mario_actor.pos.z -= math.cos(rad) * 0.1
-                mario_actor.pos.x -= math.sin(rad) * 0.1
-            if keys[pygame.K_s]: 
-                mario_actor.pos.z += math.cos(rad) * 0.1
-                mario_actor.pos.x += math.sin(rad) * 0.1
-            if keys[pygame.K_a]: mario_actor.yaw -= 0.1
-            if keys[pygame.K_d]: mario_actor.yaw += 0.1
+        with prof.scope("input"):
+            keys = frame.keys
+            steps = timestep.advance(frame_time)
+            for _ in range(steps):
+                world.step(keys)
+        time_val, cam_angle_y, ax, ay, az, ayaw = world.interpolate(timestep.alpha)
 
-        time_val += 0.05
-        screen.fill(BLACK)
+        cull_stats.next_frame()
+        queue.clear()
         
-        if game_state == STATE_MENU:
-            screen.fill(SKY_BLUE)
-            render_scene(screen, mario_head.get_render_data(norm_mx, norm_my, time_val))
+        if world.state == STATE_MENU:
+            # Only the head changes: repaint and present just its old and new bounds
+            presenter.begin(screen)
+            with prof.scope("head"):
+                mario_head.get_render_data(queue, norm_mx, norm_my, time_val)
+            presenter.mark(render_scene(screen, queue))
             
-            txt = font.render("PRESS START", True, ORANGE)
-            screen.blit(txt, (WIDTH//2 - txt.get_width()//2, HEIGHT - 80))
+            with prof.scope("hud"):
+                txt = text_cache.render(font, "PRESS START", ORANGE)
+                screen.blit(txt, (WIDTH//2 - txt.get_width()//2, HEIGHT - 80))
             
-        elif game_state == STATE_GAME:
-            screen.fill(SKY_CYAN)
+        elif world.state == STATE_GAME:
+            presenter.invalidate()
+            # Under load the 3D view renders at reduced resolution and is scaled up
+            target = render_target(screen, quality.settings["render_scale"])
+            width, height = target.get_size()
+            target.fill(SKY_CYAN)
             
             # Draw Green Floor Ground (Infinite Plane illusion)
-            pygame.draw.rect(screen, GREEN, (0, HEIGHT/2, WIDTH, HEIGHT/2))
+            pygame.draw.rect(target, GREEN, (0, height/2, width, height/2))
             
-            # Render List: Castle -> Mario
-            game_objs = []
-            game_objs.extend(castle.get_render_data(cam_angle_y))
-            game_objs.extend(mario_actor.get_render_data(time_val, cam_angle_y))
+            # Render Queue: Castle -> Mario
+            camera.set_rotation(0, cam_angle_y, 0)
+            with prof.scope("castle"):
+                castle.get_render_data(queue)
+            with prof.scope("actor"):
+                mario_actor.get_render_data(queue, time_val, (ax, ay, az), ayaw)
             
-            render_scene(screen, game_objs)
+            render_scene(target, queue)
+            if target is not screen:
+                with prof.scope("upscale"):
+                    pygame.transform.scale(target, (WIDTH, HEIGHT), screen)
             
             # HUD
-            hud = font.render("- x 0", True, YELLOW)
-            screen.blit(hud, (WIDTH - 80, 20))
+            with prof.scope("hud"):
+                text_cache.blit_glyphs(screen, font, "- x %d" % world.coins, YELLOW, (WIDTH - 80, 20))
 
-        pygame.display.flip()
-        clock.tick(FPS)
+        prof.count("culled", cull_stats.culled)
+        prof.count("ticks", steps)
+        prof.count("quality", quality.level)
+        presenter.mark(prof.draw_overlay(screen, debug_font))
+        with prof.scope("present"):
+            if world.state == STATE_MENU:
+                presenter.present()
+            else:
+                pygame.display.flip()
+        if quality.end_frame():
+            apply_quality(quality.settings)
+            presenter.invalidate()
+            prof.log("quality", quality.changes[-1])
+        prof.end_frame()
+        frame_time = inputs.tick(clock, FPS) / 1000
+    inputs.close()
+    prof.export()
     pygame.quit()
 
 if __name__ == "__main__":
-    main()
+    ticks = sim_ticks_from_argv()
+    if "--export-level" in sys.argv:
+        i = sys.argv.index("--export-level")
+        print("wrote", export_level(*sys.argv[i + 1:i + 2]))
+    elif ticks is not None:
+        simulate(ticks)
+    else:
+        main()
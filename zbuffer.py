@@ -0,0 +1,185 @@
+"""Software z-buffer rasterizer on NumPy arrays.
+
+Triangles are rasterized a batch at a time: every covered row of every
+triangle becomes a span whose ends come straight from the three edge
+functions, the spans are expanded into fragments, and the fragments that
+win the depth test are scattered into a pygame.surfarray pixel view. Only
+pixels inside a triangle are ever generated, so the cost follows covered
+area rather than bounding boxes.
+
+Depth is stored as 1/depth, which interpolates linearly in screen space;
+bigger is nearer and 0 means empty. Of fragments at equal depth, the
+earlier triangle wins.
+
+Given a tiles.TilePool, triangles are binned into screen tiles and every
+tile is rasterized on its own worker, clipped to the tile. Every fragment
+is computed from its own pixel, so the tiled frame is the same as the
+untiled one.
+"""
+import numpy as np
+
+BATCH_FRAGMENTS = 1 << 20  # Fragments expanded per vectorized batch
+
+class ZBuffer:
+    """Depth buffer plus a span rasterizer writing mapped pixels"""
+    def __init__(self, width, height, batch_fragments=BATCH_FRAGMENTS):
+        self.width, self.height = width, height
+        self.batch_fragments = batch_fragments
+        self.depth = np.zeros((width, height))  # Indexed [x, y] like surfarray
+        self.first = np.full(width * height, np.iinfo(np.intp).max)  # Scratch for tie breaks
+        self.triangles = 0
+        self.fragments = 0
+
+    def clear(self):
+        self.depth.fill(0.0)
+        self.triangles = self.fragments = 0
+
+    def draw_triangles(self, pixels, x, y, inv_depth, colors, outline=None, outline_color=0, tiles=None):
+        """Rasterize triangles into pixels (surfarray.pixels2d) where they pass the depth test.
+
+        x, y and inv_depth are (k, 3) per-vertex screen positions and 1/depth;
+        colors holds k mapped pixel values. outline is an optional (k, 3) bool
+        array: edge i runs from vertex i to vertex i+1, and pixels within one
+        pixel of a flagged edge take outline_color. tiles is an optional
+        TilePool to rasterize on. Returns the bounding (x0, y0, x1, y1) of the
+        rows and spans covered, or None.
+        """
+        x, y, inv_depth = (np.asarray(a, dtype=float) for a in (x, y, inv_depth))
+        colors = np.asarray(colors)
+        if outline is None:
+            outline = np.zeros(x.shape, dtype=bool)
+
+        if tiles is None:
+            results = [self._rasterize(pixels, x, y, inv_depth, colors, outline, outline_color,
+                                       (0, 0, self.width - 1, self.height - 1))]
+        else:
+            bins = tiles.bin(np.floor(x.min(axis=1)), np.floor(y.min(axis=1)),
+                             np.ceil(x.max(axis=1)), np.ceil(y.max(axis=1)))
+            results = tiles.run(self._rasterize, [
+                (pixels, x[tri], y[tri], inv_depth[tri], colors[tri], outline[tri], outline_color, tile)
+                for tile, tri in zip(tiles.tiles, bins) if len(tri)])
+        # Per-tile counts are summed here so workers never share a counter
+        bounds = [r[0] for r in results if r[0] is not None]
+        self.fragments += sum(r[1] for r in results)
+        self.triangles += len(x)
+        if not bounds:
+            return None
+        x0, y0, x1, y1 = zip(*bounds)
+        return min(x0), min(y0), max(x1), max(y1)
+
+    def _rasterize(self, pixels, x, y, inv_depth, colors, outline, outline_color, clip):
+        """draw_triangles within clip (x0, y0, x1, y1); returns (bounds, fragments)"""
+        clip_x0, clip_y0, clip_x1, clip_y1 = clip
+        # Edge k runs from vertex k to vertex k+1; its function is
+        # e = ex * px + ey * py + ec, positive on the inside once the
+        # triangle is wound the right way
+        nx, ny = np.roll(x, -1, axis=1), np.roll(y, -1, axis=1)
+        ex, ey = y - ny, nx - x
+        ec = x * ny - y * nx
+        area = ec.sum(axis=1)
+        flip = area < 0
+        ex[flip], ey[flip], ec[flip] = -ex[flip], -ey[flip], -ec[flip]
+        area = np.abs(area)
+        lengths = np.hypot(ex, ey)
+
+        y0 = np.maximum(np.ceil(y.min(axis=1) - 0.5), clip_y0)
+        y1 = np.minimum(np.floor(y.max(axis=1) - 0.5), clip_y1)
+        keep = np.flatnonzero((area > 1e-9) & (y1 >= y0) & (x.max(axis=1) >= clip_x0)
+                              & (x.min(axis=1) <= clip_x1 + 1))
+        if not len(keep):
+            return None, 0
+        # Depth is a plane in screen space: d = dx * px + dy * py + dc.
+        # The weight of vertex i is the edge opposite it, edge i+1, over the area
+        w = np.roll(inv_depth, -2, axis=1)[keep] / area[keep, None]
+        dx, dy, dc = ((e[keep] * w).sum(axis=1) for e in (ex, ey, ec))
+
+        # One row per covered scanline of each triangle
+        heights = (y1 - y0 + 1).astype(np.intp)[keep]
+        tri = np.repeat(np.arange(len(keep)), heights)
+        row_y = np.repeat(y0[keep], heights) + np.arange(len(tri)) - np.repeat(np.cumsum(heights) - heights, heights)
+        t = keep[tri]
+        py = row_y + 0.5
+        lo = np.full(len(t), -np.inf)
+        hi = np.full(len(t), np.inf)
+        row_edges = []  # Per edge: e = a * px + c along each row
+        for k in range(3):
+            a = ex[:, k][t]
+            c = ey[:, k][t] * py + ec[:, k][t]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                bound = -c / a
+            lo = np.where(a > 0, np.maximum(lo, bound), lo)
+            hi = np.where(a < 0, np.minimum(hi, bound), hi)
+            hi = np.where((a == 0) & (c < 0), -np.inf, hi)
+            row_edges.append((a, c))
+        x_start = np.maximum(np.ceil(lo - 0.5), clip_x0)
+        x_end = np.minimum(np.floor(hi - 0.5), clip_x1)
+        spans = np.maximum(x_end - x_start + 1, 0).astype(np.intp)
+        rows = np.flatnonzero(spans)
+        if not len(rows):
+            return None, 0
+        bounds = (int(x_start[rows].min()), int(row_y[rows].min()),
+                  int(x_end[rows].max()), int(row_y[rows].max()))
+
+        # Depth and edge distances are evaluated at each fragment's own pixel
+        # x, never stepped from the span start, so a pixel comes out the same
+        # whichever tile clipped its span
+        x_start, row_y, t, spans = x_start[rows], row_y[rows], t[rows], spans[rows]
+        i = tri[rows]
+        row_flat = (x_start * self.height + row_y).astype(np.intp)
+        row_depth = dy[i] * (row_y + 0.5) + dc[i]  # d = dx * (px + 0.5) + row_depth
+
+        # Distance to an edge is linear along a row and never negative inside
+        # the span, so the pixels within one pixel of it are those left of
+        # one x (outline_end) or from one x on (outline_start)
+        outline_end = np.full(len(rows), -np.inf)
+        outline_start = np.full(len(rows), np.inf)
+        for k in np.flatnonzero(outline.any(axis=0)):
+            a, c = (e[rows] for e in row_edges[k])
+            flagged = outline[:, k][t]
+            scale = np.maximum(lengths[:, k][t], 1e-9)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cross = (scale - c) / a - 0.5  # Pixel x where the distance reaches 1
+            outline_end = np.where(flagged & (a > 0), np.maximum(outline_end, np.ceil(cross)), outline_end)
+            outline_end = np.where(flagged & (a == 0) & (c < scale), np.inf, outline_end)
+            outline_start = np.where(flagged & (a < 0), np.minimum(outline_start, np.floor(cross) + 1),
+                                     outline_start)
+
+        # Expand spans into fragments a batch at a time, in triangle order
+        ends = np.cumsum(spans)
+        first = fragments = 0
+        while first < len(rows):
+            last = max(first + 1, int(np.searchsorted(ends, ends[first] - spans[first] + self.batch_fragments,
+                                                      side='right')))
+            batch = slice(first, last)
+            fragments += self._draw_spans(pixels, spans[batch], x_start[batch], row_flat[batch], row_depth[batch],
+                                          dx[i[batch]], colors[t[batch]], outline_end[batch],
+                                          outline_start[batch], outline_color)
+            first = last
+        return bounds, fragments
+
+    def _draw_spans(self, pixels, n, row_x, row_flat, row_depth, row_step, row_color,
+                    outline_end, outline_start, outline_color):
+        starts = np.cumsum(n) - n
+        along = np.arange(int(n.sum())) - np.repeat(starts, n)
+        flat = np.repeat(row_flat, n) + along * self.height
+        px = np.repeat(row_x, n) + along
+        d = np.repeat(row_step, n) * (px + 0.5) + np.repeat(row_depth, n)
+
+        # Depth test: reduce the batch into the buffer with a scattered max,
+        # keep the fragments that reached it, then the first of any exact ties
+        depth = self.depth.reshape(-1)
+        passed = d > depth[flat]  # Strict, so earlier batches win ties
+        np.maximum.at(depth, flat[passed], d[passed])
+        win = np.flatnonzero(passed & (d == depth[flat]))
+        np.minimum.at(self.first, flat[win], win)
+        win = win[self.first[flat[win]] == win]
+        self.first[flat[win]] = np.iinfo(np.intp).max
+        if not len(win):
+            return 0
+
+        row = np.searchsorted(starts, win, side='right') - 1
+        px = px[win]
+        edge = (px < outline_end[row]) | (px >= outline_start[row])
+        flat = flat[win]
+        pixels[flat // self.height, flat % self.height] = np.where(edge, outline_color, row_color[row])
+        return len(win)